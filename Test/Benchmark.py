@@ -0,0 +1,305 @@
+"""
+Loopback benchmark of the Server, the Client and the ReverbManager
+
+- For each cell of the matrix (clients x objects), a server process spawns the ReverbObject, ticks them and starts
+  the client processes, each one is a real Client with its own ReverbManager
+- The clients join, then send compute_server calls at a fixed rate and consume the server_sync
+- Once every client has joined, everything is measured for the same duration
+- Results: RPC throughput and round trip, server_sync latency (server time to applied, the monotonic clock is shared by
+  the processes of a machine), server CPU per tick, bytes per client per second
+
+Run from the repository root:
+    PYTHONPATH=. python Test/Benchmark.py --clients 1,4 --objects 100,1000 --duration 5 --output bench.json
+    PYTHONPATH=. python Test/Benchmark.py ... --compare bench.json  # Exit code 1 if a metric regressed
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import queue
+import random
+import sys
+import time
+
+from reverb import *
+
+set_log_level(WARNING)  # Before the classes are registered, into every process
+CONTEXT = multiprocessing.get_context("spawn")  # The processes start with an empty ReverbManager
+
+
+class BenchProp(ReverbObject):
+    def __init__(self, pos=[0, 0], dir="N", *reverb_args, add_on_init=True):
+        super().__init__(pos, dir, *reverb_args, add_on_init=add_on_init)
+
+    @server_method
+    def ping(self, sent):
+        return sent
+
+    @server_method
+    def push(self, dx):
+        self.pos = [self.pos[0] + dx, self.pos[1]]
+
+
+class BenchMover(BenchProp):
+    def on_tick(self, dt):
+        self.pos = [self.pos[0] + dt, self.pos[1]]
+
+
+def percentiles(values):
+    """
+    :return: Dict of the stats of durations in seconds, in milliseconds
+    """
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "avg_ms": sum(values) / len(values) * 1000,
+        "p50_ms": values[len(values) // 2] * 1000,
+        "p99_ms": values[min(len(values) - 1, int(len(values) * 0.99))] * 1000,
+        "max_ms": values[-1] * 1000,
+    }
+
+
+def run_client(port, config, ready, go, results):
+    """
+    - A simulated player, into its own process
+    """
+    ReverbManager.REVERB_SIDE = ReverbSide.CLIENT
+    sync_latencies = []
+    syncs = [0]
+
+    @client_event_registry.on_event("server_sync")
+    def measure_sync(clt, seq, base_seq, ros, removed, server_time=None, *args):  # After on_server_sync
+        if server_time is not None:
+            syncs[0] += 1
+            sync_latencies.append(time.monotonic() - server_time)
+
+    client = Client(port=port, udp=config["udp"])
+    ReverbManager.REVERB_CONNECTION = client
+    client.connect()
+    deadline = time.monotonic() + config["join_timeout"]
+    while len(ReverbManager.REVERB_OBJECTS) < config["objects"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    joined = len(ReverbManager.REVERB_OBJECTS)
+    ready.put(joined)
+    go.wait()
+
+    Metrics.reset()
+    sync_latencies.clear()
+    syncs[0] = 0
+    rpc_latencies = []
+    failed = [0]
+
+    def on_result(future, sent):
+        if future.exception() is not None:
+            failed[0] += 1
+        else:
+            rpc_latencies.append(time.monotonic() - sent)
+
+    ros = list(ReverbManager.objects_snapshot().values())
+    sent = 0
+    period = 1 / config["rpc_rate"] if config["rpc_rate"] else None
+    start = time.monotonic()
+    end = start + config["duration"]
+    next_call = start
+    while time.monotonic() < end:
+        if period is None or not ros:
+            time.sleep(end - time.monotonic())
+            break
+        ro = random.choice(ros)
+        if sent % 2:
+            ro.compute_server(ro.push, 1)
+        else:
+            future = ro.compute_server(ro.ping, 0, result=True)
+            future.add_done_callback(lambda future, now=time.monotonic(): on_result(future, now))
+        sent += 1
+        next_call += period
+        delay = next_call - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    elapsed = time.monotonic() - start
+    time.sleep(0.5)  # The last results
+
+    counters = Metrics.snapshot()["counters"]
+    results.put({
+        "joined": joined,
+        "rpc_sent": sent,
+        "rpc_answered": len(rpc_latencies),
+        "rpc_failed": failed[0],
+        "rpc_latencies": rpc_latencies,
+        "syncs": syncs[0],
+        "sync_latencies": sync_latencies,
+        "bytes_in": sum(counters.get("bytes_in", {}).values()),
+        "bytes_out": sum(counters.get("bytes_out", {}).values()),
+        "elapsed": elapsed,
+    })
+    client.disconnect()
+
+
+def run_server(port, config, output):
+    """
+    - Run one cell of the matrix, into its own process
+    """
+    server = Server(port=port, udp=config["udp"], compression=config["compression"])
+    ReverbManager.REVERB_CONNECTION = server
+    server.start_server()
+    movers = int(config["objects"] * config["moving"])
+    ReverbManager.spawn(*(BenchMover([i, 0], "N", i, add_on_init=False) for i in range(movers)),
+                        *(BenchProp([i, 0], "N", i, add_on_init=False) for i in range(movers, config["objects"])))
+    ReverbManager.start_ticking(config["sim_rate"], config["sync_rate"])
+
+    ready, go, results = CONTEXT.Queue(), CONTEXT.Event(), CONTEXT.Queue()
+    processes = [CONTEXT.Process(target=run_client, args=(port, config, ready, go, results), daemon=True)
+                 for _ in range(config["clients"])]
+    for process in processes:
+        process.start()
+    joined = [ready.get(timeout=config["join_timeout"] + 30) for _ in processes]
+
+    ticker = ReverbManager.TICKER
+    ticker.sim_stats = TickStats(ticker.sim_dt or 0, window=100000)
+    ticker.sync_stats = TickStats(ticker.sync_dt or 0, window=100000)
+    Metrics.reset()
+    cpu = time.process_time()
+    start = time.monotonic()
+    go.set()
+    clients = [results.get(timeout=config["duration"] + 60) for _ in processes]
+    elapsed = time.monotonic() - start
+    cpu = time.process_time() - cpu
+    ReverbManager.stop_ticking()
+    for process in processes:
+        process.join(5)
+    server.stop_server()
+
+    report = ticker.report()
+    counters = Metrics.snapshot()["counters"]
+    duration = sum(client["elapsed"] for client in clients) / len(clients)
+    rpc_latencies = [latency for client in clients for latency in client["rpc_latencies"]]
+    sync_latencies = [latency for client in clients for latency in client["sync_latencies"]]
+    sent = sum(client["rpc_sent"] for client in clients)
+    output.put({
+        "clients": config["clients"],
+        "objects": config["objects"],
+        "joined": min(joined),
+        "rpc": {
+            "sent": sent,
+            "answered": sum(client["rpc_answered"] for client in clients),
+            "failed": sum(client["rpc_failed"] for client in clients),
+            "throughput_per_s": sent / duration,
+            **percentiles(rpc_latencies),
+        },
+        "sync": {
+            "per_client_per_s": sum(client["syncs"] for client in clients) / len(clients) / duration,
+            **percentiles(sync_latencies),
+        },
+        "server": {
+            "simulation": report["simulation"],
+            "sync": report["sync"],
+            "cpu_ms_per_tick": cpu * 1000 / max(1, report["simulation"]["ticks"]),
+            "cpu_percent": cpu / elapsed * 100,
+            "packets_in": sum(counters.get("packets_in", {}).values()),
+            "packets_out": sum(counters.get("packets_out", {}).values()),
+        },
+        "bytes_per_client_per_s": {
+            "down": sum(client["bytes_in"] for client in clients) / len(clients) / duration,
+            "up": sum(client["bytes_out"] for client in clients) / len(clients) / duration,
+        },
+    })
+
+
+COMPARED = [  # path into a result, True if higher is better
+    (("rpc", "throughput_per_s"), True),
+    (("rpc", "p99_ms"), False),
+    (("sync", "p99_ms"), False),
+    (("server", "cpu_ms_per_tick"), False),
+    (("bytes_per_client_per_s", "down"), False),
+]
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: The lines describing the metrics worse than the baseline by more than tolerance (a ratio)
+    """
+    cells = {(cell["clients"], cell["objects"]): cell for cell in baseline["results"]}
+    regressions = []
+    for cell in results:
+        old = cells.get((cell["clients"], cell["objects"]))
+        if old is None:
+            continue
+        for path, higher_is_better in COMPARED:
+            new_value, old_value = cell, old
+            for key in path:
+                new_value, old_value = new_value.get(key), old_value.get(key)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{cell['clients']} clients x {cell['objects']} objects: {'.'.join(path)} "
+                                   f"{old_value:.3f} -> {new_value:.3f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loopback benchmark of PyReverb")
+    parser.add_argument("--clients", default="1,4", help="Comma separated client counts")
+    parser.add_argument("--objects", default="100,1000", help="Comma separated ReverbObject counts")
+    parser.add_argument("--duration", type=float, default=5.0, help="Measured seconds per cell")
+    parser.add_argument("--rpc-rate", type=float, default=20.0, help="compute_server calls per second per client")
+    parser.add_argument("--moving", type=float, default=0.1, help="Part of the ReverbObject moved at each tick")
+    parser.add_argument("--sim-rate", type=int, default=60)
+    parser.add_argument("--sync-rate", type=int, default=20)
+    parser.add_argument("--udp", action="store_true", help="Send the server_sync on UDP")
+    parser.add_argument("--compression", default=None, help="Like 'zlib'")
+    parser.add_argument("--port", type=int, default=47200, help="First port, one per cell")
+    parser.add_argument("--output", help="Write the results as JSON into this file")
+    parser.add_argument("--compare", help="JSON results of a previous run, exit code 1 if a metric regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Accepted regression ratio for --compare")
+    args = parser.parse_args()
+
+    results = []
+    port = args.port
+    for clients in map(int, args.clients.split(",")):
+        for objects in map(int, args.objects.split(",")):
+            config = {"clients": clients, "objects": objects, "duration": args.duration, "rpc_rate": args.rpc_rate,
+                      "moving": args.moving, "sim_rate": args.sim_rate, "sync_rate": args.sync_rate, "udp": args.udp,
+                      "compression": args.compression, "join_timeout": 30.0}
+            output = CONTEXT.Queue()
+            process = CONTEXT.Process(target=run_server, args=(port, config, output))
+            process.start()
+            port += 1
+            result = None
+            while result is None and (process.is_alive() or not output.empty()):
+                try:
+                    result = output.get(timeout=1)
+                except queue.Empty:
+                    pass
+            process.join(10)
+            if result is None:
+                sys.exit(f"The cell {clients} clients x {objects} objects failed (exit code {process.exitcode})")
+            results.append(result)
+            print(f"{clients:>4} clients x {objects:>6} objects | "
+                  f"rpc {result['rpc']['throughput_per_s']:8.1f}/s p50 {result['rpc'].get('p50_ms', 0):7.2f} ms "
+                  f"p99 {result['rpc'].get('p99_ms', 0):7.2f} ms | "
+                  f"sync p50 {result['sync'].get('p50_ms', 0):7.2f} ms p99 {result['sync'].get('p99_ms', 0):7.2f} ms | "
+                  f"cpu {result['server']['cpu_ms_per_tick']:6.2f} ms/tick | "
+                  f"down {result['bytes_per_client_per_s']['down'] / 1024:8.1f} KiB/s per client", flush=True)
+
+    document = {
+        "meta": {"time": time.time(), "python": sys.version, "platform": platform.platform(),
+                 "cpus": multiprocessing.cpu_count(), "args": vars(args)},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(document, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION:", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
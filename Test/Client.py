@@ -16,6 +16,7 @@ class Player(ReverbObject):
             self.compute_server(self.check_walk, self.dir)
 
     # ON SERVER
+    @server_method
     def check_walk(self, dir):
         print(f"The direction is {dir=}")
         self.dir = dir
@@ -32,6 +33,7 @@ else:
     ReverbManager.REVERB_CONNECTION = serv
     serv.start_server()
     player = Player()
+    ReverbManager.start_ticking(sim_rate=30, sync_rate=10)
     while True:
-        time.sleep(1 / 10)
-        ReverbManager.server_sync()
+        time.sleep(5)
+        print(ReverbManager.TICKER.report())
@@ -0,0 +1,34 @@
+import timeit
+import uuid
+
+from reverb_codec import *
+
+# A server_sync like packet: {uid: [type, [x, y], dir, *reverb_args]}
+ROS = {str(uuid.uuid4()): ["Player", [i * 1.5, -i], "N" if i % 2 else "S", i, "name_" + str(i), i % 3 == 0]
+       for i in range(1000)}
+PACKETS = [
+    ("server_sync", [12, None, ROS, []]),
+    # A frame of compute_server calls: [[uid, method id, request id or None, args]]
+    ("rpc_batch", [[[str(uuid.uuid4()), i % 4, i if i % 2 else None, ["N", i * 0.5]] for i in range(16)]]),
+    # A diff: only the changed fields, [mask, *fields]
+    ("server_sync", [13, 12, {uid: [1 << (i % 3), i * 0.5] if i % 4 else [5, "Player", "S"] for i, uid in
+                              enumerate(ROS)}, [str(uuid.uuid4())]]),
+    ("hello", [None, 2 ** 70, -3, 70000, "é" * 300, {"a": [1, 2.5]}]),
+]
+
+BinaryCodec.intern("Player")
+CODECS_TO_COMPARE = [JsonCodec(), BinaryCodec()]
+
+for codec in CODECS_TO_COMPARE:  # Round trip
+    for name, contents in PACKETS:
+        assert codec.decode(codec.encode(name, contents)) == (name, contents), (codec.NAME, name)
+print("Round trip OK")
+
+for name, contents in PACKETS[:2]:
+    print(f"\n{name}:")
+    for codec in CODECS_TO_COMPARE:
+        encoded = codec.encode(name, contents)
+        number = 20 if name == "server_sync" else 20000
+        encode_time = timeit.timeit(lambda: codec.encode(name, contents), number=number) / number
+        decode_time = timeit.timeit(lambda: codec.decode(encoded), number=number) / number
+        print(f"  {codec.NAME:>6}: {len(encoded):>7} bytes | encode {encode_time * 1e6:9.1f} us | decode {decode_time * 1e6:9.1f} us")
@@ -0,0 +1,49 @@
+"""
+Checks of the NumPy ColumnStore of the ReverbObject positions (ReverbManager.enable_columns)
+
+Run from the repository root:
+    PYTHONPATH=. python Test/Columns.py
+"""
+from reverb import *
+
+set_log_level(WARNING)
+
+
+class Crate(ReverbObject):
+    pass
+
+
+class Marker(ReverbObject):
+    pos = ReverbField(list, [0.0, 0.0])  # Keeps its own pos
+    label = ReverbField(str, "")
+
+
+ReverbManager.enable_columns()
+columns = ReverbManager.COLUMNS
+
+# A ReverbField pos is left out of the columns, and the ReverbObject is fully registered
+marker = Marker([1.0, 2.0], "N", "flag", add_on_init=False)
+ReverbManager.spawn(marker)
+assert ReverbManager.REVERB_OBJECTS[marker.uid] is marker
+assert ReverbManager.get_objects_by_type(Marker) == [marker]
+assert marker._slot is None and marker.pos == [1.0, 2.0] and len(columns) == 0
+marker.pos = [3.0, 4.0]
+assert marker.pos == [3.0, 4.0]
+
+# The default pos is a row of the columns
+crate = Crate([5, 6], add_on_init=False)
+ReverbManager.spawn(crate)
+assert crate._slot == 0 and len(columns) == 1 and crate.pos.tolist() == [5.0, 6.0]
+crate.pos = [7, 8]
+assert columns.positions[crate._slot].tolist() == [7.0, 8.0]
+
+# Spawned before the columns are enabled
+ReverbManager.disable_columns()
+late = Marker([0.0, 1.0], add_on_init=False)
+ReverbManager.spawn(late)
+ReverbManager.enable_columns()
+assert ReverbManager.COLUMNS.objects == [crate] and late._slot is None
+
+ReverbManager.despawn(marker, crate, late)
+assert not ReverbManager.REVERB_OBJECTS and len(ReverbManager.COLUMNS) == 0
+print("Columns OK")
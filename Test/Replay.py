@@ -0,0 +1,84 @@
+"""
+Replay a session recorded by Server.start_recording
+
+- summary: the connections, the duration and the packets of the log by event
+- server: send the recorded client traffic to a local server, started separately with the same world
+- clients: give the recorded server traffic to simulated clients of this process, the modules of the ReverbObject
+  classes of the game are given with --module
+
+Run from the repository root:
+    PYTHONPATH=. python Test/Replay.py session.rvb summary
+    PYTHONPATH=. python Test/Replay.py session.rvb server --port 8080 --speed 4
+    PYTHONPATH=.:Test python Test/Replay.py session.rvb clients --speed 0 --module Benchmark
+"""
+import argparse
+import importlib
+import json
+from collections import Counter
+
+from reverb import *
+
+
+def summary(log: SessionLog):
+    kinds = {RecordKind.IN: "in", RecordKind.OUT: "out", RecordKind.DATAGRAM: "datagram"}
+    packets = Counter()
+    sizes = Counter()
+    codecs = {}  # connection id -> negotiated codec, like the Client does
+    for _, kind, connection, data in log:
+        if kind not in kinds:
+            continue
+        decoded = Packet.decode_packet(bytes(data), codecs.get(connection))
+        name = decoded[0] if decoded is not None else "?"
+        if name == "codec_select":
+            codecs[connection] = Packet.create_codec(*decoded[1])
+        elif name == "compression_select":
+            compression, dictionary, threshold = decoded[1]
+            codecs[connection] = COMPRESSIONS[compression](codecs.get(connection, Packet.DEFAULT_CODEC),
+                                                           dictionary.encode("latin-1"), threshold)
+        packets[kinds[kind], name] += 1
+        sizes[kinds[kind], name] += len(data)
+    return {
+        "connections": log.connections(),
+        "seconds": log.duration(),
+        "packets": {f"{direction} {name}": {"count": count, "bytes": sizes[direction, name]}
+                    for (direction, name), count in packets.most_common()},
+    }
+
+
+def simulated_client(connection, addr):
+    """
+    - A Client that is never connected, its sync_ack are dropped, the ReverbManager follows the last connection
+    """
+    client = Client()
+    ReverbManager.REVERB_CONNECTION = client
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a PyReverb session log")
+    parser.add_argument("log", help="The log written by Server.start_recording")
+    parser.add_argument("mode", choices=("summary", "server", "clients"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--speed", type=float, default=1.0, help="Time multiplier, 0 for as fast as possible")
+    parser.add_argument("--module", action="append", default=[], help="Module registering ReverbObject classes")
+    args = parser.parse_args()
+
+    set_log_level(WARNING)
+    for module in args.module:
+        importlib.import_module(module)
+    with SessionLog(args.log) as log:
+        replay = SessionReplay(log, args.speed or None)
+        if args.mode == "summary":
+            result = summary(log)
+        elif args.mode == "server":
+            result = replay.to_server(args.host, args.port)
+        else:
+            ReverbManager.REVERB_SIDE = ReverbSide.CLIENT
+            result = replay.to_clients(simulated_client)
+            result["objects"] = len(ReverbManager.REVERB_OBJECTS)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+A peer that never reads must not delay the other clients (see Server._write_clients)
+
+- A raw socket connects and never reads: its outbound queue and its kernel buffers fill up
+- A healthy client receives timestamped broadcasts, their delivery latency must stay low
+
+Run from the repository root:
+    PYTHONPATH=. python Test/SlowConsumer.py
+"""
+import argparse
+import socket
+import time
+
+from reverb_base import *
+
+set_log_level(ERROR)
+parser = argparse.ArgumentParser(description="Latency of a healthy client next to a stalled one")
+parser.add_argument("--port", type=int, default=47530)
+parser.add_argument("--broadcasts", type=int, default=200)
+args = parser.parse_args()
+
+latencies = []
+
+
+@client_event_registry.on_event("stamp", mode=DispatchMode.INLINE)
+def stamp(clt, sent, padding):
+    latencies.append(time.monotonic() - sent)
+
+
+server = Server(port=args.port, codecs=("json",), max_queue=100000, max_queue_bytes=None, heartbeat=None,
+                idle_timeout=None)
+server.start_server()
+stalled = socket.create_connection(("127.0.0.1", args.port))
+stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+client = Client(port=args.port, codecs=("json",))
+client.connect()
+time.sleep(0.5)
+for addr, sock in server.clients.items():  # Small kernel buffers, the stalled peer is full after a few frames
+    if addr != client.client.getsockname():
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+
+padding = "x" * 1000
+for _ in range(args.broadcasts):
+    server.send_to_all("stamp", time.monotonic(), padding)
+    time.sleep(0.01)
+time.sleep(1.5)
+client.disconnect()
+stalled.close()
+server.stop_server()
+
+latencies.sort()
+assert len(latencies) == args.broadcasts, f"{len(latencies)} of {args.broadcasts} broadcasts received"
+p99 = latencies[int(len(latencies) * 0.99) - 1]
+print(f"Healthy client: p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms")
+assert p99 < 0.1, "The stalled peer delays the healthy client"
+print("Slow consumer OK")
@@ -0,0 +1,137 @@
+"""
+A world split between many server processes on one machine (see reverb_zones)
+
+- Each zone is a server process with a ZoneNode, the world is split into vertical strips
+- Wanderers walk back and forth across the borders: they are handed off between the servers and mirrored near
+  the borders
+- A client process follows a Walker that crosses all the zones: it is redirected from server to server
+- Each second, every zone prints the ReverbObject it owns and mirrors, and the client the server it is connected to
+
+Run from the repository root:
+    PYTHONPATH=. python Test/Zones.py --zones 3 --width 200 --objects 300 --duration 10
+"""
+import argparse
+import multiprocessing
+import random
+import time
+
+from reverb_zones import *
+
+set_log_level(WARNING)  # Before the classes are registered, into every process
+CONTEXT = multiprocessing.get_context("spawn")
+AUTHKEY = b"zones demo"
+
+
+class Wanderer(ReverbObject):
+    def __init__(self, pos=[0, 0], dir="E", speed=20.0, *reverb_args, add_on_init=True):
+        super().__init__(pos, dir, speed, *reverb_args, add_on_init=add_on_init)
+
+    def on_tick(self, dt):
+        speed = self.reverb_args[0]
+        self.pos = [self.pos[0] + (speed if self.dir == "E" else -speed) * dt, self.pos[1]]
+        if random.random() < dt / 5:  # Turn back every 5 seconds on average
+            self.dir = "W" if self.dir == "E" else "E"
+
+    @server_method
+    def where(self):
+        return list(self.pos)
+
+
+class Walker(Wanderer):
+    def on_tick(self, dt):
+        self.pos = [self.pos[0] + self.reverb_args[0] * dt, self.pos[1]]
+
+
+def run_zone(zone_id, args, output):
+    zone_map = ZoneMap.strips(args.zones, args.width, port=args.port, link_port=args.port + 100, margin=args.margin)
+    server = Server(port=zone_map.zones[zone_id].port)
+    ReverbManager.REVERB_CONNECTION = server
+    server.start_server()
+    node = ZoneNode(zone_map, zone_id, AUTHKEY).start()
+    time.sleep(1.0)  # The other zones are linked
+    left = zone_id * args.width
+    ReverbManager.spawn(*(Wanderer([left + random.uniform(0, args.width), random.uniform(0, 100)],
+                                   random.choice("EW"), random.uniform(10, 40), add_on_init=False)
+                          for _ in range(args.objects // args.zones)))
+    if zone_id == 0:
+        ReverbManager.spawn(Walker([5, 50], "E", args.width * args.zones / args.duration, add_on_init=False))
+    ReverbManager.start_ticking(30, 10)
+    for _ in range(int(args.duration)):
+        time.sleep(1)
+        mirrors = len(node.mirrors)
+        print(f"zone {zone_id}: owns {len(ReverbManager.REVERB_OBJECTS) - mirrors:4} mirrors {mirrors:4} "
+              f"clients {len(server.clients)}", flush=True)
+    ReverbManager.stop_ticking()
+    counters = Metrics.snapshot()["counters"]
+    output.put((zone_id, len(ReverbManager.REVERB_OBJECTS) - len(node.mirrors),
+                sum(counters.get("zone_handoffs", {}).values())))
+    time.sleep(1.0)  # The last messages of the other zones
+    node.stop()
+    server.stop_server()
+
+
+def run_client(args, output):
+    ReverbManager.REVERB_SIDE = ReverbSide.CLIENT
+    redirects = []
+
+    @client_event_registry.on_event("zone_redirect")
+    def count_redirect(clt, host, port, *_):
+        redirects.append(port)
+
+    client = Client(port=args.port)
+    ReverbManager.REVERB_CONNECTION = client
+    client.connect()
+    walker = None
+    while walker is None:
+        walkers = ReverbManager.get_objects_by_type(Walker)
+        walker = walkers[0] if walkers else None
+        time.sleep(0.1)
+    client.send("zone_bind", walker.uid, None)
+    end = time.monotonic() + args.duration - 1.5
+    answered = 0
+    while time.monotonic() < end:
+        time.sleep(1)
+        walker = ReverbManager.REVERB_OBJECTS.get(walker.uid, walker)
+        try:
+            walker.compute_server(walker.where, result=True).result(2)
+            answered += 1
+        except Exception:  # Sent during a redirection
+            pass
+        print(f"client: on port {ReverbManager.REVERB_CONNECTION.port}, walker at x={walker.pos[0]:7.1f}, "
+              f"{len(ReverbManager.REVERB_OBJECTS)} objects", flush=True)
+    output.put(("client", redirects, answered))
+    ReverbManager.REVERB_CONNECTION.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zone-sharded PyReverb world on one machine")
+    parser.add_argument("--zones", type=int, default=3)
+    parser.add_argument("--width", type=float, default=200.0, help="Width of a zone")
+    parser.add_argument("--margin", type=float, default=30.0, help="Width of the mirrored band along the borders")
+    parser.add_argument("--objects", type=int, default=300)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=47300, help="Port of the zone 0, the link ports are 100 after")
+    args = parser.parse_args()
+
+    output = CONTEXT.Queue()
+    zones = [CONTEXT.Process(target=run_zone, args=(i, args, output)) for i in range(args.zones)]
+    for process in zones:
+        process.start()
+    time.sleep(2.0)
+    client = CONTEXT.Process(target=run_client, args=(args, output))
+    client.start()
+    results = [output.get(timeout=args.duration + 30) for _ in range(args.zones + 1)]
+    for process in (*zones, client):
+        process.join(10)
+    owned = 0
+    for result in results:
+        if result[0] == "client":
+            print(f"client: redirected to the ports {result[1]}, {result[2]} compute_server answered")
+        else:
+            owned += result[1]
+            print(f"zone {result[0]}: {result[2]} hand-offs")
+    print(f"{owned} ReverbObject owned by the zones, {args.objects // args.zones * args.zones + 1} spawned")
+
+
+if __name__ == "__main__":
+    main()
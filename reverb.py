@@ -2,7 +2,13 @@ import uuid
 from enum import Enum
 
 from reverb_base import *
+from reverb_columns import *
+from reverb_delta import *
 from reverb_errors import *
+from reverb_interest import *
+from reverb_interp import *
+from reverb_rpc import *
+from reverb_tick import *
 
 
 class ReverbSide(Enum):
@@ -17,8 +23,94 @@ def check_if_json_serializable(*args):
             raise Exception(
                 f"The arg: {arg} is not serializable ! It has to be serializable by JSON to be agree as a reverb_args.")
 
-class ReverbObject:
+class ReverbField:
+    def __init__(self, type=object, default=None, quantize=None):
+        """
+        - Declare a synced field on a ReverbObject subclass, as a class attribute
+        - The type is checked (and quantize applied) once when the field is assigned, not at each sync
+        - A field named 'pos' or 'dir' replaces the default one, the others are the reverb_args, in declaration order
+        - A class with fields has __slots__ instead of a __dict__: declare all your attributes as fields
+        :param type: The type of the values, int are accepted for float and list/tuple are converted to each other
+        :param default: The value until the field is assigned
+        :param quantize: Round the numbers (or the numbers of a list/tuple like pos) to a multiple of it
+        """
+        self.type = type
+        self.default = default
+        self.quantize = quantize
+        self.name = None
+        self.slot = None
+        self.group = "reverb_args"  # The dirty field of ReverbObject.SYNCED_FIELDS marked by an assignment
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.slot = "_f_" + name
+        if name in ("pos", "dir"):
+            self.group = name
+
+    def __get__(self, ro, owner=None):
+        if ro is None:
+            return self
+        try:
+            return getattr(ro, self.slot)
+        except AttributeError:
+            return self.default
+
+    def __set__(self, ro, value):
+        setattr(ro, self.slot, self.check(value))
+        ro.mark_dirty(self.group)
+
+    def check(self, value):
+        """
+        :param value: A value for the field
+        :return: The value converted and quantized
+        """
+        t = self.type
+        if not isinstance(value, t) and not (value is None and self.default is None):
+            if t is float and isinstance(value, int):
+                value = float(value)
+            elif t in (tuple, list) and isinstance(value, (tuple, list)):
+                value = t(value)
+            else:
+                raise ReverbFieldTypeError(self, value)
+        q = self.quantize
+        if q is not None and ReverbManager.REVERB_SIDE == ReverbSide.SERVER:  # The client shows what it receives
+            if isinstance(value, (tuple, list)):
+                value = type(value)(round(v / q) * q for v in value)
+            elif value is not None:
+                value = round(value / q) * q
+        return value
+
+
+class ReverbObjectMeta(type):
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        """
+        - Give __slots__ to the ReverbObject subclasses that declare ReverbField
+        - Number the server_method of the class
+        """
+        fields = {}
+        for base in reversed(bases):
+            fields.update(getattr(base, "_REVERB_FIELDS", {}))
+        new_fields = {key: value for key, value in namespace.items() if isinstance(value, ReverbField)}
+        if new_fields and "__slots__" not in namespace:
+            namespace["__slots__"] = tuple("_f_" + key for key in new_fields)
+        fields.update(new_fields)
+        namespace["_REVERB_FIELDS"] = fields
+        namespace["_REVERB_ARGS_FIELDS"] = tuple(field for key, field in fields.items() if key not in ("pos", "dir"))
+        cls = super().__new__(mcs, name, bases, namespace, **kwargs)
+        cls._RPC_IDS, cls._RPC_TABLE = build_rpc_table(cls)  # The server_method by id
+        return cls
+
+
+class ReverbObject(metaclass=ReverbObjectMeta):
+    SYNCED_FIELDS = ("pos", "dir", "reverb_args")
+    __slots__ = ("uid", "type", "_pos", "_dir", "_reverb_args", "_dirty_fields", "_packed", "_snapshots", "_slot",
+                 "__weakref__")
+
     def __init__(self, pos=(0, 0), dir="N", *reverb_args, add_on_init=True):
+        self._dirty_fields = set()
+        self._packed = None
+        self._slot = None  # The row of the pos into ReverbManager.COLUMNS
+        self._snapshots: SnapshotBuffer = None  # On 'Client' side with the interpolation, the received states
         self.dir = dir
         self.pos = pos
         self.reverb_args = reverb_args
@@ -26,26 +118,135 @@ class ReverbObject:
         self.type = self.__class__.__name__
         ReverbManager.add_type_if_dont_exit(self)
 
-        if add_on_init:
+        if add_on_init and ReverbManager.REVERB_SIDE == ReverbSide.SERVER:  # On CLIENT side the uid comes from the server
             ReverbManager.add_new_reverb_object(self)
 
-    def pack(self):
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        ReverbManager.register_type(cls)  # The client must know the type before receiving its first object
+
+    @property
+    def pos(self):
+        """
+        - With ReverbManager.enable_columns, a NumPy view of the row of the ReverbObject, don't keep it
+        """
+        slot = self._slot
+        if slot is not None:
+            return ReverbManager.COLUMNS.positions[slot]
+        return self._pos
+
+    @pos.setter
+    def pos(self, pos):
+        if self._slot is not None:  # The change is found by the ColumnStore at the next server_sync
+            columns = ReverbManager.COLUMNS
+            if len(pos) != columns.dims:
+                raise ValueError(f"The pos must have {columns.dims} values, not: {pos!r}")
+            with ReverbManager._LOCK:  # The row doesn't move meanwhile
+                columns.positions[self._slot] = pos
+            return
+        self._pos = pos
+        self.mark_dirty("pos")
+
+    @property
+    def dir(self):
+        return self._dir
+
+    @dir.setter
+    def dir(self, dir):
+        self._dir = dir
+        self.mark_dirty("dir")
+
+    @property
+    def reverb_args(self):
+        fields = self._REVERB_ARGS_FIELDS
+        if fields:
+            return tuple(field.__get__(self) for field in fields)
+        return self._reverb_args
+
+    @reverb_args.setter
+    def reverb_args(self, reverb_args):
+        fields = self._REVERB_ARGS_FIELDS
+        if fields:  # Assign the ReverbField in order, the missing ones keep their value
+            for field, value in zip(fields, reverb_args):
+                field.__set__(self, value)
+            return
+        if ReverbManager.REVERB_SIDE == ReverbSide.SERVER:  # Checked once here instead of at each pack
+            check_if_json_serializable(*reverb_args)
+        self._reverb_args = reverb_args
+        self.mark_dirty("reverb_args")
+
+    def mark_dirty(self, *fields):
         """
+        - Flag fields as changed so the next server_sync send them
+        - Assigning pos, dir or reverb_args already does it, call it yourself after an in-place change (like self.pos[0] += 1)
+        :param fields: The changed fields, all the SYNCED_FIELDS if not given
+        """
+        if ReverbManager.REVERB_SIDE == ReverbSide.SERVER:
+            lock = ReverbManager._DIRTY_LOCK  # Else the change could be added after server_sync took the dirty set
+            lock.acquire()  # Cheaper than a with statement, it is called at each change
+            try:
+                self._packed = None
+                self._dirty_fields.update(fields or ReverbObject.SYNCED_FIELDS)
+                ReverbManager.DIRTY_OBJECTS.add(self)
+            finally:
+                lock.release()
+
+    def take_dirty_fields(self):
+        """
+        :return: The fields changed since the last call, and reset them
+        """
+        fields, self._dirty_fields = self._dirty_fields, set()
+        return fields
+
+    def pack(self, fields=None):
+        """
+        - The packed list is cached until a field changes, don't modify it
+        :param fields: Only pack the reverb_args if 'reverb_args' is into the fields, all by default
         :return: A list of all needed args that are linked between the server and the clients
         """
-        check_if_json_serializable(*self.reverb_args)
-        return [self.type, list(self.pos), self.dir, *self.reverb_args]
+        packed = self._packed
+        if packed is None:
+            lock = ReverbManager._DIRTY_LOCK  # A change during the packing clears the packed list after it is cached
+            lock.acquire()
+            try:
+                pos = self.pos
+                packed = self._packed = [self.type, pos.tolist() if self._slot is not None else list(pos), self.dir,
+                                         *self.reverb_args]
+            finally:
+                lock.release()
+        if fields is not None and "reverb_args" not in fields:
+            return packed[:3]
+        return packed
 
     def sync(self, pos, dir, *reverb_args):
-        if ReverbManager.REVERB_SIDE == "CLIENT":
-            self.pos = pos
-            self.dir = dir
+        if ReverbManager.REVERB_SIDE == ReverbSide.CLIENT:
+            interpolation = ReverbManager.INTERPOLATION
+            if interpolation is None or interpolation.latest_time is None:
+                self.pos = pos
+                self.dir = dir
+            else:  # Shown later by ReverbManager.interpolate
+                if self._snapshots is None:
+                    self._snapshots = SnapshotBuffer(interpolation.size)
+                self._snapshots.add(interpolation.latest_time, pos, dir, interpolation.previous_time)
             if reverb_args != ():
                 self.reverb_args = reverb_args
                 self.on_sync_reverb_args()
         else:
             raise ReverbWrongSideError(ReverbManager.REVERB_SIDE)
 
+    def interpolate(self, render_time, interpolation):
+        """
+        - Called on the 'Client' side by ReverbManager.interpolate
+        - Show the pos and dir of the ReverbObject at render_time
+        :param render_time: The server time to show
+        :param interpolation: The Interpolation settings
+        """
+        if self._snapshots is None:
+            return
+        state = self._snapshots.sample(render_time, interpolation.max_extrapolation, interpolation.latest_time)
+        if state is not None:
+            self.pos, self.dir = state
+
     def on_sync_reverb_args(self):
         """
         - Override this function to update your reverb_args.
@@ -53,14 +254,46 @@ class ReverbObject:
         """
         pass
 
-    def compute_server(self, func, *args):
+    def on_tick(self, dt):
+        """
+        - Override this function to simulate the ReverbObject on 'Server' side
+        - Called at the fixed simulation rate of ReverbManager.start_ticking
+        :param dt: The fixed duration of a tick in seconds
+        """
+        pass
+
+    def sync_priority(self, center):
+        """
+        - Override this function to choose which ReverbObject are sent first to a client with a sync budget
+          (see ReverbManager.set_client_budget), like by distance: 1 / (1 + distance(self.pos, center))
+        - The priority is added to the accumulated priority of the ReverbObject at each server_sync it is not sent
+        :param center: The center of the area of interest of the client, None if it has none
+        :return: A positive number
+        """
+        return 1.0
+
+    def on_despawn(self):
+        """
+        - Override this function to react when the ReverbObject is removed from the ReverbManager
+        - On 'Client' side, it is also called when the object leaves the area of interest of the client
         """
-        - Send a Packet to the server to compute a function server with args
+        pass
+
+    def compute_server(self, func, *args, result=False, timeout=None):
+        """
+        - Call a function on the server with args
         - Only on 'Client' side
-        :param func: The server function reference. Has to be into the Class
+        - The calls are batched, see ReverbManager.flush_rpcs
+        :param func: The server function reference. Has to be a server_method of the Class
         :param args: Args of the function
+        :param result: Return a Future of the result of the function
+        :param timeout: Time to wait for the result in seconds, ReverbManager.RPC_TIMEOUT if None
+        :return: The Future if result else None
         """
-        ReverbManager.REVERB_CONNECTION.send("calling_server_computing", self.uid, func.__name__, *args)
+        method_id = self._RPC_IDS.get(func.__name__)
+        if method_id is None:
+            raise ReverbRPCNotAllowedError(self.__class__, func.__name__)
+        return ReverbManager.get_rpc().call(self.uid, method_id, args, result, timeout)
 
     def is_uid_init(self):
         """
@@ -76,32 +309,514 @@ class ReverbManager:
     """
     REVERB_SIDE: ReverbSide = ReverbSide.SERVER
     REVERB_CONNECTION = None  # Client, or Server
-    REVERB_OBJECTS: dict[str:ReverbObject] = {}
+    REVERB_OBJECTS: dict[str:ReverbObject] = {}  # Only changed under _LOCK, iterate over objects_snapshot()
+    TYPE_INDEX: dict[type, dict[str, ReverbObject]] = {}  # class -> uid -> ReverbObject of exactly this class
     REVERB_OBJECT_REGISTRY = {"ReverbObject": ReverbObject}  # Register all type
+    DIRTY_OBJECTS: set[ReverbObject] = set()  # ReverbObject changed since the last server_sync
+    KEYFRAME_INTERVAL = 0  # Send all the ReverbObject every KEYFRAME_INTERVAL server_sync, 0 to disable
+    SNAPSHOT_HISTORY = 32  # Snapshots kept per client, a client that didn't ack for longer receives everything
+    UNRELIABLE_SYNC = True  # Send the server_sync on the UDP channel of the clients that have one
+    INTEREST: SpatialGrid = None  # Spatial index of the ReverbObject, None if the interest management is disabled
+    COLUMNS: ColumnStore = None  # Columnar storage of the pos, see enable_columns
+    CLIENT_INTERESTS: dict[object, AreaOfInterest] = {}  # addr -> area of the client, the others receive everything
+    SYNC_BUDGET: int = None  # Default bytes per server_sync of each client, None for no limit
+    CLIENT_BUDGETS: dict[object, int] = {}  # addr -> bytes per server_sync of the client
+    _PRIORITIES: dict[object, dict[str, float]] = {}  # addr -> uid -> accumulated priority of the unsent changes
+    _BASELINES: dict[object, SnapshotRing] = {}  # addr -> snapshots sent to the client and its ack
+    _WORLD = ({}, None)  # The last snapshot of all the ReverbObject and the objects_snapshot it was made from
+    _RECEIVED = SnapshotRing(SNAPSHOT_HISTORY)  # On 'Client' side, the snapshots received from the server
+    _RECEIVED_SEQ = None  # On 'Client' side, the seq of the snapshot shown by the ReverbObject
+    _PUBLISHED = (0, {}, 0.0)  # seq, snapshot of all the ReverbObject and server time of the last server_sync
+    JOIN_SNAPSHOT_CHUNKS = 16  # Number of packets of the snapshot sent to the new clients
+    _JOIN_SNAPSHOT = EncodedSnapshot(JOIN_SNAPSHOT_CHUNKS)  # The last snapshot, encoded for the new clients
+    _JOINING = None  # On 'Client' side, [seq, chunks count, received ros, server time] of the snapshot being received
+    INTERPOLATION: Interpolation = None  # On 'Client' side, see enable_interpolation
+    WORKERS = None  # On 'Server' side, the WorkerPool that owns the ReverbObject (see reverb_workers)
+    ZONE = None  # On 'Server' side, the ZoneNode of a world split between many servers (see reverb_zones)
+    UID_FACTORY = None  # Function that makes the uid of the new ReverbObject on 'Server' side, uuid4 if None
+    RPC: RpcBatcher = None  # On 'Client' side, the waiting compute_server calls
+    RPC_FLUSH_INTERVAL = 1 / 60  # The compute_server calls are sent this time after the first one, None to only
+    # send them with flush_rpcs
+    RPC_TIMEOUT = 5.0  # Default time to wait for the result of a compute_server
+    MAX_RPC_BATCH = 256  # On 'Server' side, the calls of a batch after this number are refused
+    TICKER: TickScheduler = None  # The server loop, see start_ticking
+    _SYNC_TICK = 0
+    _KEYFRAME_REQUESTED = False
+    _TICKING_TYPES: dict[type, bool] = {}  # type -> if it overrides on_tick
+    _LOCK = threading.RLock()  # Held to change REVERB_OBJECTS and its indexes
+    _DIRTY_LOCK = threading.Lock()  # Held to change DIRTY_OBJECTS and the dirty fields of the ReverbObject
+    _SYNC_LOCK = threading.Lock()  # Held by server_sync and the joins, a client gets its join before any server_sync
+    _SNAPSHOT: dict[str, ReverbObject] = None  # Copy of REVERB_OBJECTS, None after a change
 
     @staticmethod
-    def print_manager(msg):
+    def print_manager(msg, *args, level=INFO):
         """
-        - Print a message with the ReverbManager style
-        :param msg: The message
+        - Log a message with the ReverbManager style
+        :param msg: The message, formatted with args (%-style) only if the level is enabled
+        :param level: The logging level
         """
-        print(f"{Back.YELLOW + Fore.RED}[{Fore.RESET}REVERB_MANAGER{Fore.RED}]{Style.RESET_ALL} {msg}")
+        manager_logger.log(level, msg, *args)
 
     @staticmethod
     def add_type_if_dont_exit(ro: ReverbObject):
-        try:
-            ReverbManager.REVERB_OBJECT_REGISTRY[ro.__class__.__name__]
-        except KeyError:
-            ReverbManager.REVERB_OBJECT_REGISTRY[ro.__class__.__name__] = ro.__class__
-            ReverbManager.print_manager(f"Adding type '{ro.__class__.__name__}' to the registry.")
+        ReverbManager.register_type(ro.__class__)
+
+    @staticmethod
+    def register_type(cls):
+        """
+        - Add a ReverbObject class to the registry, done when the class is defined
+        :param cls: The class
+        :return: The class
+        """
+        if cls.__name__ not in ReverbManager.REVERB_OBJECT_REGISTRY:
+            ReverbManager.REVERB_OBJECT_REGISTRY[cls.__name__] = cls
+            BinaryCodec.intern(cls.__name__)
+            CompressedCodec.add_words(cls.__name__)
+            ReverbManager.print_manager("Adding type '%s' to the registry.", cls.__name__)
+        return cls
+
+    @staticmethod
+    def server_sync(full=False):
+        """
+        - Called on the 'Server' side
+        - Send to each client the diff between the ReverbObject and the last snapshot it acked (its baseline)
+        - A lost or dropped sync is never acked, so the next diffs simply contain its changes again
+        - Send everything if full, if requested, every KEYFRAME_INTERVAL calls, or if the baseline of a client is
+          too old to be kept (see SNAPSHOT_HISTORY)
+        - The clients whose codec is not chosen yet are skipped, they get the join snapshot first (see on_client_ready)
+        :param full: Force a keyframe
+        """
+        with ReverbManager._SYNC_LOCK:
+            ReverbManager._server_sync(full)
+
+    @staticmethod
+    def _server_sync(full):
+        """
+        - Must be called with the _SYNC_LOCK held
+        """
+        seq = ReverbManager._SYNC_TICK = ReverbManager._SYNC_TICK + 1
+        keyframe = (full or ReverbManager._KEYFRAME_REQUESTED or
+                    (ReverbManager.KEYFRAME_INTERVAL and seq % ReverbManager.KEYFRAME_INTERVAL == 0))
+        if keyframe:
+            ReverbManager._KEYFRAME_REQUESTED = False
+        start = Metrics.clock()
+        if ReverbManager.WORKERS is not None:  # The ReverbObject are into the worker processes
+            world, moved, removed = ReverbManager.WORKERS.collect()
+        else:
+            dirty = ReverbManager._take_dirty()
+            objects = ReverbManager.objects_snapshot()
+            changes = {}  # uid -> changed fields
+            for ro, fields in dirty.items():
+                if objects.get(ro.uid) is ro:
+                    changes[ro.uid] = fields
+            moved = {uid: objects[uid].pos for uid, fields in changes.items() if "pos" in fields}
+            packs = ReverbManager._collect_columns(objects) if ReverbManager.COLUMNS is not None else None
+            world = ReverbManager._world_snapshot(objects, changes, packs)
+            removed = ()  # Already removed from the grid by remove_reverb_object
+        server_time = time.monotonic()  # The time of the snapshot, for the interpolation of the clients
+        ReverbManager._PUBLISHED = (seq, world, server_time)
+        Metrics.observe_since("sync_pack_time", start)
+        start = Metrics.clock()
+
+        connection = ReverbManager.REVERB_CONNECTION
+        clients = dict(connection.clients)
+        baselines = ReverbManager._BASELINES
+        areas = ReverbManager.CLIENT_INTERESTS
+        budgets = ReverbManager.CLIENT_BUDGETS
+        for addr in list(baselines):  # Forget the disconnected clients
+            if addr not in clients:
+                baselines.pop(addr, None)
+                areas.pop(addr, None)
+                budgets.pop(addr, None)
+                ReverbManager._PRIORITIES.pop(addr, None)
+
+        grid = ReverbManager.INTEREST
+        if grid is not None:
+            for uid, pos in moved.items():
+                grid.update(uid, pos)
+            for uid in removed:
+                grid.remove(uid)
+
+        groups = {}  # (base_seq, id of the baseline) -> (base_seq, baseline, addrs), they share the diff
+        for addr in clients:
+            ring = baselines.get(addr)
+            if ring is None:  # Not ready, its ring is made with its join snapshot
+                continue
+            base_seq, baseline = (None, None) if keyframe else ring.baseline()
+            area = areas.get(addr) if grid is not None else None
+            budget = budgets.get(addr, ReverbManager.SYNC_BUDGET)
+            if area is not None or budget is not None:
+                center = None
+                snapshot = world
+                if area is not None:
+                    center = area.get_center(world)
+                    snapshot = {uid: world[uid] for uid in grid.query(center, area.radius) if uid in world}
+                if budget is not None and baseline is not None:  # A keyframe replaces everything, it is never cut
+                    snapshot = ReverbManager._fit_budget(addr, snapshot, baseline, budget, center)
+                ReverbManager._send_snapshot(connection, [addr], seq, server_time, snapshot, base_seq, baseline, ring)
+            elif baseline is not world:  # Else nothing changed since the baseline
+                ring.add(seq, world)
+                key = (base_seq, id(baseline))
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = (base_seq, baseline, [])
+                group[2].append(addr)
+
+        for base_seq, baseline, addrs in groups.values():
+            ReverbManager._send_snapshot(connection, addrs, seq, server_time, world, base_seq, baseline)
+        Metrics.observe_since("sync_send_time", start)
+        Metrics.count("syncs", "keyframe" if keyframe else "delta")
+
+    @staticmethod
+    def _take_dirty():
+        """
+        - Called on the 'Server' side
+        :return: Dict ReverbObject -> its fields changed since the last call
+        """
+        with ReverbManager._DIRTY_LOCK:
+            dirty, ReverbManager.DIRTY_OBJECTS = ReverbManager.DIRTY_OBJECTS, set()
+            return {ro: ro.take_dirty_fields() for ro in dirty}
+
+    @staticmethod
+    def _fit_budget(addr, snapshot, baseline, budget, center):
+        """
+        - Choose the changes sent to a client with a budget, by accumulated priority
+        - The unsent ReverbObject keep their state of the baseline into the returned snapshot, so it is what the
+          client will have and their changes are still into the next diff
+        :param addr: The address of the client
+        :param snapshot: Dict uid -> packed ReverbObject the client should have
+        :param baseline: The snapshot acked by the client
+        :param budget: Max estimated bytes of the changes
+        :param center: The center of the area of interest of the client
+        :return: The snapshot to send
+        """
+        ros, _ = diff_snapshot(snapshot, baseline)
+        if not ros:
+            return snapshot
+        objects = ReverbManager.objects_snapshot()
+        accumulated = ReverbManager._PRIORITIES.get(addr, {})
+        priorities = {}
+        for uid in ros:
+            ro = objects.get(uid)
+            priorities[uid] = accumulated.get(uid, 0.0) + (ro.sync_priority(center) if ro is not None else 1.0)
+        size = 0
+        deferred = {}
+        for uid in sorted(ros, key=priorities.__getitem__, reverse=True):
+            cost = len(uid) + estimate_size(ros[uid])
+            if size + cost <= budget or not size:  # At least one, even bigger than the budget
+                size += cost
+            else:
+                deferred[uid] = priorities[uid]
+        ReverbManager._PRIORITIES[addr] = deferred  # The sent ones start again from 0
+        if not deferred:
+            return snapshot
+        Metrics.count("sync_deferred", None, len(deferred))
+        sent = dict(snapshot)
+        for uid in deferred:
+            old = baseline.get(uid)
+            if old is None:  # Not known by the client yet
+                del sent[uid]
+            else:
+                sent[uid] = old
+        return sent
+
+    @staticmethod
+    def _collect_columns(objects):
+        """
+        - Pack again the ReverbObject whose row of the ColumnStore changed, and move them into the grid
+        :return: Dict uid -> packed ReverbObject of the changed ones
+        """
+        with ReverbManager._LOCK:  # The rows don't move meanwhile
+            ros, positions, crossed = ReverbManager.COLUMNS.collect()
+        packs = {}
+        unpacked = []
+        with ReverbManager._DIRTY_LOCK:  # Else a change meanwhile could be overwritten by the old packed list
+            for ro, pos in zip(ros, positions):
+                uid = ro.uid
+                if uid not in objects:  # Spawned after the objects_snapshot, sent at the next server_sync
+                    continue
+                packed = ro._packed
+                if packed is None:
+                    unpacked.append(ro)
+                else:  # Only the pos changed
+                    packs[uid] = ro._packed = [packed[0], pos, *packed[2:]]
+        for ro in unpacked:
+            packs[ro.uid] = ro.pack()
+        grid = ReverbManager.INTEREST
+        if grid is not None:
+            for ro, cell in crossed:
+                if ro.uid in grid:
+                    grid.move(ro.uid, cell)
+        return packs
+
+    @staticmethod
+    def _world_snapshot(objects, changes, packs=None):
+        """
+        :param packs: Dict uid -> packed ReverbObject already packed again (see _collect_columns)
+        :return: Dict uid -> packed ReverbObject of all the ReverbObject
+        """
+        previous, previous_objects = ReverbManager._WORLD
+        if previous_objects is not objects:  # Spawned or removed ReverbObject
+            world = {uid: ro.pack() for uid, ro in objects.items()}
+        elif not changes and not packs:
+            return previous
+        else:
+            world = dict(previous)
+            if packs:
+                world.update(packs)
+            for uid in changes:
+                world[uid] = objects[uid].pack()
+        ReverbManager._WORLD = (world, objects)
+        return world
+
+    @staticmethod
+    def _send_snapshot(connection, addrs, seq, server_time, snapshot, base_seq, baseline, ring=None):
+        """
+        - Send the diff between snapshot and baseline, as a server_sync numbered seq
+        :param ring: The SnapshotRing of the client to add the snapshot into, if it was not done by the caller
+        """
+        ros, removed = diff_snapshot(snapshot, baseline)
+        if baseline is not None and not ros and not removed:
+            return  # The baseline is still up to date, the client has nothing to ack
+        if ring is not None:
+            ring.add(seq, snapshot)
+        # By address: a client that left since the sync started is skipped
+        connection.send_to_group(addrs, "server_sync", seq, base_seq, ros, removed, server_time,
+                                 unreliable=ReverbManager.UNRELIABLE_SYNC)
+
+    @staticmethod
+    def enable_interest(cell_size=100.0):
+        """
+        - Called on the 'Server' side
+        - Index the ReverbObject by position, so the clients with an area of interest only receive what is near them
+        :param cell_size: The size of the cells of the SpatialGrid
+        """
+        ReverbManager.INTEREST = SpatialGrid(cell_size)
+        for uid, ro in ReverbManager.objects_snapshot().items():
+            ReverbManager.INTEREST.update(uid, ro.pos)
+        if ReverbManager.COLUMNS is not None:
+            with ReverbManager._LOCK:
+                ReverbManager.COLUMNS.set_cell_size(cell_size)
+
+    @staticmethod
+    def enable_columns(dims=2, capacity=1024, dtype="float64"):
+        """
+        - Called on the 'Server' side, needs NumPy
+        - Store the pos of the ReverbObject into the ColumnStore ReverbManager.COLUMNS instead of one list per object:
+          the changed positions are found, packed and placed into the grid with vectorized operations
+        - The pos of the ReverbObject becomes a view of its row, a crowd can also be moved at once with
+          ReverbManager.COLUMNS.rows() (ordered like ReverbManager.COLUMNS.objects)
+        - The ReverbObject whose pos is a ReverbField or doesn't have dims values keep their own pos
+        :param dims: The length of the positions
+        :param capacity: The initial number of rows
+        :param dtype: The type of the numbers
+        """
+        with ReverbManager._LOCK:
+            if ReverbManager.COLUMNS is not None:
+                return
+            columns = ReverbManager.COLUMNS = ColumnStore(dims, capacity, dtype)
+            if ReverbManager.INTEREST is not None:
+                columns.set_cell_size(ReverbManager.INTEREST.cell_size)
+            for ro in ReverbManager.REVERB_OBJECTS.values():
+                ReverbManager._add_to_columns(ro)
+
+    @staticmethod
+    def disable_columns():
+        """
+        - Called on the 'Server' side
+        - The ReverbObject get their own pos back
+        """
+        with ReverbManager._LOCK:
+            columns, ReverbManager.COLUMNS = ReverbManager.COLUMNS, None
+            if columns is None:
+                return
+            for ro in list(columns.objects):
+                pos = columns.positions[ro._slot].tolist()
+                columns.remove(ro)
+                ro.pos = pos  # Sent at the next server_sync, if it moved since the last one
+
+    @staticmethod
+    def _add_to_columns(ro: ReverbObject):
+        """
+        - Must be called with the _LOCK held
+        """
+        if type(ro).pos is not ReverbObject.pos or ro._slot is not None:  # A ReverbField pos has no _pos
+            return
+        pos = ro._pos
+        if ReverbManager.COLUMNS.accepts(pos):
+            ReverbManager.COLUMNS.add(ro, pos)
+
+    @staticmethod
+    def set_client_interest(clt: socket.socket, radius, center=(0, 0), focus: ReverbObject = None):
+        """
+        - Called on the 'Server' side
+        - Set the area of interest of a client, enable_interest must have been called
+        :param clt: The client socket
+        :param radius: The radius of the area
+        :param center: A fixed center
+        :param focus: A ReverbObject followed by the area (like the player of the client)
+        """
+        ReverbManager.CLIENT_INTERESTS[clt.getpeername()] = AreaOfInterest(radius, center, focus)
+
+    @staticmethod
+    def set_client_budget(clt: socket.socket, bytes_per_sync):
+        """
+        - Called on the 'Server' side
+        - Bound the size of the server_sync of a client: the changes are sent by accumulated priority (see
+          ReverbObject.sync_priority) until the budget is spent, the others wait for the next server_sync
+        - The keyframes are never cut, see also SYNC_BUDGET for the default budget of all the clients
+        :param clt: The client socket
+        :param bytes_per_sync: Max estimated bytes of the changes per server_sync, None to use SYNC_BUDGET
+        """
+        if bytes_per_sync is None:
+            ReverbManager.CLIENT_BUDGETS.pop(clt.getpeername(), None)
+        else:
+            ReverbManager.CLIENT_BUDGETS[clt.getpeername()] = bytes_per_sync
+
+    @staticmethod
+    def clear_client_interest(clt: socket.socket):
+        """
+        - Called on the 'Server' side
+        - The client will receive everything again
+        :param clt: The client socket
+        """
+        ReverbManager.CLIENT_INTERESTS.pop(clt.getpeername(), None)
+
+    @staticmethod
+    def simulate(dt):
+        """
+        - Called on the 'Server' side
+        - Call on_tick of the ReverbObject that override it
+        :param dt: The duration of the tick in seconds
+        """
+        if ReverbManager.WORKERS is not None:  # Each worker process simulates its ReverbObject
+            ReverbManager.WORKERS.tick(dt)
+            return
+        ticking_types = ReverbManager._TICKING_TYPES
+        zone = ReverbManager.ZONE
+        mirrors = zone.mirrors if zone is not None else None  # Simulated by the server that owns them
+        for ro in ReverbManager.objects_snapshot().values():
+            cls = type(ro)
+            ticking = ticking_types.get(cls)
+            if ticking is None:
+                ticking = ticking_types[cls] = cls.on_tick is not ReverbObject.on_tick
+            if ticking and (not mirrors or ro.uid not in mirrors):
+                ro.on_tick(dt)
+        if zone is not None:  # Hand-offs and mirrors, with the state of this tick
+            zone.update(dt)
+
+    @staticmethod
+    def start_ticking(sim_rate=60, sync_rate=20, max_catch_up=5, on_tick=None):
+        """
+        - Called on the 'Server' side
+        - Run the simulation (on_tick of the ReverbObject) and the server_sync at fixed rates into a thread
+        - ReverbManager.TICKER.report() gives the durations of the ticks and the overruns of the budget
+        :param sim_rate: Simulation ticks per second, 0 to disable
+        :param sync_rate: server_sync per second
+        :param max_catch_up: Max simulation ticks run in a row after a slow tick
+        :param on_tick: Function called with dt after the on_tick of the ReverbObject (game logic)
+        """
+        def on_simulate(dt):
+            ReverbManager.simulate(dt)
+            if on_tick is not None:
+                on_tick(dt)
+
+        ReverbManager.stop_ticking()
+        ReverbManager.TICKER = TickScheduler(on_simulate, ReverbManager.server_sync, sim_rate, sync_rate, max_catch_up)
+        ReverbManager.TICKER.start()
+
+    @staticmethod
+    def stop_ticking():
+        """
+        - Stop the loop started by start_ticking
+        """
+        if ReverbManager.TICKER is not None:
+            ReverbManager.TICKER.stop()
+            ReverbManager.TICKER = None
+
+    @staticmethod
+    def enable_interpolation(delay=0.1, max_extrapolation=0.25, size=32, adaptive=False):
+        """
+        - Called on the 'Client' side
+        - The received pos and dir are buffered and shown with a delay by interpolate, so the ReverbObject move
+          smoothly whatever the sync rate and the network jitter
+        :param delay: How far in the past the ReverbObject are shown in seconds, about 2 sync periods plus the jitter
+        :param max_extrapolation: Max time in seconds a movement is continued when the snapshots are late
+        :param size: Max states kept per ReverbObject
+        :param adaptive: Add the jitter of the connection, measured by the heartbeats of the server, to delay
+        """
+        ReverbManager.INTERPOLATION = Interpolation(delay, max_extrapolation, size, adaptive)
 
     @staticmethod
-    def server_sync():
-        ros = {}
-        for uid, ro in ReverbManager.REVERB_OBJECTS.items():
-            ros[uid] = ro.pack()
+    def interpolate():
+        """
+        - Called on the 'Client' side, before each render
+        - Set the pos and dir of the ReverbObject to their interpolated value
+        """
+        interpolation = ReverbManager.INTERPOLATION
+        if interpolation is None:
+            return
+        render_time = interpolation.render_time()
+        if render_time is None:
+            return
+        for ro in ReverbManager.objects_snapshot().values():
+            ro.interpolate(render_time, interpolation)
 
-        ReverbManager.REVERB_CONNECTION.send_to_all("server_sync", ros)
+    @staticmethod
+    def get_rpc() -> RpcBatcher:
+        """
+        - Called on the 'Client' side
+        :return: The RpcBatcher of the compute_server calls
+        """
+        if ReverbManager.RPC is None:
+            ReverbManager.RPC = RpcBatcher(lambda calls: ReverbManager.REVERB_CONNECTION.send("rpc_batch", calls),
+                                           ReverbManager.RPC_FLUSH_INTERVAL, ReverbManager.RPC_TIMEOUT)
+        return ReverbManager.RPC
+
+    @staticmethod
+    def flush_rpcs():
+        """
+        - Called on the 'Client' side, once per frame
+        - Send the compute_server calls of the frame in one packet
+        """
+        if ReverbManager.RPC is not None:
+            ReverbManager.RPC.flush()
+
+    @staticmethod
+    def request_keyframe():
+        """
+        - The next server_sync will send all the ReverbObject
+        """
+        ReverbManager._KEYFRAME_REQUESTED = True
+
+    @staticmethod
+    def objects_snapshot() -> dict[str, ReverbObject]:
+        """
+        - Read-only copy of REVERB_OBJECTS, safe to iterate while other threads spawn and despawn
+        - Only copied again after a change, so the sync and simulation ticks share it
+        :return: Dict[uid: ReverbObject], don't modify it
+        """
+        snapshot = ReverbManager._SNAPSHOT
+        if snapshot is None:
+            with ReverbManager._LOCK:
+                snapshot = ReverbManager._SNAPSHOT
+                if snapshot is None:
+                    snapshot = ReverbManager._SNAPSHOT = dict(ReverbManager.REVERB_OBJECTS)
+        return snapshot
+
+    @staticmethod
+    def get_objects_by_type(cls: type, subclasses=True) -> list[ReverbObject]:
+        """
+        - Get the ReverbObject of a class without walking all of them
+        :param cls: The class, like Player
+        :param subclasses: Include the objects of the subclasses of cls
+        :return: List of the ReverbObject
+        """
+        with ReverbManager._LOCK:
+            if not subclasses:
+                return list(ReverbManager.TYPE_INDEX.get(cls, {}).values())
+            return [ro for index_cls, ros in ReverbManager.TYPE_INDEX.items() if issubclass(index_cls, cls)
+                    for ro in ros.values()]
 
     @staticmethod
     def get_reverb_object(uid: str) -> ReverbObject:
@@ -115,6 +830,54 @@ class ReverbManager:
         except KeyError:
             raise ReverbObjectNotFoundError(uid)
 
+    @staticmethod
+    def remove_reverb_object(uid: str):
+        """
+        - Remove a ReverbObject from the ReverbManager
+        :param uid: The uid
+        :return: The removed ReverbObject or ReverbObjectNotFoundError if not found
+        """
+        with ReverbManager._LOCK:
+            try:
+                ro = ReverbManager.REVERB_OBJECTS.pop(uid)
+            except KeyError:
+                raise ReverbObjectNotFoundError(uid)
+            ReverbManager._SNAPSHOT = None
+            ros = ReverbManager.TYPE_INDEX.get(type(ro))
+            if ros is not None:
+                ros.pop(uid, None)
+                if not ros:
+                    del ReverbManager.TYPE_INDEX[type(ro)]
+            if ReverbManager.INTEREST is not None:
+                ReverbManager.INTEREST.remove(uid)
+            if ro._slot is not None:
+                ReverbManager.COLUMNS.remove(ro)
+        ro.on_despawn()
+        return ro
+
+    @staticmethod
+    def spawn(*ros: ReverbObject):
+        """
+        - Called on the 'Server' side
+        - Add many new ReverbObject at once (created with add_on_init=False), they are sent at the next server_sync
+        :param ros: The ReverbObject
+        """
+        with ReverbManager._LOCK:
+            for ro in ros:
+                ReverbManager._add(ro, None)
+        ReverbManager.print_manager("%s new ReverbObject spawned into '%s' side", len(ros), ReverbManager.REVERB_SIDE)
+
+    @staticmethod
+    def despawn(*ros):
+        """
+        - Called on the 'Server' side
+        - Remove ReverbObject from the server and, at the next server_sync, from the clients
+        :param ros: The ReverbObject or their uids
+        """
+        with ReverbManager._LOCK:
+            for ro in ros:
+                ReverbManager.remove_reverb_object(ro if isinstance(ro, str) else ro.uid)
+
     @staticmethod
     def get_cls_by_type_name(t):
         try:
@@ -129,63 +892,356 @@ class ReverbManager:
         :param ro: The ReverbObject
         :param uid: The uid, can be let by default if you are on SERVER side
         """
-        if ro not in ReverbManager.REVERB_OBJECTS.values():  # Check if the
-            if not ro.is_uid_init():  # Check if the RO is not init yet
-                if ReverbManager.REVERB_SIDE == ReverbSide.SERVER:  # check RM side
-                    # SERVER
-                    uid = str(uuid.uuid4())
-                    ReverbManager.REVERB_OBJECTS[uid] = ro
-                else:
-                    # CLIENT
-                    if uid is not None:
-                        ReverbManager.REVERB_OBJECTS[uid] = ro
-                    else:
-                        raise ReverbUIDNoneError(uid)
+        with ReverbManager._LOCK:
+            uid = ReverbManager._add(ro, uid)
+        ReverbManager.print_manager("New ReverbObject add into '%s' side with uid=%s", ReverbManager.REVERB_SIDE, uid,
+                                    level=DEBUG)
+
+    @staticmethod
+    def preassigned_uid(uid):
+        """
+        - Called on the 'Server' side
+        - Make a UID_FACTORY that gives uid to the next ReverbObject added, then the uids of the current UID_FACTORY
+          (like to the ReverbObject spawned by its constructor)
+        - Set it with the _LOCK held and restore the previous UID_FACTORY after
+        :param uid: The uid the ReverbObject must have
+        """
+        uids = [uid]
+        fallback = ReverbManager.UID_FACTORY
+
+        def factory():
+            if uids:
+                return uids.pop()
+            return str(uuid.uuid4()) if fallback is None else fallback()
+        return factory
+
+    @staticmethod
+    def _add(ro: ReverbObject, uid):
+        """
+        - Must be called with the _LOCK held
+        :return: The uid of the ReverbObject
+        """
+        if ro.is_uid_init() and ReverbManager.REVERB_OBJECTS.get(ro.uid) is ro:  # The uid is the reverse index
+            raise ReverbObjectAlreadyExistError(ro)
+        if ro.is_uid_init():  # Check if the RO is not init yet
+            raise ReverbUIDAlreadyInitError(ro)
+        if ReverbManager.REVERB_SIDE == ReverbSide.SERVER:  # check RM side
+            # SERVER
+            uid = str(uuid.uuid4()) if ReverbManager.UID_FACTORY is None else ReverbManager.UID_FACTORY()
+        elif uid is None:
+            # CLIENT
+            raise ReverbUIDNoneError(uid)
+        if ReverbManager.REVERB_SIDE == ReverbSide.SERVER and ReverbManager.COLUMNS is not None:
+            ReverbManager._add_to_columns(ro)  # Before the ReverbObject is published, an error leaves nothing behind
+        ro.uid = uid
+        ReverbManager.REVERB_OBJECTS[uid] = ro
+        ReverbManager.TYPE_INDEX.setdefault(type(ro), {})[uid] = ro
+        ReverbManager._SNAPSHOT = None
+        if ReverbManager.REVERB_SIDE == ReverbSide.SERVER:
+            ro.mark_dirty()  # A new ReverbObject is fully sent
+        return uid
+
+    @staticmethod
+    @client_event_registry.on_event("server_sync", mode=DispatchMode.ORDERED)
+    def on_server_sync(clt: socket.socket, seq: int, base_seq: int, ros: dict[str, list[object]], removed: list[str],
+                       server_time: float = None, *args):
+        """
+        - Called on the 'Client' side
+        - Called when the server sync state of ReverbObject with clients
+        - ros is the diff against the snapshot base_seq, that the client acked: the new and changed ReverbObject,
+          with only their changed fields
+        :param clt: The client socket
+        :param seq: The sequence number of the snapshot
+        :param base_seq: The snapshot the diff is made against, None if ros contains everything
+        :param ros: Dict[uids:[type, pos, dir, *reverb_args] or [mask, *changed fields]]
+        :param removed: The uids of the ReverbObject that left (despawned or out of the area of interest)
+        :param server_time: The server time of the snapshot
+        """
+        received = ReverbManager._RECEIVED
+        shown_seq = ReverbManager._RECEIVED_SEQ
+        if shown_seq is not None and seq <= shown_seq:
+            return  # Late (even a keyframe, like one sent on TCP overtaken by diffs), a newer snapshot is shown
+        if base_seq is not None:
+            baseline = received.get(base_seq)
+            if baseline is None:
+                joining = ReverbManager._JOINING
+                if joining is None or joining[0] != base_seq:  # Forgotten, ask for everything
+                    ReverbManager.REVERB_CONNECTION.send("sync_ack", None)
+                return  # Else the diff is made against the snapshot still being received
+        else:
+            baseline = None
+        snapshot = apply_snapshot(baseline, ros, removed)
+        shown = received.get(shown_seq)
+        received.add(seq, snapshot)
+        if base_seq is not None:
+            received.drop_before(base_seq)
+        ReverbManager._RECEIVED_SEQ = seq
+        ReverbManager.REVERB_CONNECTION.send("sync_ack", seq)
+        if ReverbManager.INTERPOLATION is not None and server_time is not None:
+            ReverbManager.INTERPOLATION.on_snapshot(server_time)
+
+        if baseline is not None and base_seq == shown_seq:  # The ReverbObject show the baseline, apply the diff
+            changed = ros.keys()
+            gone = removed
+        else:
+            if shown is None:
+                shown = {}
+                gone = [uid for uid in ReverbManager.objects_snapshot() if uid not in snapshot]
             else:
-                raise ReverbUIDAlreadyInitError(ro)
+                gone = [uid for uid in shown if uid not in snapshot]
+            changed = [uid for uid, pack in snapshot.items() if shown.get(uid) is not pack]
+            baseline = shown
+
+        for uid in gone:
+            try:
+                ReverbManager.remove_reverb_object(uid)
+            except ReverbObjectNotFoundError:
+                pass
+        for uid in changed:
+            ReverbManager._apply_pack(uid, snapshot[uid], baseline.get(uid) if baseline is not None else None)
+
+    @staticmethod
+    @client_event_registry.on_event("server_sync_start", mode=DispatchMode.ORDERED)
+    def on_server_sync_start(clt: socket.socket, seq: int, count: int, server_time: float, *args):
+        """
+        - Called on the 'Client' side
+        - The server is sending the whole snapshot seq in count 'server_sync_chunk' packets (when joining)
+        - The first snapshot of a connection: the seqs of the server (a restarted or another one) start again here
+        :param clt: The client socket
+        :param seq: The sequence number of the snapshot
+        :param count: The number of chunks
+        :param server_time: The server time of the snapshot
+        """
+        ReverbManager._RECEIVED = SnapshotRing(ReverbManager.SNAPSHOT_HISTORY)
+        ReverbManager._RECEIVED_SEQ = None
+        ReverbManager._JOINING = [seq, count, {}, server_time]
+        if count == 0:
+            ReverbManager.on_server_sync_chunk(clt, None)
+
+    @staticmethod
+    @client_event_registry.on_event("server_sync_chunk", mode=DispatchMode.ORDERED)
+    def on_server_sync_chunk(clt: socket.socket, ros: dict[str, list[object]], *args):
+        """
+        - Called on the 'Client' side
+        - A part of the snapshot announced by 'server_sync_start', it is applied when all the parts are received
+        :param clt: The client socket
+        :param ros: Dict[uids:[type, pos, dir, *reverb_args]]
+        """
+        joining = ReverbManager._JOINING
+        if joining is None:
+            return
+        if ros:
+            joining[2].update(ros)
+            joining[1] -= 1
+        if joining[1] <= 0:
+            ReverbManager._JOINING = None
+            ReverbManager.on_server_sync(clt, joining[0], None, joining[2], [], joining[3])
+
+    @staticmethod
+    def _apply_pack(uid, pack, old):
+        """
+        - Create or sync a ReverbObject from its pack
+        :param old: The pack the ReverbObject shows, None if unknown
+        """
+        pos = pack[1]
+        if isinstance(pos, list):  # The snapshot must not be changed through the ReverbObject
+            pos = list(pos)
+        ro = ReverbManager.REVERB_OBJECTS.get(uid)
+        if ro is None:
+            cls = ReverbManager.get_cls_by_type_name(pack[0])
+            ro = cls(pos, *pack[2:])
+            ReverbManager.add_new_reverb_object(ro, uid)
+            ro.sync(pos, *pack[2:])
+        elif old is not None and len(old) == len(pack) and old[3:] == pack[3:]:  # Same reverb_args
+            ro.sync(pos, pack[2])
         else:
-            raise ReverbObjectAlreadyExistError(ro)
+            ro.sync(pos, *pack[2:])
 
-        ReverbManager.print_manager(f"New ReverbObject add into '{ReverbManager.REVERB_SIDE}' side with uid={uid}")
+    @staticmethod
+    @server_event_registry.on_event("client_ready", mode=DispatchMode.ORDERED)
+    def on_client_ready(clt: socket.socket, *args):
+        """
+        - Called on the 'Server' side, when the codec of a new client is chosen
+        - Send it the last snapshot, from the encoded chunks shared by all the new clients, and use it as its
+          baseline: the next server_sync only contain what changed since
+        - A client with an area of interest only gets the part of the snapshot into its area, encoded for it
+        :param clt: The client socket
+        """
+        with ReverbManager._SYNC_LOCK:  # No server_sync between the ring of the client and its join snapshot
+            ReverbManager._send_join(clt)
 
     @staticmethod
-    @client_event_registry.on_event("server_sync")
-    def on_server_sync(clt: socket.socket, ros: dict[str, list[object]], *args):
+    def _send_join(clt: socket.socket):
+        """
+        - Must be called with the _SYNC_LOCK held
+        """
+        connection = ReverbManager.REVERB_CONNECTION
+        seq, world, server_time = ReverbManager._PUBLISHED
+        addr = clt.getpeername()
+        grid = ReverbManager.INTEREST
+        area = ReverbManager.CLIENT_INTERESTS.get(addr) if grid is not None else None
+        if area is None:
+            snapshot = world
+            cache = ReverbManager._JOIN_SNAPSHOT
+        else:  # Like the filter of server_sync, from the snapshot: the sync thread updates the grid meanwhile
+            snapshot = grid.select(world, area.get_center(world), area.radius)
+            cache = EncodedSnapshot(ReverbManager.JOIN_SNAPSHOT_CHUNKS)
+        cache.update(snapshot)
+        frames = cache.frames(connection.codec_of(clt), ReverbManager._encode_chunk)
+        ring = ReverbManager._BASELINES[addr] = SnapshotRing(ReverbManager.SNAPSHOT_HISTORY)
+        ring.add(seq, snapshot)
+        ring.ack(seq)  # Sent reliably, the client will have it
+        connection.send_to(clt, "server_sync_start", seq, len(frames), server_time)
+        connection.send_frames(clt, "server_sync_chunk", frames)
+
+    @staticmethod
+    def _encode_chunk(codec, ros):
+        return Packet.create_packet("server_sync_chunk", ros, codec=codec)
+
+    @staticmethod
+    @server_event_registry.on_event("sync_ack", mode=DispatchMode.INLINE)
+    def on_sync_ack(clt: socket.socket, seq: int, *args):
+        """
+        - Called on the 'Server' side
+        - The client has the snapshot seq, the next server_sync are diffs against it
+        :param clt: The client socket
+        :param seq: The sequence number, None if the client lost its baseline
+        """
+        ring = ReverbManager._BASELINES.get(clt.getpeername())
+        if ring is not None:
+            ring.ack(seq)
+
+    @staticmethod
+    @client_event_registry.on_event("rtt", mode=DispatchMode.INLINE)
+    def on_rtt(clt: socket.socket, rtt: float, rtt_var: float, *args):
         """
         - Called on the 'Client' side
-        - Called when the server sync state of ReverbObject with clients
+        - The server measured the round trip time of the connection again
         :param clt: The client socket
-        :param ros: Dict[uids:dict[var_names:values]]
+        :param rtt: The smoothed round trip time in seconds
+        :param rtt_var: Its variation in seconds
         """
-        for uid, ro_data in ros.items():
-            try:  # try to get a reverb_object
-                ro = ReverbManager.get_reverb_object(uid)
-                ro_data.pop(0)
-                ro.sync(*ro_data)
-            except ReverbObjectNotFoundError:  # create a new one
-                cls = ro_data[0]
-                cls = ReverbManager.get_cls_by_type_name(cls)
-                ro_data.pop(0)
-                ro = cls(*ro_data)
-                ro.sync(*ro_data)
+        if ReverbManager.INTERPOLATION is not None:
+            ReverbManager.INTERPOLATION.on_rtt(rtt, rtt_var)
 
     @staticmethod
-    @server_event_registry.on_event("calling_server_computing")
-    def on_calling_server_computing(clt: socket.socket, uid: str, func_name: str, *args):
+    @client_event_registry.on_event("rpc_results", mode=DispatchMode.INLINE)
+    def on_rpc_results(clt: socket.socket, results: list, *args):
+        """
+        - Called on the 'Client' side
+        - Resolve the futures of the compute_server calls
+        :param clt: The client socket
+        :param results: List of [request id, ok, result or error message]
+        """
+        if ReverbManager.RPC is not None:
+            ReverbManager.RPC.resolve(results)
+
+    @staticmethod
+    @client_event_registry.on_event("disconnection")
+    def on_rpc_disconnection(clt: socket.socket, *args):
+        """
+        - Called on the 'Client' side
+        - No result will come, fail the waiting compute_server calls
+        """
+        if ReverbManager.RPC is not None:
+            ReverbManager.RPC.cancel_all()
+
+    @staticmethod
+    @server_event_registry.on_event("rpc_batch", mode=DispatchMode.ORDERED)
+    def on_rpc_batch(clt: socket.socket, calls: list, *args):
         """
         - Called on the 'Server' side
-        - Called when a ReverbObject send data to be computes by the server (like movements, interactions, etc.)
+        - Called when a client calls server_method of ReverbObject (like movements, interactions, etc.)
+        - The results asked are sent back in one 'rpc_results' packet
         :param clt: The client socket
-        :param uid: The uid of the ReverbObject
-        :param func_name: The function name
-        :param args: Params of the function
+        :param calls: List of [uid, method id, request id or None, args]
         """
-        ro = ReverbManager.get_reverb_object(uid)
-        try:
-            func = getattr(ro, func_name)
-            if args == ():
-                func()
-            else:
-                func(*args)
-        except AttributeError:
-            raise NameError(f"The {func_name=} wasn't found into the ReverbObject!")
+        if not isinstance(calls, list):
+            ReverbManager.print_manager("The client: %s sent a malformed rpc_batch", clt.getpeername(), level=WARNING)
+            return
+        refused = []
+        if len(calls) > ReverbManager.MAX_RPC_BATCH:  # The RateLimit counts packets, not calls
+            Metrics.count("rpc_calls_refused", None, len(calls) - ReverbManager.MAX_RPC_BATCH)
+            refused = [[request_id, False, "Too many calls in one batch"] for request_id in
+                       map(ReverbManager._rpc_request_id, calls[ReverbManager.MAX_RPC_BATCH:]) if request_id is not None]
+            calls = calls[:ReverbManager.MAX_RPC_BATCH]
+        checked = []  # The zones and the workers route the calls by uid, they must be well formed
+        for call in calls:
+            try:
+                checked.append(ReverbManager._check_rpc_call(call))
+            except ReverbRPCMalformedError as e:
+                Metrics.count("rpc_calls_refused")
+                request_id = ReverbManager._rpc_request_id(call)
+                if request_id is not None:
+                    refused.append([request_id, False, f"{e.__class__.__name__}: {e}"])
+                else:
+                    ReverbManager.print_manager("The client: %s sent a malformed call: %s", clt.getpeername(), e,
+                                                level=WARNING)
+        calls = checked
+        if ReverbManager.ZONE is not None:  # The calls to the mirrors are run by the server that owns them
+            calls = ReverbManager.ZONE.route_calls(clt, calls)
+        if ReverbManager.WORKERS is not None:  # Run by the worker processes that own the ReverbObject
+            results = ReverbManager.WORKERS.call(calls)
+        else:
+            results = ReverbManager.run_server_methods(calls)
+        results.extend(refused)
+        if results:
+            ReverbManager.REVERB_CONNECTION.send_to(clt, "rpc_results", results)
+
+    @staticmethod
+    def run_server_methods(calls):
+        """
+        - Called on the 'Server' side
+        :param calls: List of [uid, method id, request id or None, args]
+        :return: List of [request id, ok, result or error message] of the calls with a request id
+        """
+        results = []
+        for call in calls:
+            request_id = ReverbManager._rpc_request_id(call)
+            try:
+                uid, method_id, request_id, call_args = ReverbManager._check_rpc_call(call)
+                ro = ReverbManager.get_reverb_object(uid)
+                table = ro._RPC_TABLE
+                if not 0 <= method_id < len(table):
+                    raise ReverbRPCNotAllowedError(ro.__class__, method_id)
+                value = table[method_id](ro, *call_args)
+                if request_id is not None:
+                    results.append([request_id, True, value])
+            except Exception as e:
+                if request_id is not None:
+                    results.append([request_id, False, f"{e.__class__.__name__}: {e}"])
+                elif isinstance(e, ReverbRPCMalformedError):
+                    ReverbManager.print_manager("%s", e, level=WARNING)
+                else:
+                    manager_logger.exception("An error occurred in the server_method %s of the ReverbObject %s:",
+                                             call[1], call[0])
+        return results
+
+    @staticmethod
+    def _check_rpc_call(call):
+        """
+        :param call: A call received: [uid, method id, request id or None, args]
+        :return: The call
+        :raise ReverbRPCMalformedError: If the call is not well formed
+        """
+        if not isinstance(call, list) or len(call) != 4:
+            raise ReverbRPCMalformedError(call)
+        uid, method_id, request_id, call_args = call
+        if not isinstance(uid, str) or type(method_id) is not int or not isinstance(call_args, list) or \
+                (request_id is not None and type(request_id) is not int):
+            raise ReverbRPCMalformedError(call)
+        return call
+
+    @staticmethod
+    def _rpc_request_id(call):
+        """
+        :param call: A call received, maybe malformed
+        :return: The request id to answer to, None if there is none
+        """
+        if isinstance(call, list) and len(call) == 4 and type(call[2]) is int:
+            return call[2]
+        return None
+
+
+Metrics.set_gauge("reverb_objects", lambda: len(ReverbManager.REVERB_OBJECTS))
+Metrics.set_gauge("dirty_objects", lambda: len(ReverbManager.DIRTY_OBJECTS))
@@ -0,0 +1,358 @@
+import asyncio
+
+from reverb_base import *
+
+
+class ReverbLoop:
+    """
+    - This class is static !
+    - Run the asyncio event loop shared by all AsyncServer and AsyncClient into one daemon thread
+    """
+    LOOP: asyncio.AbstractEventLoop = None
+    THREAD: threading.Thread = None
+    _LOCK = threading.Lock()
+
+    @staticmethod
+    def get_loop():
+        """
+        - Start the loop thread the first time it is called
+        :return: The running event loop
+        """
+        with ReverbLoop._LOCK:
+            if ReverbLoop.LOOP is None or ReverbLoop.LOOP.is_closed():
+                ReverbLoop.LOOP = asyncio.new_event_loop()
+                ReverbLoop.THREAD = threading.Thread(target=ReverbLoop.LOOP.run_forever, daemon=True)
+                ReverbLoop.THREAD.start()
+            return ReverbLoop.LOOP
+
+    @staticmethod
+    def in_loop_thread():
+        """
+        :return: If the caller is running on the loop thread
+        """
+        return ReverbLoop.THREAD is not None and threading.current_thread() is ReverbLoop.THREAD
+
+    @staticmethod
+    def call(callback, *args):
+        """
+        - Call a function on the loop thread, directly if we are already on it
+        :param callback: The function
+        :param args: Args of the function
+        """
+        if ReverbLoop.in_loop_thread():
+            callback(*args)
+        else:
+            ReverbLoop.get_loop().call_soon_threadsafe(callback, *args)
+
+    @staticmethod
+    def run(coro, timeout=None):
+        """
+        - Run a coroutine on the loop and wait for its result
+        - Must not be called from the loop thread
+        :param coro: The coroutine
+        :param timeout: Max time to wait in seconds
+        :return: The result of the coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(coro, ReverbLoop.get_loop()).result(timeout)
+
+
+class AsyncConnection:
+    def __init__(self, transport: asyncio.Transport):
+        """
+        - Socket-like view of an asyncio connection
+        - This is what the events handlers receive instead of a socket.socket
+        :param transport: The asyncio transport of the connection
+        """
+        self.transport = transport
+        self._peername = transport.get_extra_info("peername")
+        self.paused = False  # The transport buffer is full
+        self.on_resume = None  # Called on the loop when the transport buffer is emptied
+        self.on_resume_reading = None  # Called on the loop when the reading is resumed after a throttle
+
+    def getpeername(self):
+        """
+        :return: The address of the peer
+        """
+        return self._peername
+
+    def sendall(self, data: bytes):
+        """
+        - Queue the data into the transport, never block
+        - Can be called from any thread
+        :param data: The encoded packet
+        """
+        ReverbLoop.call(self._write, data)
+
+    send = sendall
+
+    def close(self):
+        """
+        - Close the connection after the queued data is sent
+        - Can be called from any thread
+        """
+        ReverbLoop.call(self.transport.close)
+
+    def _write(self, data):
+        if not self.transport.is_closing():
+            self.transport.write(data)
+
+
+class _ReverbProtocol(asyncio.BufferedProtocol):
+    def __init__(self, buffer_size, on_connection, on_frame, on_connection_lost, max_frame_size=None,
+                 on_frame_too_large=None):
+        """
+        - Protocol shared by AsyncServer and AsyncClient
+        - Cut the stream into frames with a FrameBuffer and give them to on_frame
+        """
+        self._frames = FrameBuffer(buffer_size, max_frame_size)
+        self._on_frame_too_large = on_frame_too_large
+        self._on_connection = on_connection
+        self._on_frame = on_frame
+        self._on_connection_lost = on_connection_lost
+        self._pending = deque()  # Frames already read, waiting for the end of a throttle
+        self.connection: AsyncConnection = None
+
+    def connection_made(self, transport):
+        self.connection = AsyncConnection(transport)
+        self.connection.on_resume_reading = self._process_frames
+        self._on_connection(self.connection)
+
+    def pause_writing(self):
+        self.connection.paused = True
+
+    def resume_writing(self):
+        self.connection.paused = False
+        if self.connection.on_resume is not None:
+            self.connection.on_resume(self.connection)
+
+    def get_buffer(self, sizehint):
+        return self._frames.get_buffer()
+
+    def buffer_updated(self, nbytes):
+        try:
+            frames = self._frames.buffer_updated(nbytes)
+        except ReverbFrameTooLargeError as e:
+            if self._on_frame_too_large is not None:
+                self._on_frame_too_large(self.connection, e)
+            self.connection.transport.close()
+            return
+        self._pending.extend(frames)
+        self._process_frames()
+
+    def _process_frames(self):
+        """
+        - Give the frames to on_frame until the reading is paused by a throttle, the others wait for its end
+        """
+        transport = self.connection.transport
+        pending = self._pending
+        while pending and transport.is_reading():
+            if not self._on_frame(self.connection, pending.popleft()):
+                pending.clear()
+                transport.close()
+                break
+
+    def eof_received(self):
+        return False  # Close the transport
+
+    def connection_lost(self, exc):
+        self._on_connection_lost(self.connection, exc)
+
+
+class AsyncServer(Server):
+    def __init__(self, host="", port=8080, buffer_size=65536, codecs=("json", "binary"), max_queue=64,
+                 slow_policy=SlowConsumerPolicy.COALESCE, udp=False, udp_max_datagram=1200, compression=None,
+                 compress_threshold=512, max_frame_size=1 << 20, rate_limit: RateLimit = None, heartbeat=5.0,
+                 idle_timeout=30.0, max_queue_bytes=16 << 20):
+        """
+        - Drop-in replacement of Server
+        - All the connections are handled by the one ReverbLoop event loop instead of one thread per client
+        - The sockets in the events handlers are AsyncConnection
+        - The outbound queues are drained into the transports until their buffer is full
+        """
+        super().__init__(host, port, buffer_size, codecs, max_queue, slow_policy, udp=udp,
+                         udp_max_datagram=udp_max_datagram, compression=compression,
+                         compress_threshold=compress_threshold, max_frame_size=max_frame_size, rate_limit=rate_limit,
+                         heartbeat=heartbeat, idle_timeout=idle_timeout, max_queue_bytes=max_queue_bytes)
+        self._aio_server: asyncio.AbstractServer = None
+
+    def start_server(self):
+        """
+        Start the server
+        """
+        Server.print_server("Starting server...")
+        self.server.bind(("", self.port))
+        self.server.listen()
+        self.server.setblocking(False)
+
+        self.is_online = True
+        self.register_gauges()
+        if self.timers is not None:
+            self.timers.start()
+        self._aio_server = ReverbLoop.run(self._start())
+        if self.udp_enabled:
+            self._start_udp()
+        Server.print_server("Server online ! Waiting for clients on %s:%s...", self.host, self.port)
+
+    async def _start(self):
+        loop = asyncio.get_running_loop()
+        return await loop.create_server(self._create_protocol, sock=self.server)
+
+    def _create_protocol(self):
+        return _ReverbProtocol(self.buffer_size, self._on_connection, self._on_frame, self._on_connection_lost,
+                               self.max_frame_size,
+                               lambda connection, e: self._on_frame_too_large(connection.getpeername(), e))
+
+    def _on_connection(self, connection: AsyncConnection):
+        addr = connection.getpeername()
+        connection.on_resume = self._drain
+        self._track_client(addr)
+        self.outbound[addr] = self._create_outbound_queue()
+        self.clients[addr] = connection
+        server_event_registry.trigger("client_connection", connection)
+
+    def _on_frame(self, connection: AsyncConnection, frame: bytes):
+        return self._handle_frame(connection, connection.getpeername(), frame)
+
+    def _on_connection_lost(self, connection: AsyncConnection, exc):
+        addr = connection.getpeername()
+        self._forget_client(addr)
+        if exc is not None:
+            Server.print_server("The client at add: %s has been disconnected ! This is an anomaly.", addr, level=WARNING)
+        Server.print_server("The client: %s is disconnect !", addr)
+
+    def stop_server(self, flush_timeout=1.0):
+        """
+        Stop the server
+        :param flush_timeout: Max time to wait for the waiting frames to be sent
+        """
+        if self._aio_server is not None:  # Stop accepting clients
+            ReverbLoop.call(self._aio_server.close)
+            self._aio_server = None
+        super().stop_server(flush_timeout)
+
+    def _throttle(self, connection: AsyncConnection, wait):
+        """
+        - Stop reading a client for wait seconds without blocking the event loop
+        """
+        transport = connection.transport
+        if transport.is_reading():
+            transport.pause_reading()
+            asyncio.get_running_loop().call_later(wait, self._resume_reading, connection)
+
+    @staticmethod
+    def _resume_reading(connection: AsyncConnection):
+        if not connection.transport.is_closing():
+            connection.transport.resume_reading()
+            connection.on_resume_reading()
+
+    def _accept_clients(self):
+        pass  # Done by the event loop
+
+    def _write_clients(self):
+        pass  # Done by the event loop
+
+    def _wake_writer(self, addr):
+        client = self.clients.get(addr)
+        if client is not None:
+            ReverbLoop.call(self._drain, client)
+
+    def _drain(self, connection: AsyncConnection):
+        """
+        Move the waiting frames of a client into its transport, until the transport asks to pause
+        """
+        queue = self.outbound.get(connection.getpeername())
+        if queue is None:
+            return
+        while not connection.paused and not connection.transport.is_closing():
+            data = queue.peek()
+            if data is None:
+                break
+            connection.transport.write(data)
+            queue.advance(len(data))
+
+    def _drop_client(self, addr):
+        self.outbound.pop(addr, None)
+        client = self.clients.get(addr)
+        if client is not None:
+            ReverbLoop.call(client.transport.abort)
+
+
+class AsyncClient(Client):
+    def __init__(self, ip="127.0.0.1", port=8080, buffer_size=65536, codecs=("json", "binary"), udp=False,
+                 compressions=("zlib",), idle_timeout=None):
+        """
+        - Drop-in replacement of Client
+        - The connection is handled by the ReverbLoop event loop instead of a listening thread
+        - After connect, self.client is an AsyncConnection
+        """
+        super().__init__(ip, port, buffer_size, codecs, udp, compressions, idle_timeout)
+        self._last_frame = 0.0
+
+    def connect(self):
+        """
+        Call to connect to the server
+        """
+        try:
+            self.client.connect((self.ip, self.port))
+            self.client.setblocking(False)
+            self.is_connected = True
+
+            _, protocol = ReverbLoop.run(self._start())
+            self.client = protocol.connection
+            self._on_connected()
+        except ConnectionRefusedError:
+            Client.print_client("The server is unreachable !")
+        except socket.gaierror:
+            Client.print_client("Error with host name or IP unfound")
+        except TimeoutError:
+            Client.print_client("Connexion TimeOut !")
+
+    async def _start(self):
+        loop = asyncio.get_running_loop()
+        return await loop.create_connection(self._create_protocol, sock=self.client)
+
+    def _create_protocol(self):
+        return _ReverbProtocol(self.buffer_size, self._on_connection, self._on_frame, self._on_connection_lost)
+
+    def _on_connection(self, connection: AsyncConnection):
+        self._last_frame = time.monotonic()
+        if self.idle_timeout is not None:
+            asyncio.get_running_loop().call_later(self.idle_timeout, self._check_idle, connection)
+
+    def _check_idle(self, connection: AsyncConnection):
+        """
+        - Close the connection if the server is silent for idle_timeout, the frames don't move the timer
+        """
+        if connection.transport.is_closing():
+            return
+        idle = time.monotonic() - self._last_frame
+        if idle >= self.idle_timeout:
+            Client.print_client("The server is silent for %ss ! Closing...", self.idle_timeout, level=WARNING)
+            connection.transport.abort()
+            return
+        asyncio.get_running_loop().call_later(self.idle_timeout - idle, self._check_idle, connection)
+
+    def _on_frame(self, connection: AsyncConnection, frame: bytes):
+        self._last_frame = time.monotonic()
+        return self._handle_frame(frame)
+
+    def _close(self):
+        self.client.close()  # After the farewell queued into the transport
+
+    def _on_connection_lost(self, connection: AsyncConnection, exc):
+        if self.udp is not None:
+            self.udp.close()
+        with self._disconnect_lock:
+            if not self.is_connected:  # Disconnected by disconnect
+                return
+            self.is_connected = False
+        if exc is not None:
+            Client.print_client("Connexion lost !")
+        client_event_registry.trigger("disconnection", self.client)
+        Client.print_client("Client close and disconnect from the server !")
+
+    def listen(self):
+        """
+        Nothing to do, the event loop is listening for us
+        """
+        pass
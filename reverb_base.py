@@ -1,24 +1,174 @@
 import json
+import os
+import selectors
 import socket
+import struct
 import threading
+import time
+import traceback
+from collections import deque
+from enum import Enum
 from json import JSONDecodeError
 from urllib.request import parse_keqv_list
 from warnings import warn
 
-from colorama import Fore, Back, Style
+from reverb_codec import *
+from reverb_errors import *
+from reverb_metrics import *
+from reverb_record import *
+from reverb_timers import *
+
+
+class DispatchMode(Enum):
+    INLINE = 1  # Run the handlers on the receiving thread
+    POOL = 2  # Run the handlers on the bounded worker pool, in any order
+    ORDERED = 3  # Run the handlers on the worker pool, one at a time and in order for each socket
+
+
+class OverflowPolicy(Enum):
+    DROP_NEWEST = 1  # Drop the incoming packet
+    DROP_OLDEST = 2  # Drop the oldest waiting packet of the same event
+    BLOCK = 3  # Block the receiving thread until there is room
+
+
+class EventDispatch:
+    def __init__(self, mode: DispatchMode, max_queue: int, overflow: OverflowPolicy):
+        """
+        - How the handlers of an event are run
+        :param mode: The DispatchMode
+        :param max_queue: Max number of waiting calls of the event (in ORDERED mode: of the socket queue)
+        :param overflow: What to do when the queue is full
+        """
+        self.mode = mode
+        self.max_queue = max_queue
+        self.overflow = overflow
+
+
+class _Dispatcher:
+    def __init__(self, workers: int):
+        """
+        - Bounded pool of worker threads shared by all the events of a registry
+        - Hold the waiting calls of POOL events and the per-socket queues of ORDERED events
+        :param workers: The number of worker threads
+        """
+        self.workers = workers
+        self._threads = []
+        self._cond = threading.Condition()
+        self._ready = deque()  # (event_name, handlers, args) or the key of an ordered queue to drain
+        self._ordered = {}  # socket -> deque of (event_name, handlers, args)
+        self._pending = {}  # event_name -> number of waiting POOL calls
+
+    def submit(self, event_name, handlers, args, dispatch: EventDispatch):
+        """
+        Queue a call of the handlers
+        :return: False if the call was dropped
+        """
+        with self._cond:
+            self._start_workers()
+            if dispatch.mode == DispatchMode.ORDERED:
+                key = args[0]
+                queue = self._ordered.get(key)
+                if queue is None:
+                    queue = self._ordered[key] = deque()
+                    self._ready.append(key)  # The queue is not drained by any worker yet
+                    self._cond.notify()
+                if not self._make_room(event_name, queue, lambda: len(queue), dispatch):
+                    return False
+                queue.append((event_name, handlers, args))
+            else:
+                if not self._make_room(event_name, self._ready, lambda: self._pending.get(event_name, 0), dispatch):
+                    return False
+                self._pending[event_name] = self._pending.get(event_name, 0) + 1
+                self._ready.append((event_name, handlers, args))
+                self._cond.notify()
+            return True
+
+    def _make_room(self, event_name, queue, count, dispatch: EventDispatch):
+        while count() >= dispatch.max_queue:
+            if dispatch.overflow == OverflowPolicy.BLOCK:
+                self._cond.wait()
+            elif dispatch.overflow == OverflowPolicy.DROP_OLDEST:
+                for job in queue:
+                    if isinstance(job, tuple) and job[0] == event_name:
+                        queue.remove(job)
+                        if queue is self._ready:
+                            self._pending[event_name] -= 1
+                        return True
+                return False
+            else:
+                return False
+        return True
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._ready:
+                    self._cond.wait()
+                job = self._ready.popleft()
+                if isinstance(job, tuple):
+                    self._pending[job[0]] -= 1
+                self._cond.notify_all()  # Wake up the BLOCK policy
+            if isinstance(job, tuple):
+                EventRegistry.run_handlers(*job)
+            else:
+                self._drain(job)
+
+    def _drain(self, key):
+        """
+        Run the calls of one ordered queue, one at a time
+        """
+        for _ in range(64):  # Give the worker back after a while so a busy socket can't starve the others
+            with self._cond:
+                queue = self._ordered[key]
+                if not queue:
+                    del self._ordered[key]
+                    return
+                job = queue.popleft()
+                self._cond.notify_all()
+            EventRegistry.run_handlers(*job)
+        with self._cond:
+            self._ready.append(key)
+            self._cond.notify()
+
+    def queue_depth(self, key=None):
+        """
+        :param key: A socket to get the depth of its ordered queue
+        :return: The number of waiting calls
+        """
+        with self._cond:
+            if key is None:
+                return sum(self._pending.values()) + sum(len(queue) for queue in self._ordered.values())
+            return len(self._ordered.get(key, ()))
 
 
 class EventRegistry:
-    def __init__(self):
+    def __init__(self, mode=DispatchMode.POOL, workers=4, max_queue=1024, overflow=OverflowPolicy.DROP_NEWEST):
         """
         A Class that store events and handle them !
+        :param mode: The default DispatchMode of the events
+        :param workers: Number of threads of the worker pool
+        :param max_queue: The default max number of waiting calls of an event
+        :param overflow: The default OverflowPolicy
         """
         self._events = {}
+        self._dispatch = {}
+        self.default_dispatch = EventDispatch(mode, max_queue, overflow)
+        self.dropped = {}  # event_name -> number of calls dropped by the OverflowPolicy
+        self._dispatcher = _Dispatcher(workers)
 
-    def on_event(self, event_name):
+    def on_event(self, event_name, mode: DispatchMode = None, max_queue: int = None, overflow: OverflowPolicy = None):
         """
         Simple decorator to trigger events
         :param event_name: The name of the event
+        :param mode: The DispatchMode of the event, see set_dispatch
+        :param max_queue: Max number of waiting calls, see set_dispatch
+        :param overflow: The OverflowPolicy, see set_dispatch
         :return: The decorator
         """
 
@@ -26,10 +176,32 @@ class EventRegistry:
             if event_name not in self._events:
                 self._events[event_name] = []
             self._events[event_name].append(func)
+            if mode is not None or max_queue is not None or overflow is not None:
+                self.set_dispatch(event_name, mode, max_queue, overflow)
             return func
 
         return decorator
 
+    def set_dispatch(self, event_name, mode: DispatchMode = None, max_queue: int = None, overflow: OverflowPolicy = None):
+        """
+        - Choose how the handlers of an event are run
+        - Let an arg to None to keep the default of the registry
+        :param event_name: The name of the event
+        :param mode: INLINE, POOL or ORDERED
+        :param max_queue: Max number of waiting calls of the event (in ORDERED mode: of the socket queue)
+        :param overflow: What to do with a new call when the queue is full
+        """
+        default = self.default_dispatch
+        self._dispatch[event_name] = EventDispatch(mode or default.mode, max_queue or default.max_queue,
+                                                   overflow or default.overflow)
+
+    def get_dispatch(self, event_name):
+        """
+        :param event_name: The name of the event
+        :return: The EventDispatch of the event
+        """
+        return self._dispatch.get(event_name, self.default_dispatch)
+
     def get(self, event_name):
         """
         Get an event by his name
@@ -44,18 +216,37 @@ class EventRegistry:
         :param sock: the reference of the outcoming socket packet's
         :param event_name: The name of the event
         """
-        handlers = self._events.get(event_name, [])  # Check if the event name contain functions or not
-        if handlers:
-            print("oergehr")
-            for handler in handlers:
-                try:
-                    threading.Thread(target=handler, args=(sock, *args), daemon=True).start()
-                except TypeError:
-                    threading.Thread(target=handler, args=sock, daemon=True).start()
-        else:
+        handlers = self._events.get(event_name)  # Check if the event name contain functions or not
+        if not handlers:
             warn(f"The handler for '{event_name}' is not found ! It may be normal, ignore then.")
+            return
+
+        dispatch = self._dispatch.get(event_name, self.default_dispatch)
+        if dispatch.mode == DispatchMode.INLINE:
+            EventRegistry.run_handlers(event_name, handlers, (sock, *args))
+        elif not self._dispatcher.submit(event_name, handlers, (sock, *args), dispatch):
+            self.dropped[event_name] = self.dropped.get(event_name, 0) + 1
 
-        print("FINISHED TRIGGER")
+    @staticmethod
+    def run_handlers(event_name, handlers, args):
+        """
+        Run the handlers of an event, an error in a handler doesn't stop the others
+        """
+        start = Metrics.clock()
+        for handler in handlers:
+            try:
+                handler(*args)
+            except Exception:
+                reverb_logger.exception("An error occurred in the handler '%s' of the event '%s':",
+                                        handler.__name__, event_name)
+        Metrics.observe_since("handler_time", start, event_name)
+
+    def queue_depth(self, sock=None):
+        """
+        :param sock: A socket to get only the depth of its ordered queue
+        :return: The number of calls waiting for a worker
+        """
+        return self._dispatcher.queue_depth(sock)
 
     def all_events(self):
         """
@@ -69,39 +260,409 @@ server_event_registry = EventRegistry()
 
 
 class Packet:
+    HEADER = struct.Struct("!I")  # Length prefix of every frame sent on the stream
+    DEFAULT_CODEC = JsonCodec()  # Used until a codec is negotiated
+
     @staticmethod
-    def create_packet(name: str, *content):
+    def create_packet(name: str, *content, codec: PacketCodec = None):
         """
         Create a packet and encode it
         :param name: Name of the packet/event
         :param content: The contents to send
-        :return: An encoded packet ready to be sent :)
+        :param codec: The codec of the connection, JSON by default
+        :return: An encoded and framed packet ready to be sent :)
+        """
+        return Packet.frame(Packet.encode(name, content, codec))
+
+    @staticmethod
+    def encode(name: str, contents, codec: PacketCodec = None):
+        """
+        :return: The packet encoded with the codec, JSON by default, without the length prefix
         """
-        return json.dumps({"name": name, "contents": content}).encode()
+        start = Metrics.clock()
+        payload = (codec or Packet.DEFAULT_CODEC).encode(name, contents)
+        Metrics.observe_since("encode_time", start, name)
+        return payload
 
     @staticmethod
-    def decode_packet(packet: bytes):
+    def frame(payload: bytes):
+        """
+        Prefix a payload with its length so the receiver can cut the stream back into packets
+        :param payload: The encoded packet
+        :return: The frame
+        """
+        return Packet.HEADER.pack(len(payload)) + payload
+
+    @staticmethod
+    def decode_packet(packet: bytes, codec: PacketCodec = None):
         """
         Decode the packet from a bytes
-        :param packet: The encoded packet
+        :param packet: The encoded packet (the payload of a frame, without the length prefix)
+        :param codec: The negotiated codec of the connection, the JSON packets are always decoded
         :return: The name/event and the contents
         """
+        if codec is None or not packet or not codec.accepts(packet[0]):
+            codec = Packet.DEFAULT_CODEC
+        start = Metrics.clock()
         try:
-            decoded_packet = json.loads(packet.decode())
-            return decoded_packet["name"], decoded_packet["contents"]
-        except JSONDecodeError:
-            print(f"An error occurred with this packet: {packet.decode()}")
+            decoded = codec.decode(packet)
+        except (JSONDecodeError, UnicodeDecodeError, ValueError, IndexError, struct.error):
+            reverb_logger.warning("An error occurred with this packet: %r", bytes(packet))
+            Metrics.count("invalid_packets")
         except KeyError:
-            print(f"The packet is not valid ! A valid packet must have a 'name' and a 'contents' argument !")
+            reverb_logger.warning("The packet is not valid ! A valid packet must have a 'name' and a 'contents' argument !")
+            Metrics.count("invalid_packets")
+        else:
+            Metrics.observe_since("decode_time", start, decoded[0])
+            return decoded
+
+    @staticmethod
+    def create_codec(name: str, *args):
+        """
+        :param name: The name of the codec
+        :param args: The args sent by the server with 'codec_select'
+        :return: A codec instance
+        """
+        return CODECS[name](*args)
+
+
+class FrameBuffer:
+    def __init__(self, buffer_size=65536, max_frame_size=None):
+        """
+        - Receive buffer of a connection
+        - Reassemble the length-prefixed frames split or merged by TCP
+        :param buffer_size: The size of the reusable buffer used by each recv_into
+        :param max_frame_size: Bigger frames raise ReverbFrameTooLargeError as soon as their header is read, None for
+                               no limit
+        """
+        self.max_frame_size = max_frame_size
+        self._chunk = bytearray(buffer_size)
+        self._view = memoryview(self._chunk)
+        self._pending = bytearray()
+
+    def recv(self, sock: socket.socket):
+        """
+        Read what is available on the socket into the reusable buffer
+        :param sock: The socket to read
+        :return: The list of all complete frames payloads, or None if the peer closed the connection
+        """
+        size = sock.recv_into(self._view)
+        if not size:
+            return None
+        return self.buffer_updated(size)
+
+    def get_buffer(self):
+        """
+        :return: The reusable buffer where the next read has to be written
+        """
+        return self._view
+
+    def buffer_updated(self, size):
+        """
+        Call after writing into the buffer given by get_buffer
+        :param size: The number of bytes written
+        :return: The list of all complete frames payloads (can be empty)
+        """
+        return self.feed(self._view[:size])
+
+    def feed(self, data):
+        """
+        Add raw bytes from the stream and cut them into frames
+        :param data: The bytes read from the stream
+        :return: The list of all complete frames payloads (can be empty)
+        """
+        pending = self._pending
+        pending += data
+        frames = []
+        offset = 0
+        header_size = Packet.HEADER.size
+        while len(pending) - offset >= header_size:
+            size, = Packet.HEADER.unpack_from(pending, offset)
+            if self.max_frame_size is not None and size > self.max_frame_size:  # Never buffered
+                raise ReverbFrameTooLargeError(size, self.max_frame_size)
+            end = offset + header_size + size
+            if len(pending) < end:  # The end of the frame is not arrived yet
+                break
+            frames.append(bytes(pending[offset + header_size:end]))
+            offset = end
+        if offset:
+            del pending[:offset]
+        return frames
+
+    def pending_size(self):
+        """
+        :return: The number of bytes waiting for the end of their frame
+        """
+        return len(self._pending)
+
+
+class Datagram:
+    """
+    - Format of the optional UDP channel
+    - Each datagram is a sequence number followed by an encoded packet (without length prefix)
+    """
+    HELLO = b"RVBH"  # Start of the handshake datagram sent by the client, followed by the token
+    TOKEN_SIZE = 8
+    HEADER = struct.Struct("!I")  # Sequence number
+
+    @staticmethod
+    def is_newer(seq, last):
+        """
+        :param seq: The sequence number of a datagram
+        :param last: The sequence number of the newest datagram received, None if there is none
+        :return: If seq is after last (the sequence numbers wrap around)
+        """
+        return last is None or 0 < ((seq - last) & 0xFFFFFFFF) < 0x80000000
+
+
+class SlowConsumerPolicy(Enum):
+    DROP_STALE = 1  # Drop the oldest waiting sync frame
+    COALESCE = 2  # Drop all the waiting frames of the same sync event, only the latest is sent
+    DISCONNECT = 3  # Disconnect the client
+
+
+class FloodPolicy(Enum):
+    THROTTLE = 1  # Stop reading the client until it is under its rate again
+    DROP = 2  # Drop the packets over the rate
+    DISCONNECT = 3  # Disconnect the client
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "_last")
+
+    def __init__(self, rate, burst):
+        """
+        - Refilled with rate tokens per second, up to burst tokens
+        :param rate: Tokens per second
+        :param burst: Max tokens, the burst allowed after a quiet time
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._last = time.monotonic()
+
+    def take(self, count=1):
+        """
+        :param count: The tokens needed
+        :return: 0 if they are taken, else the time to wait in seconds for them (nothing is taken)
+        """
+        now = time.monotonic()
+        tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+        if tokens >= count:
+            self.tokens = tokens - count
+            return 0
+        self.tokens = tokens
+        return (min(count, self.burst) - tokens) / self.rate
+
+
+class RateLimit:
+    def __init__(self, packets_per_s=None, bytes_per_s=None, burst=2.0, events=None, policy=FloodPolicy.THROTTLE,
+                 max_violations=None):
+        """
+        - The limits of the packets of each client, checked by the server before decoding and dispatching them
+        :param packets_per_s: Max packets per second of a client, None for no limit
+        :param bytes_per_s: Max bytes per second of a client, None for no limit
+        :param burst: The burst allowed, in seconds of rate
+        :param events: Dict event name -> max packets per second of a client, these packets over the rate are always
+                       dropped (they are already decoded) or disconnect the client with DISCONNECT
+        :param policy: The FloodPolicy of a client over its packets_per_s or bytes_per_s
+        :param max_violations: Disconnect a client after this number of dropped packets, None to never
+        """
+        self.packets_per_s = packets_per_s
+        self.bytes_per_s = bytes_per_s
+        self.burst = burst
+        self.events = events or {}
+        self.policy = policy
+        self.max_violations = max_violations
+
+
+class ClientLimiter:
+    ADMIT = 1
+    DROP = 2
+    DISCONNECT = 3
+
+    def __init__(self, limit: RateLimit):
+        """
+        - The token buckets of one client
+        :param limit: The RateLimit of the server
+        """
+        self.limit = limit
+        self.packets = TokenBucket(limit.packets_per_s, limit.packets_per_s * limit.burst) if limit.packets_per_s else None
+        self.bytes = TokenBucket(limit.bytes_per_s, limit.bytes_per_s * limit.burst) if limit.bytes_per_s else None
+        self.events = {name: TokenBucket(rate, rate * limit.burst) for name, rate in limit.events.items()}
+        self.violations = 0  # Packets dropped
+
+    def check_frame(self, size):
+        """
+        - Called before decoding a frame
+        :param size: The size of the frame
+        :return: ADMIT, DROP or DISCONNECT, and the time the reading of the client has to be paused (THROTTLE)
+        """
+        wait = 0
+        if self.packets is not None:
+            wait = self.packets.take()
+        if self.bytes is not None and not wait:
+            wait = self.bytes.take(size)
+        if not wait:
+            return ClientLimiter.ADMIT, 0
+        policy = self.limit.policy
+        if policy == FloodPolicy.THROTTLE:  # Admitted, but nothing more is read meanwhile
+            if self.packets is not None:
+                self.packets.tokens -= 1
+            if self.bytes is not None:
+                self.bytes.tokens -= min(size, self.bytes.burst)
+            return ClientLimiter.ADMIT, wait
+        if policy == FloodPolicy.DISCONNECT:
+            return ClientLimiter.DISCONNECT, 0
+        return self._violation(), 0
+
+    def check_event(self, event_name):
+        """
+        - Called after decoding a packet, before dispatching it
+        :return: ADMIT, DROP or DISCONNECT
+        """
+        bucket = self.events.get(event_name)
+        if bucket is None or not bucket.take():
+            return ClientLimiter.ADMIT
+        if self.limit.policy == FloodPolicy.DISCONNECT:
+            return ClientLimiter.DISCONNECT
+        return self._violation()
+
+    def _violation(self):
+        self.violations += 1
+        max_violations = self.limit.max_violations
+        if max_violations is not None and self.violations > max_violations:
+            return ClientLimiter.DISCONNECT
+        return ClientLimiter.DROP
+
+
+class OutboundQueue:
+    def __init__(self, max_depth=64, policy=SlowConsumerPolicy.COALESCE, droppable=("server_sync",),
+                 max_bytes=16 << 20):
+        """
+        - Bounded queue of the encoded frames waiting to be sent to one client
+        - The same frame bytes are shared by all the queues of a broadcast
+        - Only the frames of the droppable events (state syncs) can be dropped, the others are always kept
+        - Whatever the policy, the client is disconnected when max_bytes or 16 * max_depth frames are waiting: a client
+          that stops reading can't grow the memory of the server with the frames that are never dropped
+        :param max_depth: Number of waiting frames from which the policy is applied
+        :param policy: The SlowConsumerPolicy
+        :param droppable: The events names of the frames that can be dropped
+        :param max_bytes: Max bytes waiting, None for no limit
+        """
+        self.max_depth = max_depth
+        self.policy = policy
+        self.droppable = droppable
+        self.max_bytes = max_bytes
+        self.max_frames = 16 * max_depth
+        self.bytes_pending = 0
+        self.dropped = 0  # Total number of dropped frames
+        self._frames = deque()  # [event_name, packet]
+        self._offset = 0  # Bytes of the first frame already sent
+        self._lock = threading.Lock()
+        self._new_drops = 0
+
+    def put(self, event_name, packet: bytes):
+        """
+        Add a frame, apply the policy if the queue is full
+        :param event_name: The name of the packet/event
+        :param packet: The encoded frame
+        :return: False if the client has to be disconnected
+        """
+        with self._lock:
+            frames = self._frames
+            if len(frames) >= self.max_depth:
+                if self.policy == SlowConsumerPolicy.DISCONNECT:
+                    return False
+                if event_name in self.droppable:
+                    first = 1 if self._offset else 0  # The first frame is being sent, keep it
+                    if self.policy == SlowConsumerPolicy.COALESCE:
+                        for i in range(len(frames) - 1, first - 1, -1):
+                            if frames[i][0] == event_name:
+                                self._drop(i)
+                    else:
+                        for i in range(first, len(frames)):
+                            if frames[i][0] in self.droppable:
+                                self._drop(i)
+                                break
+            if len(frames) >= self.max_frames or (self.max_bytes is not None and
+                                                  self.bytes_pending + len(packet) > self.max_bytes):
+                return False
+            frames.append((event_name, packet))
+            self.bytes_pending += len(packet)
+            return True
+
+    def _drop(self, i):
+        frames = self._frames
+        self.bytes_pending -= len(frames[i][1])
+        del frames[i]
+        self.dropped += 1
+        self._new_drops += 1
+
+    def take_new_drops(self):
+        """
+        :return: The number of frames dropped since the last call
+        """
+        with self._lock:
+            drops, self._new_drops = self._new_drops, 0
+            return drops
+
+    def peek(self):
+        """
+        :return: The bytes of the first frame not sent yet, or None if the queue is empty
+        """
+        with self._lock:
+            if not self._frames:
+                return None
+            return memoryview(self._frames[0][1])[self._offset:]
+
+    def advance(self, size):
+        """
+        Remove bytes that have been sent
+        :param size: The number of bytes sent from the data returned by peek
+        """
+        with self._lock:
+            self._offset += size
+            self.bytes_pending -= size
+            if self._offset >= len(self._frames[0][1]):
+                self._frames.popleft()
+                self._offset = 0
+
+    def __len__(self):
+        return len(self._frames)
 
 
 class Client:
-    def __init__(self, ip="127.0.0.1", port=8080, buffer_size=1024):
+    def __init__(self, ip="127.0.0.1", port=8080, buffer_size=65536, codecs=("json", "binary"), udp=False,
+                 compressions=("zlib",), idle_timeout=None):
+        """
+        :param codecs: Names of the codecs the client can use, by preference, the server chooses one at connection
+        :param udp: Ask the server for a UDP channel, used by the server for the state syncs
+        :param compressions: Names of the compressions the client can use, the server may choose one
+        :param idle_timeout: Disconnect if the server is silent for this time (it pings every heartbeat), None to wait
+                             forever
+        """
+        self.codecs = codecs
+        self.compressions = compressions
+        self.idle_timeout = idle_timeout
+        self.rtt: float = None  # Round trip time measured by the server pings, in seconds
+        self.rtt_var: float = None  # Its variation, the jitter of the connection
+        self.udp_enabled = udp
+        self.udp: socket.socket = None
+        self.udp_ready = False  # The server knows our UDP address
+        self.udp_dropped = 0  # Datagrams older than the newest received
+        self.udp_lost = 0  # Datagrams never received, their changes come again with the next server_sync diff
+        self._udp_seq = None
+        self.codec: PacketCodec = Packet.DEFAULT_CODEC
         self.buffer_size = buffer_size
         self.port = port
         self.ip = ip
         self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._send_lock = threading.Lock()  # The frames of two threads must not interleave into the stream
+        self._disconnect_lock = threading.Lock()  # Only one thread disconnects
         self.is_connected = False
+        self._frames = FrameBuffer(buffer_size)
 
     def connect(self):
         """
@@ -112,8 +673,7 @@ class Client:
             self.is_connected = True
 
             threading.Thread(target=self.listen, daemon=True).start()
-            client_event_registry.trigger("connection", self.client) # Trigger connection event
-            print("OK")
+            self._on_connected()
         except ConnectionRefusedError:
             Client.print_client("The server is unreachable !")
         except socket.gaierror:
@@ -121,63 +681,257 @@ class Client:
         except TimeoutError:
             Client.print_client("Connexion TimeOut !")
 
+    def _on_connected(self):
+        """
+        Ask the server for a codec and trigger the connection event
+        """
+        self.send("codec_hello", list(self.codecs), list(self.compressions))
+        if self.udp_enabled:
+            self.send("udp_request")
+        client_event_registry.trigger("connection", self.client)  # Trigger connection event
+
     def listen(self):
         """
-        Thread that listen for new content from the server
+        - Thread that listen for new content from the server
+        - The idle_timeout only limits the wait for the reads, the socket has no timeout: a slow upload never makes
+          a send fail
         """
+        selector = None
+        if self.idle_timeout is not None:
+            selector = selectors.DefaultSelector()
+            selector.register(self.client, selectors.EVENT_READ)
         try:
             while self.is_connected:
                 try:
-                    packet = self.client.recv(self.buffer_size)
-                    print("OKKKKKKK:", packet)
-                    if packet:
-                        packet_name, contents = Packet.decode_packet(packet)
-                        if packet_name == "server_stop":
-                            Client.print_client("Server stopped !")
-                            break
-                        client_event_registry.trigger(packet_name, self.client, *contents) # Trigger the event linked to the message of the server
-                    else:
-                        Client.print_client("The server send an empty packet ! Closing...")
+                    if selector is not None and not selector.select(self.idle_timeout):
+                        if self.is_connected:  # Else closed by disconnect
+                            Client.print_client("The server is silent for %ss ! Closing...", self.idle_timeout,
+                                                level=WARNING)
                         break
+                    frames = self._frames.recv(self.client)
+                    if frames is None:
+                        if self.is_connected:  # Else closed by disconnect
+                            Client.print_client("The server send an empty packet ! Closing...")
+                        break
+                    for frame in frames:
+                        if not self._handle_frame(frame):
+                            return
                 except ConnectionResetError:
                     Client.print_client("Connexion lost !")
+                    break
+                except (OSError, ValueError):  # The socket has been closed by disconnect
+                    break
         finally:
-            self.disconnect()
+            if selector is not None:
+                selector.close()
+            self.disconnect(farewell=False)  # Nothing if disconnect was called, else the server is gone or silent
+
+    def _handle_frame(self, frame: bytes):
+        """
+        Decode a frame from the server and trigger its event
+        :param frame: The payload of the frame
+        :return: False if the client has to stop listening
+        """
+        decoded = Packet.decode_packet(frame, self.codec)
+        if decoded is None:  # Invalid packet, already reported by the decoder
+            return True
+        packet_name, contents = decoded
+        Metrics.count_packet("in", packet_name, len(frame))
+        if packet_name == "server_stop":
+            Client.print_client("Server stopped !")
+            return False
+        if packet_name == "codec_select":
+            self.codec = Packet.create_codec(*contents)
+            return True
+        if packet_name == "ping":  # Answered at once by the listening thread, not delayed by the handlers
+            sent, rtt, rtt_var = contents[:3]
+            self.send("pong", sent)
+            if rtt is not None:
+                self.rtt, self.rtt_var = rtt, rtt_var
+                client_event_registry.trigger("rtt", self.client, rtt, rtt_var)
+            return True
+        if packet_name == "compression_select":
+            name, dictionary, threshold = contents
+            self.codec = COMPRESSIONS[name](self.codec, dictionary.encode("latin-1"), threshold)
+            return True
+        if packet_name == "udp_token":
+            self._start_udp(*contents)
+            return True
+        if packet_name == "udp_ready":
+            self.udp_ready = True
+            return True
+        client_event_registry.trigger(packet_name, self.client, *contents)  # Trigger the event linked to the message of the server
+        return True
+
+    def _start_udp(self, token: str, port: int):
+        """
+        Open the UDP channel with the token given by the server
+        """
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.connect((self.ip, port))
+        self.udp.settimeout(0.2)
+        threading.Thread(target=self._listen_udp, args=(bytes.fromhex(token),), daemon=True).start()
+
+    def _listen_udp(self, token: bytes):
+        """
+        Thread that send the handshake until the server answers, then listen the datagrams of the server
+        """
+        hello = Datagram.HELLO + token
+        attempts = 25
+        while self.is_connected:
+            try:
+                if not self.udp_ready:
+                    if not attempts:
+                        Client.print_client("No answer on the UDP channel, everything stays on TCP.")
+                    attempts -= 1
+                    if attempts >= 0:
+                        self.udp.send(hello)
+                data = self.udp.recv(65535)
+            except socket.timeout:
+                continue
+            except OSError:  # Closed
+                break
+            self._handle_datagram(data)
+
+    def _handle_datagram(self, data: bytes):
+        """
+        Drop the old datagrams, trigger the event of the others
+        """
+        if len(data) <= Datagram.HEADER.size:
+            return
+        seq, = Datagram.HEADER.unpack_from(data)
+        if not Datagram.is_newer(seq, self._udp_seq):
+            self.udp_dropped += 1
+            return
+        if self._udp_seq is not None and seq != (self._udp_seq + 1) & 0xFFFFFFFF:
+            lost = (seq - self._udp_seq - 1) & 0xFFFFFFFF
+            self.udp_lost += lost
+            Metrics.count("datagrams_lost", None, lost)
+        self._udp_seq = seq
+        decoded = Packet.decode_packet(memoryview(data)[Datagram.HEADER.size:], self.codec)
+        if decoded is not None:
+            Metrics.count_packet("in", decoded[0], len(data))
+            client_event_registry.trigger(decoded[0], self.client, *decoded[1])
 
     def send(self, packet_name: str, *content):
         """
-        Send a content to the server
+        - Send a content to the server
+        - Can be called from any thread (handlers, listening thread, RpcBatcher...), the frames are sent whole
         :param packet_name: The name of the packet
         :param content: contents
         """
         if self.is_connected:
-            packet = Packet.create_packet(packet_name, *content)
-            self.client.send(packet)
+            packet = Packet.create_packet(packet_name, *content, codec=self.codec)
+            Metrics.count_packet("out", packet_name, len(packet))
+            try:
+                with self._send_lock:
+                    self.client.sendall(packet)
+            except OSError:
+                if self.is_connected:
+                    raise
+                # Else disconnected meanwhile (like a silent server), the packet is dropped
 
-    def disconnect(self):
+    def disconnect(self, farewell=True):
         """
-        Call to disconnect the user
+        - Call to disconnect the user
+        - Can be called from any thread and many times, only the first call disconnects
+        :param farewell: Tell the server (if the connection still works), False when it is already broken
         """
-        if self.is_connected:
-            try:
-                self.send("client_disconnection", self.client.getpeername())
-            finally:
-                self.client.close()
-                self.is_connected = False
-                client_event_registry.trigger("disconnection", self.client)
-                Client.print_client("Client close and disconnect from the server !")
+        with self._disconnect_lock:
+            if not self.is_connected:
+                return
+            self.is_connected = False  # Before anything, the other threads stop sending
+        try:
+            if farewell:
+                packet = Packet.create_packet("client_disconnection", self.client.getpeername(), codec=self.codec)
+                with self._send_lock:
+                    self.client.sendall(packet)
+        except OSError:  # Broken meanwhile, the server will see the socket closed anyway
+            pass
+        finally:
+            self._close()
+            if self.udp is not None:
+                self.udp.close()
+            client_event_registry.trigger("disconnection", self.client)
+            Client.print_client("Client close and disconnect from the server !")
+
+    def _close(self):
+        """
+        Close the socket, the listening thread is woken up
+        """
+        try:
+            self.client.shutdown(socket.SHUT_RDWR)
+        except OSError:  # Already closed by the server
+            pass
+        self.client.close()
 
     @staticmethod
-    def print_client(msg):
+    def print_client(msg, *args, level=INFO):
         """
-        Print a message with client style
-        :param msg: the message to print
+        Log a message with client style
+        :param msg: the message to print, formatted with args (%-style) only if the level is enabled
+        :param level: The logging level
         """
-        print(f"{Back.BLUE + Fore.RED}[{Fore.RESET}CLIENT{Fore.RED}]{Style.RESET_ALL} {msg}")
+        client_logger.log(level, msg, *args)
 
 
 class Server:
-    def __init__(self, host="", port=8080, buffer_size=1024):
+    def __init__(self, host="", port=8080, buffer_size=65536, codecs=("json", "binary"), max_queue=64,
+                 slow_policy=SlowConsumerPolicy.COALESCE, io_timeout=1.0, udp=False, udp_max_datagram=1200,
+                 compression=None, compress_threshold=512, max_frame_size=1 << 20, rate_limit: RateLimit = None,
+                 heartbeat=5.0, idle_timeout=30.0, max_queue_bytes=16 << 20):
+        """
+        :param codecs: Names of the codecs the server accepts, by preference: the BinaryCodec is faster and smaller
+                       than json on the big server_sync, the C json module is faster on the small packets (events,
+                       rpc), put "binary" first when the server syncs many ReverbObject
+        :param max_queue: Number of frames waiting for a client from which the slow_policy is applied, the client is
+                          disconnected at 16 times this number whatever the policy
+        :param slow_policy: The SlowConsumerPolicy for the clients that don't read fast enough
+        :param io_timeout: Timeout of the reads of the clients sockets, the writer thread never waits for a client
+        :param udp: Open a UDP channel on the same port for the clients that ask for it
+        :param udp_max_datagram: Bigger unreliable packets are sent on TCP
+        :param compression: Name of the compression used with the clients that support it, like 'zlib', None to never
+                            compress
+        :param compress_threshold: Smaller packets are not compressed
+        :param max_frame_size: The clients that send a bigger frame are disconnected, None for no limit
+        :param rate_limit: The RateLimit of the packets of each client, None for no limit
+        :param heartbeat: Seconds between two pings of a client, that measure its round trip time, None to never ping
+        :param idle_timeout: The clients silent for this time are disconnected (the pings are answered by the alive
+                             ones), None to keep them
+        :param max_queue_bytes: The clients with more bytes waiting to be sent are disconnected whatever the
+                                slow_policy, None for no limit
+        """
+        self.codecs = codecs
+        self.max_frame_size = max_frame_size
+        self.rate_limit = rate_limit
+        self.limiters: dict[object, ClientLimiter] = {}  # addr -> token buckets of the client
+        self.recorder: SessionRecorder = None  # See start_recording
+        self.heartbeat = heartbeat
+        self.idle_timeout = idle_timeout
+        self.timers: TimerWheel = TimerWheel() if heartbeat or idle_timeout else None  # One timer per client
+        self.last_seen: dict[object, float] = {}  # addr -> time.monotonic() of the last frame of the client
+        self.rtts: dict[object, list] = {}  # addr -> [smoothed round trip time, its variation] in seconds
+        self._heartbeats: dict[object, Timer] = {}  # addr -> next heartbeat of the client
+        self.compression = compression
+        self.compress_threshold = compress_threshold
+        self._compressed_codecs: dict[PacketCodec, PacketCodec] = {}  # codec -> the same codec compressed
+        self.udp_enabled = udp
+        self.udp_max_datagram = udp_max_datagram
+        self.udp: socket.socket = None
+        self.udp_addrs = {}  # addr -> UDP address of the client
+        self.udp_dropped = 0  # Datagrams the socket couldn't send
+        self._udp_tokens = {}  # token -> addr
+        self._udp_seqs = {}  # addr -> sequence number of the last datagram sent
+        self.max_queue = max_queue
+        self.max_queue_bytes = max_queue_bytes
+        self.slow_policy = slow_policy
+        self.io_timeout = io_timeout
+        self.outbound: dict[object, OutboundQueue] = {}  # addr -> frames waiting to be sent
+        self._watch = set()  # addr of the clients whose queue changed, (un)registered by the writer thread
+        self._watch_lock = threading.Lock()
+        self._wakeup: tuple[socket.socket, socket.socket] = None  # Socket pair that wakes up the writer thread
+        self.client_codecs: dict[object, PacketCodec] = {}  # addr -> negotiated codec
+        self._binary_codec: BinaryCodec = None
         self.buffer_size = buffer_size
         self.host = host
         self.port = port
@@ -186,12 +940,25 @@ class Server:
         self.clients = {}
 
     @staticmethod
-    def print_server(msg):
+    def print_server(msg, *args, level=INFO):
         """
-        Print a message with server style
-        :param msg: the message to print
+        Log a message with server style
+        :param msg: the message to print, formatted with args (%-style) only if the level is enabled
+        :param level: The logging level
         """
-        print(f"{Back.GREEN + Fore.RED}[{Fore.RESET}SERVER{Fore.RED}]{Style.RESET_ALL} {msg}")
+        server_logger.log(level, msg, *args)
+
+    def register_gauges(self):
+        """
+        Expose the connections and the queues of the server as gauges of Metrics
+        """
+        Metrics.set_gauge("connections", lambda: len(self.clients))
+        Metrics.set_gauge("outbound_frames", lambda: sum(len(queue) for queue in list(self.outbound.values())))
+        Metrics.set_gauge("outbound_bytes", lambda: sum(queue.bytes_pending for queue in list(self.outbound.values())))
+        Metrics.set_gauge("client_queues", self.queue_stats)
+        Metrics.set_gauge("handlers_waiting", server_event_registry.queue_depth)
+        if self.timers is not None:
+            Metrics.set_gauge("timers", self.timers.__len__)
 
     def start_server(self):
         """
@@ -200,25 +967,84 @@ class Server:
         Server.print_server("Starting server...")
         self.server.bind(("", self.port))
         self.server.listen()
+        self.register_gauges()
 
-        Server.print_server(f"Server online ! Waiting for clients on {self.host}:{self.port}...")
+        Server.print_server("Server online ! Waiting for clients on %s:%s...", self.host, self.port)
         self.is_online = True
+        if self.timers is not None:
+            self.timers.start()
+        self._wakeup = socket.socketpair()
+        for sock in self._wakeup:
+            sock.setblocking(False)
         threading.Thread(target=self._accept_clients, daemon=True).start()
+        threading.Thread(target=self._write_clients, daemon=True).start()
+        if self.udp_enabled:
+            self._start_udp()
+
+    def _start_udp(self):
+        """
+        Open the UDP channel on the port of the server
+        """
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.bind(("", self.port))
+        self.udp.settimeout(self.io_timeout)
+        threading.Thread(target=self._listen_udp, daemon=True).start()
+
+    def _listen_udp(self):
+        """Thread that bind the UDP addresses of the clients from their handshake"""
+        hello_size = len(Datagram.HELLO) + Datagram.TOKEN_SIZE
+        while self.is_online:
+            try:
+                data, udp_addr = self.udp.recvfrom(hello_size)
+            except socket.timeout:
+                continue
+            except OSError:  # Closed
+                break
+            if len(data) != hello_size or not data.startswith(Datagram.HELLO):
+                continue
+            addr = self._udp_tokens.get(data[len(Datagram.HELLO):])
+            if addr is not None and addr in self.clients:
+                self.udp_addrs[addr] = udp_addr
+                self._enqueue(addr, "udp_ready", Packet.create_packet("udp_ready"))
+
+    def _send_datagram(self, addr, payload: bytes):
+        """
+        :return: False if the client has no UDP channel
+        """
+        udp_addr = self.udp_addrs.get(addr)
+        if udp_addr is None:
+            return False
+        seq = self._udp_seqs[addr] = (self._udp_seqs.get(addr, 0) + 1) & 0xFFFFFFFF
+        try:
+            self.udp.sendto(Datagram.HEADER.pack(seq) + payload, udp_addr)
+        except OSError:  # Full buffer, it is unreliable anyway
+            self.udp_dropped += 1
+        return True
 
-    def stop_server(self):
+    def stop_server(self, flush_timeout=1.0):
         """
         Stop the server
+        :param flush_timeout: Max time to wait for the waiting frames to be sent
         """
-        self.is_online = False
         packet = Packet.create_packet("server_stop")
-        for client in self.clients.values():
-            client.send(packet)
-            Server.print_server(f"The client: {client.getpeername()} is disconnect !")
+        for addr in list(self.clients):
+            self._enqueue(addr, "server_stop", packet)
+        end = time.monotonic() + flush_timeout
+        while any(self.outbound.values()) and time.monotonic() < end:
+            time.sleep(0.01)
+        self.is_online = False
+        self.stop_recording()
+        if self.timers is not None:
+            self.timers.stop()
+        for addr, client in list(self.clients.items()):
+            Server.print_server("The client: %s is disconnect !", addr)
             client.close()
         Server.print_server("All clients disconnected.")
 
         if self.server:
             self.server.close()
+        if self.udp is not None:
+            self.udp.close()
         Server.print_server("Server closed !")
 
     def _accept_clients(self):
@@ -226,6 +1052,9 @@ class Server:
         try:
             while self.is_online:
                 client_socket, addr = self.server.accept()
+                client_socket.settimeout(self.io_timeout)
+                self._track_client(addr)
+                self.outbound[addr] = self._create_outbound_queue()
                 self.clients[addr] = client_socket
                 server_event_registry.trigger("client_connection", client_socket)
                 threading.Thread(target=self._handle_client, args=(client_socket, addr), daemon=True).start()
@@ -236,53 +1065,491 @@ class Server:
 
     def _handle_client(self, client_socket, addr):
         """Thread that trigger event from packet recv from clients"""
+        frames_buffer = FrameBuffer(self.buffer_size, self.max_frame_size)
         try:
             while self.is_online:
                 try:
-                    packet = client_socket.recv(self.buffer_size)
-                    if packet:
-                        packet_name, contents = Packet.decode_packet(packet)
-                        server_event_registry.trigger(packet_name, client_socket, *contents)
-                        if packet_name == "client_disconnection":
-                            break
-                    else:
-                        Server.print_server(f"A packet from: {addr} has been send with no data ! This is illegal closing the listening thread and the communication !")
+                    frames = frames_buffer.recv(client_socket)
+                    if frames is None:
+                        Server.print_server("A packet from: %s has been send with no data ! This is illegal closing the listening thread and the communication !", addr)
                         break
-                except ConnectionResetError:
-                    Server.print_server(f"The client at add: {addr} has been disconnected ! This is an anomaly.")
+                    if not all(self._handle_frame(client_socket, addr, frame) for frame in frames):
+                        break
+                except socket.timeout:  # Nothing received, check that the server is still online
+                    continue
+                except ReverbFrameTooLargeError as e:
+                    self._on_frame_too_large(addr, e)
+                    break
+                except (ConnectionResetError, ConnectionAbortedError):
+                    Server.print_server("The client at add: %s has been disconnected ! This is an anomaly.", addr,
+                                        level=WARNING)
+                    break
+                except OSError:  # The socket has been closed by the server
                     break
         finally:
-            if addr in self.clients:
-                self.clients.pop(addr)
+            self._forget_client(addr)
             client_socket.close()
-            Server.print_server(f"The client: {addr} is disconnect !")
+            Server.print_server("The client: %s is disconnect !", addr)
+
+    def _forget_client(self, addr):
+        """
+        Free everything linked to a disconnected client
+        """
+        if self.clients.pop(addr, None) is not None:
+            self._record(RecordKind.CLOSE, addr)
+        self.limiters.pop(addr, None)
+        self.last_seen.pop(addr, None)
+        self.rtts.pop(addr, None)
+        heartbeat = self._heartbeats.pop(addr, None)
+        if heartbeat is not None:
+            self.timers.cancel(heartbeat)
+        self.client_codecs.pop(addr, None)
+        self.outbound.pop(addr, None)
+        self.udp_addrs.pop(addr, None)
+        self._udp_seqs.pop(addr, None)
+        for token in [token for token, token_addr in self._udp_tokens.items() if token_addr == addr]:
+            del self._udp_tokens[token]
+        Metrics.forget(addr)
+        self._wake_writer(addr)  # Unregister its socket
+
+    def _handle_frame(self, client_socket, addr, frame: bytes):
+        """
+        Decode a frame from a client and trigger its event
+        :param client_socket: The socket of the client
+        :param addr: The address of the client
+        :param frame: The payload of the frame
+        :return: False if the server has to stop listening this client
+        """
+        self.last_seen[addr] = time.monotonic()  # Only read by the heartbeat, no timer to move per frame
+        if self.recorder is not None:
+            self.recorder.record(RecordKind.IN, addr, frame)
+        limiter = self.limiters.get(addr)
+        if limiter is not None:
+            verdict, wait = limiter.check_frame(len(frame))
+            if verdict != ClientLimiter.ADMIT:
+                return self._on_flood(addr, verdict, None)
+            if wait:
+                Metrics.count("throttled", addr)
+                self._throttle(client_socket, wait)
+        decoded = Packet.decode_packet(frame, self.client_codecs.get(addr))
+        if decoded is None:  # Invalid packet, already reported by the decoder
+            return True
+        packet_name, contents = decoded
+        Metrics.count_packet("in", packet_name, len(frame), addr)
+        if limiter is not None and limiter.events:
+            verdict = limiter.check_event(packet_name)
+            if verdict != ClientLimiter.ADMIT:
+                return self._on_flood(addr, verdict, packet_name)
+        if packet_name == "codec_hello":
+            self._select_codec(client_socket, addr, *contents)
+            return True
+        if packet_name == "pong":
+            self._on_pong(addr, *contents)
+            return True
+        if packet_name == "udp_request":
+            if self.udp is not None:
+                token = os.urandom(Datagram.TOKEN_SIZE)
+                self._udp_tokens[token] = addr
+                self._enqueue(addr, "udp_token", Packet.create_packet("udp_token", token.hex(), self.port))
+            return True
+        server_event_registry.trigger(packet_name, client_socket, *contents)
+        return packet_name != "client_disconnection"
+
+    def start_recording(self, path, max_pending=65536):
+        """
+        - Record the frames received and sent by the server into a log, until stop_recording
+        - The log can be replayed against a local server or simulated clients with a SessionReplay
+        :param path: The path of the log, overwritten
+        :param max_pending: Records waiting for the writer thread from which the new ones are dropped
+        :return: The SessionRecorder
+        """
+        self.stop_recording()
+        recorder = SessionRecorder(path, max_pending)
+        for addr in list(self.clients):  # Their frames before the recording are lost, like the codec negotiation
+            recorder.record(RecordKind.OPEN, addr)
+        self.recorder = recorder
+        Server.print_server("Recording the session into %s", path)
+        return recorder
+
+    def stop_recording(self):
+        """
+        Write the last records and close the log
+        """
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.stop()
+            Server.print_server("Session recorded: %s records, %s dropped", recorder.recorded, recorder.dropped)
+
+    def _record(self, kind, addr):
+        if self.recorder is not None:
+            self.recorder.record(kind, addr)
+
+    def _track_client(self, addr):
+        """
+        Create the state of a new client: its rate limiter, its recording and its heartbeat
+        """
+        if self.rate_limit is not None:
+            self.limiters[addr] = ClientLimiter(self.rate_limit)
+        self._record(RecordKind.OPEN, addr)
+        if self.timers is not None:
+            self.last_seen[addr] = time.monotonic()
+            self._heartbeats[addr] = self.timers.schedule(self._heartbeat_delay(0.0), self._on_heartbeat, addr)
+
+    def _heartbeat_delay(self, idle):
+        """
+        :param idle: Seconds since the last frame of the client
+        :return: Seconds before the next heartbeat of the client
+        """
+        if self.idle_timeout is None:
+            return self.heartbeat
+        if not self.heartbeat:
+            return self.idle_timeout - idle
+        return min(self.heartbeat, self.idle_timeout - idle)
+
+    def _on_heartbeat(self, addr):
+        """
+        - Called by the TimerWheel: disconnect the client if it is silent for too long, else ping it
+        - A frame of the client doesn't move the timer, it is checked here with last_seen
+        """
+        last_seen = self.last_seen.get(addr)
+        if last_seen is None or addr not in self.clients:  # Disconnected meanwhile
+            return
+        idle = time.monotonic() - last_seen
+        if self.idle_timeout is not None and idle >= self.idle_timeout:
+            Server.print_server("The client: %s is silent for %.1fs ! Disconnecting...", addr, idle, level=WARNING)
+            Metrics.count("clients_reaped")
+            self._heartbeats.pop(addr, None)
+            self._drop_client(addr)
+            return
+        if self.heartbeat:
+            rtt = self.rtts.get(addr)
+            self._send([addr], "ping", (time.monotonic(), *(rtt or (None, None))))
+        self._heartbeats[addr] = self.timers.schedule(self._heartbeat_delay(idle), self._on_heartbeat, addr)
+
+    def _on_pong(self, addr, sent, *args):
+        """
+        - Update the round trip time of the client like TCP (RFC 6298)
+        :param sent: The time.monotonic() of the server when the ping was sent
+        """
+        sample = time.monotonic() - sent
+        if not 0 <= sample < 60:  # Not a time of this server
+            return
+        Metrics.observe("rtt", sample)
+        rtt = self.rtts.get(addr)
+        if rtt is None:
+            self.rtts[addr] = [sample, sample / 2]
+        else:
+            rtt[1] += (abs(rtt[0] - sample) - rtt[1]) / 4
+            rtt[0] += (sample - rtt[0]) / 8
 
-    def send_to_all(self, packet_name, *contents):
+    def rtt(self, clt: socket.socket):
         """
-        Send a packet to all player
+        :param clt: The socket of the client
+        :return: The smoothed round trip time of the client and its variation in seconds, None before its first pong
+        """
+        rtt = self.rtts.get(clt.getpeername())
+        return tuple(rtt) if rtt is not None else None
+
+    def _throttle(self, client_socket, wait):
+        """
+        - Stop reading a client for wait seconds, its thread sleeps and TCP slows it down
+        """
+        time.sleep(wait)
+
+    def _on_flood(self, addr, verdict, packet_name):
+        """
+        - A packet of a client is over its RateLimit
+        :param packet_name: The name of the packet, None if it was not decoded
+        :return: False if the client has to be disconnected
+        """
+        Metrics.count("rate_limited", packet_name)
+        Metrics.count("client_rate_limited", addr)
+        if verdict == ClientLimiter.DISCONNECT:
+            Server.print_server("The client: %s is flooding the server ! Disconnecting...", addr, level=WARNING)
+            Metrics.count("flood_disconnections")
+            return False
+        return True
+
+    def _on_frame_too_large(self, addr, error):
+        Server.print_server("The client: %s sent a too large frame ! Disconnecting... (%s)", addr, error, level=WARNING)
+        Metrics.count("frames_too_large")
+
+    def _select_codec(self, client_socket, addr, client_codecs=(), client_compressions=(), *args):
+        """
+        Choose the codec of a client, the first of our codecs that the client supports
+        :param client_codecs: The codecs names supported by the client
+        :param client_compressions: The compressions names supported by the client
+        """
+        name = next((name for name in self.codecs if name in client_codecs and name in CODECS), JsonCodec.NAME)
+        if name == BinaryCodec.NAME:
+            BinaryCodec.intern(*server_event_registry.all_events(), *client_event_registry.all_events())
+            if self._binary_codec is None or len(self._binary_codec.strings) != len(BinaryCodec.STRINGS):
+                self._binary_codec = BinaryCodec()  # The new strings are only known by the next clients
+            codec = self._binary_codec
+        elif name == JsonCodec.NAME:
+            codec = Packet.DEFAULT_CODEC  # Shared, so the broadcasts are encoded once for all the JSON clients
+        else:
+            codec = Packet.create_codec(name)
+        self._enqueue(addr, "codec_select", Packet.create_packet("codec_select", name, *codec.negotiation_args()))  # Still JSON
+        if self.compression is not None and self.compression in client_compressions:
+            codec = self._compressed_codec(codec)
+            self._enqueue(addr, "compression_select",
+                          Packet.create_packet("compression_select", self.compression, *codec.negotiation_args()))
+        self.client_codecs[addr] = codec
+        server_event_registry.trigger("client_ready", client_socket)  # The next packets use the codec
+
+    def _encode_for_clients(self, packet_name, contents, addrs=None):
+        """
+        Encode a packet once per codec used by the clients
+        :param addrs: The addresses of the clients, all of them if None
+        :return: list of (client addr, encoded packet)
+        """
+        packets = {}
+        encoded = []
+        for addr in list(self.clients) if addrs is None else addrs:
+            codec = self.client_codecs.get(addr, Packet.DEFAULT_CODEC)
+            packet = packets.get(codec)
+            if packet is None:
+                packet = packets[codec] = Packet.create_packet(packet_name, *contents, codec=codec)
+            encoded.append((addr, packet))
+        return encoded
+
+    def _create_outbound_queue(self):
+        return OutboundQueue(self.max_queue, self.slow_policy, max_bytes=self.max_queue_bytes)
+
+    def _enqueue(self, addr, packet_name, packet: bytes):
+        """
+        Queue a frame for a client, apply the SlowConsumerPolicy
+        """
+        queue = self.outbound.get(addr)
+        if queue is None:  # The client is disconnected
+            return
+        if not queue.put(packet_name, packet):
+            Server.print_server("The client: %s is too slow ! Disconnecting...", addr, level=WARNING)
+            self._drop_client(addr)
+            return
+        Metrics.count_packet("out", packet_name, len(packet), addr)
+        if self.recorder is not None:
+            self.recorder.record(RecordKind.OUT, addr, packet, Packet.HEADER.size)
+        drops = queue.take_new_drops()
+        if drops:  # Never acked, the changes of a dropped server_sync are sent again by the next diff
+            Metrics.count("frames_dropped", packet_name, drops)
+        self._wake_writer(addr)
+
+    def _wake_writer(self, addr):
+        """
+        - Tell the writer thread that the queue of a client changed, only the first call of a turn wakes it up
+        """
+        with self._watch_lock:
+            signal = not self._watch
+            self._watch.add(addr)
+        if signal:
+            try:
+                self._wakeup[1].send(b"\0")
+            except OSError:  # Full (the writer is already woken up) or closed by the stop of the writer
+                pass
+
+    def _drop_client(self, addr):
+        """
+        Disconnect a client without waiting for its queued frames, like a too slow or a dead one
+        """
+        self.outbound.pop(addr, None)
+        client = self.clients.get(addr)
+        if client is not None:
+            try:
+                client.shutdown(socket.SHUT_RDWR)  # Wake up the listening thread that will clean the client
+            except OSError:
+                pass
+
+    def _write_clients(self):
+        """
+        Thread that send the waiting frames to the clients that can receive them
+        - Only the clients with waiting frames are registered into the selector (epoll or poll when available, no
+          limit on the file descriptors), from the addr given to _wake_writer
+        - It writes into a non-blocking duplicate of each socket: the timeout of the sockets (for the listening
+          threads) would make a send wait for a full client, and every other client with it
+        """
+        selector = selectors.DefaultSelector()
+        wakeup = self._wakeup[0]
+        selector.register(wakeup, selectors.EVENT_READ)
+        registered = {}  # addr -> (socket of the client, its non-blocking duplicate registered for writing)
+
+        def unregister(addr):
+            writer = registered.pop(addr)[1]
+            selector.unregister(writer)
+            writer.close()
+
+        try:
+            while self.is_online:
+                ready = selector.select(0.1)
+                if any(key.fileobj is wakeup for key, _ in ready):
+                    try:
+                        while wakeup.recv(4096):
+                            pass
+                    except OSError:  # Empty
+                        pass
+                with self._watch_lock:  # After the wakeup is emptied, a new addr wakes up the next select
+                    watch, self._watch = self._watch, set()
+                for addr in watch:
+                    client = self.clients.get(addr)
+                    queue = self.outbound.get(addr)
+                    if addr in registered and (registered[addr][0] is not client or not queue):
+                        unregister(addr)
+                    if addr in registered or not queue or client is None:
+                        continue
+                    try:
+                        writer = client.dup()
+                    except OSError:  # Closed meanwhile
+                        continue
+                    writer.setblocking(False)
+                    registered[addr] = (client, writer)
+                    selector.register(writer, selectors.EVENT_WRITE, addr)
+                for key, _ in ready:
+                    addr = key.data
+                    writer = key.fileobj
+                    if writer is wakeup or registered.get(addr, (None, None))[1] is not writer:  # Unregistered
+                        continue
+                    queue = self.outbound.get(addr)
+                    for _ in range(16 if queue is not None else 0):  # Several frames but let the others write too
+                        data = queue.peek()
+                        if data is None:
+                            break
+                        try:
+                            sent = writer.send(data)
+                        except BlockingIOError:  # Full, at the next select
+                            break
+                        except OSError:  # The listening thread will clean the client
+                            queue = None
+                            break
+                        queue.advance(sent)
+                        if sent < len(data):
+                            break
+                    if not queue:  # Registered again by the next _wake_writer
+                        unregister(addr)
+        finally:
+            for addr in list(registered):
+                unregister(addr)
+            selector.close()
+            for sock in self._wakeup:
+                sock.close()
+
+    def send_to_all(self, packet_name, *contents, unreliable=False):
+        """
+        - Send a packet to all player
+        - The packet is encoded once and queued for each client, never block
         :param packet_name: The name of the packet/event
         :param contents: Contents
+        :param unreliable: Send it on the UDP channel of the clients that have one (it can be lost)
         """
-        packet = Packet.create_packet(packet_name, *contents)
-        for client in self.clients.values():
-            client.sendall(packet)
+        self._send(None, packet_name, contents, unreliable)
 
+    def send_to_group(self, addrs, packet_name, *contents, unreliable=False):
+        """
+        - Send a packet to some clients
+        - The packet is encoded once per codec, like send_to_all
+        :param addrs: The addresses of the clients
+        :param packet_name: The name of the packet/event
+        :param contents: Contents
+        :param unreliable: Send it on the UDP channel of the clients that have one (it can be lost)
+        """
+        self._send(addrs, packet_name, contents, unreliable)
 
-    @staticmethod
-    def send_to(clt:socket.socket, packet_name, *contents):
-        packet = Packet.create_packet(packet_name, *contents)
-        clt.sendall(packet)
+    def send_to(self, clt: socket.socket, packet_name, *contents, unreliable=False):
+        """
+        Send a packet to one client, with its codec
+        :param clt: The socket of the client
+        :param packet_name: The name of the packet/event
+        :param contents: Contents
+        :param unreliable: Send it on the UDP channel if the client has one (it can be lost)
+        """
+        self._send([clt.getpeername()], packet_name, contents, unreliable)
+
+    def _compressed_codec(self, codec):
+        """
+        :return: The compressed codec wrapping codec, shared by the clients so the broadcasts are compressed once
+        """
+        compressed = self._compressed_codecs.get(codec)
+        dictionary = CompressedCodec.build_dictionary()
+        if compressed is None or compressed.dictionary != dictionary:  # The new words are only known by the next clients
+            if len(self._compressed_codecs) >= 8:
+                self._compressed_codecs.clear()
+            compressed = self._compressed_codecs[codec] = COMPRESSIONS[self.compression](codec, dictionary,
+                                                                                          self.compress_threshold,
+                                                                                          max_size=self.max_frame_size)
+        return compressed
+
+    def codec_of(self, clt: socket.socket):
+        """
+        :param clt: The socket of the client
+        :return: The codec of the client
+        """
+        return self.client_codecs.get(clt.getpeername(), Packet.DEFAULT_CODEC)
+
+    def send_frames(self, clt: socket.socket, packet_name, frames):
+        """
+        - Send packets already encoded with the codec of the client (see codec_of), like cached ones
+        :param clt: The socket of the client
+        :param packet_name: The name of the packets/event
+        :param frames: The frames made by Packet.create_packet
+        """
+        addr = clt.getpeername()
+        for frame in frames:
+            self._enqueue(addr, packet_name, frame)
+
+    def _send(self, addrs, packet_name, contents, unreliable=False):
+        if not unreliable or not self.udp_addrs:
+            for addr, packet in self._encode_for_clients(packet_name, contents, addrs):
+                self._enqueue(addr, packet_name, packet)
+            return
+        payloads = {}
+        frames = {}
+        for addr in list(self.clients) if addrs is None else addrs:
+            codec = self.client_codecs.get(addr, Packet.DEFAULT_CODEC)
+            payload = payloads.get(codec)
+            if payload is None:
+                payload = payloads[codec] = Packet.encode(packet_name, contents, codec)
+            if len(payload) <= self.udp_max_datagram and self._send_datagram(addr, payload):
+                Metrics.count_packet("out", packet_name, Datagram.HEADER.size + len(payload), addr)
+                if self.recorder is not None:
+                    self.recorder.record(RecordKind.DATAGRAM, addr, payload)
+            else:
+                frame = frames.get(codec)
+                if frame is None:
+                    frame = frames[codec] = Packet.frame(payload)
+                self._enqueue(addr, packet_name, frame)
+
+    def queue_depth(self, addr):
+        """
+        :param addr: The address of the client
+        :return: Number of frames waiting to be sent to the client
+        """
+        queue = self.outbound.get(addr)
+        return len(queue) if queue is not None else 0
+
+    def bytes_pending(self, addr):
+        """
+        :param addr: The address of the client
+        :return: Number of bytes waiting to be sent to the client
+        """
+        queue = self.outbound.get(addr)
+        return queue.bytes_pending if queue is not None else 0
+
+    def queue_stats(self):
+        """
+        :return: Dict[addr:(queue depth, bytes pending, frames dropped)] of all the clients
+        """
+        return {addr: (len(queue), queue.bytes_pending, queue.dropped) for addr, queue in list(self.outbound.items())}
 
 # Basic Event Registry
 
 # SERVER EVENTS
-@server_event_registry.on_event("client_disconnection")
+@server_event_registry.on_event("client_disconnection", mode=DispatchMode.INLINE)  # Before the socket is closed
 def on_client_disconnect(clt, *args):
-    Server.print_server(f"The client: {clt.getpeername()} disconnect itself ! (Client Side)")
+    Server.print_server("The client: %s disconnect itself ! (Client Side)", clt.getpeername())
 
 @server_event_registry.on_event("client_connection")
 def on_client_connect(clt, *args):
-    Server.print_server(f"Client connected on: {clt.getpeername()} !")
+    Server.print_server("Client connected on: %s !", clt.getpeername())
 
 
 # CLIENT EVENTS
@@ -0,0 +1,572 @@
+import json
+import struct
+import uuid
+import zlib
+
+
+class PacketCodec:
+    """
+    - Turn a packet (name + contents) into bytes and back
+    - The first byte of an encoded packet tells which codec made it, so a peer can always decode
+      what it receives, even while the codec is being negotiated
+    """
+    NAME = None  # Name used by the negotiation
+    MARKER = None  # First byte of the packets made by this codec
+
+    def encode(self, name: str, contents) -> bytes:
+        """
+        :param name: Name of the packet/event
+        :param contents: The contents
+        :return: The encoded packet
+        """
+        raise NotImplementedError
+
+    def decode(self, packet: bytes):
+        """
+        :param packet: The encoded packet
+        :return: The name/event and the contents
+        """
+        raise NotImplementedError
+
+    def negotiation_args(self):
+        """
+        :return: What the client needs to build the same codec (sent with the 'codec_select' packet)
+        """
+        return []
+
+    def accepts(self, marker: int):
+        """
+        :param marker: The first byte of a packet
+        :return: If this codec can decode the packet
+        """
+        return marker == self.MARKER
+
+
+class JsonCodec(PacketCodec):
+    """
+    - The default codec, always supported
+    """
+    NAME = "json"
+    MARKER = ord("{")
+
+    def encode(self, name: str, contents) -> bytes:
+        return json.dumps({"name": name, "contents": contents}).encode()
+
+    def decode(self, packet: bytes):
+        decoded_packet = json.loads(bytes(packet).decode())
+        return decoded_packet["name"], decoded_packet["contents"]
+
+
+class BinaryCodec(PacketCodec):
+    """
+    - Compact binary codec
+    - Numbers are struct packed, the strings of the table (events names, types names...) are sent as their index
+      and the uuid strings as 16 raw bytes
+    - The table is built by the server and sent to the client during the negotiation
+    - The big dicts of lists (the ReverbObject of a server_sync) are sent column by column: the keys, then each field
+      of the lists, a column of numbers is packed by a single struct call and a column of strings is joined, so most
+      of the work is done in C
+    """
+    NAME = "binary"
+    MARKER = 0x01
+    STRINGS = ["server_sync", "server_stop", "rpc_batch", "client_disconnection", "client_connection",
+               "codec_hello", "codec_select", "ReverbObject", "sync_ack", "rpc_results", "ping",
+               "pong"]  # Strings to intern
+
+    # Tags
+    NONE, FALSE, TRUE, INT8, INT16, INT32, INT64, BIG_INT, FLOAT, STR8, STR32, STR_ID8, STR_ID16, UUID, \
+        LIST8, LIST32, DICT8, DICT32, RECORDS = range(19)
+    # Kinds of the columns of a RECORDS
+    COL_ANY, COL_NONE, COL_BOOL, COL_INT8, COL_INT16, COL_INT32, COL_INT64, COL_FLOAT, COL_STR_ID8, COL_STR_ID16, \
+        COL_STR, COL_UUID, COL_LISTS = range(13)
+    _INT_COLUMNS = ((-0x80, 0x80, COL_INT8, "b"), (-0x8000, 0x8000, COL_INT16, "h"),
+                    (-0x80000000, 0x80000000, COL_INT32, "i"),
+                    (-0x8000000000000000, 0x8000000000000000, COL_INT64, "q"))
+    _FORMATS = {COL_INT8: "b", COL_INT16: "h", COL_INT32: "i", COL_INT64: "q", COL_FLOAT: "d", COL_STR_ID8: "B",
+                COL_STR_ID16: "H"}
+    _UUID_PARTS = ((0, 0, 8), (8, 9, 4), (12, 14, 4), (16, 19, 4), (20, 24, 12))  # Hex digits offset, offset, size
+    RECORDS_MIN = 16  # Size from which a dict of lists is sent column by column
+
+    _B = struct.Struct("<B")
+    _BI = struct.Struct("<BI")
+    _TAG_B = struct.Struct("<BB")
+    _TAG_b = struct.Struct("<Bb")
+    _TAG_h = struct.Struct("<Bh")
+    _TAG_H = struct.Struct("<BH")
+    _TAG_i = struct.Struct("<Bi")
+    _TAG_I = struct.Struct("<BI")
+    _TAG_q = struct.Struct("<Bq")
+    _TAG_d = struct.Struct("<Bd")
+    _b = struct.Struct("<b")
+    _h = struct.Struct("<h")
+    _H = struct.Struct("<H")
+    _i = struct.Struct("<i")
+    _I = struct.Struct("<I")
+    _q = struct.Struct("<q")
+    _d = struct.Struct("<d")
+
+    def __init__(self, strings=None):
+        """
+        :param strings: The table of interned strings, the current BinaryCodec.STRINGS if None
+        """
+        self.strings = list(BinaryCodec.STRINGS if strings is None else strings)[:0xFFFF]
+        self._ids = {string: i for i, string in enumerate(self.strings)}
+        self._encoders = {
+            type(None): self._encode_none, bool: self._encode_bool, int: self._encode_int,
+            float: self._encode_float, str: self._encode_str, list: self._encode_list,
+            tuple: self._encode_list, dict: self._encode_dict,
+        }
+
+    @staticmethod
+    def intern(*strings):
+        """
+        - Add strings to the table of the next BinaryCodec built
+        :param strings: The strings often sent
+        """
+        for string in strings:
+            if string not in BinaryCodec.STRINGS:
+                BinaryCodec.STRINGS.append(string)
+
+    def negotiation_args(self):
+        return [self.strings]
+
+    # ENCODING
+
+    def encode(self, name: str, contents) -> bytes:
+        out = bytearray((BinaryCodec.MARKER,))
+        self._encode_str(out, name)
+        self._encode_list(out, contents)
+        return bytes(out)
+
+    def _encode(self, out: bytearray, value):
+        encoder = self._encoders.get(type(value))
+        if encoder is None:  # Subclass of a known type (IntEnum, str subclass...)
+            for cls in (bool, int, float, str, list, tuple, dict):
+                if isinstance(value, cls):
+                    encoder = self._encoders[cls]
+                    break
+            else:
+                raise TypeError(f"The value: {value!r} can't be encoded by the BinaryCodec !")
+        encoder(out, value)
+
+    def _encode_none(self, out, value):
+        out.append(BinaryCodec.NONE)
+
+    def _encode_bool(self, out, value):
+        out.append(BinaryCodec.TRUE if value else BinaryCodec.FALSE)
+
+    def _encode_int(self, out, value):
+        if -0x80 <= value < 0x80:
+            out += BinaryCodec._TAG_b.pack(BinaryCodec.INT8, value)
+        elif -0x8000 <= value < 0x8000:
+            out += BinaryCodec._TAG_h.pack(BinaryCodec.INT16, value)
+        elif -0x80000000 <= value < 0x80000000:
+            out += BinaryCodec._TAG_i.pack(BinaryCodec.INT32, value)
+        elif -0x8000000000000000 <= value < 0x8000000000000000:
+            out += BinaryCodec._TAG_q.pack(BinaryCodec.INT64, value)
+        else:
+            digits = str(value).encode()
+            out += BinaryCodec._TAG_I.pack(BinaryCodec.BIG_INT, len(digits))
+            out += digits
+
+    def _encode_float(self, out, value):
+        out += BinaryCodec._TAG_d.pack(BinaryCodec.FLOAT, value)
+
+    def _encode_str(self, out, value):
+        string_id = self._ids.get(value)
+        if string_id is not None:
+            if string_id < 0x100:
+                out += BinaryCodec._TAG_B.pack(BinaryCodec.STR_ID8, string_id)
+            else:
+                out += BinaryCodec._TAG_H.pack(BinaryCodec.STR_ID16, string_id)
+            return
+        if len(value) == 36 and value[8] == "-" and value[13] == "-" and value[18] == "-" and value[23] == "-":
+            try:  # Looks like an uuid, only the canonical form can be rebuilt as the same string
+                raw = bytes.fromhex(value.replace("-", ""))
+                if len(raw) == 16 and value == value.lower():
+                    out.append(BinaryCodec.UUID)
+                    out += raw
+                    return
+            except ValueError:
+                pass
+        data = value.encode()
+        if len(data) < 0x100:
+            out += BinaryCodec._TAG_B.pack(BinaryCodec.STR8, len(data))
+        else:
+            out += BinaryCodec._TAG_I.pack(BinaryCodec.STR32, len(data))
+        out += data
+
+    def _encode_list(self, out, value):
+        if len(value) < 0x100:
+            out += BinaryCodec._TAG_B.pack(BinaryCodec.LIST8, len(value))
+        else:
+            out += BinaryCodec._TAG_I.pack(BinaryCodec.LIST32, len(value))
+        encoders = self._encoders
+        for item in value:
+            encoder = encoders.get(type(item))
+            if encoder is None:
+                self._encode(out, item)
+            else:
+                encoder(out, item)
+
+    def _encode_dict(self, out, value):
+        if len(value) >= BinaryCodec.RECORDS_MIN and set(map(type, value.values())) <= {list, tuple} \
+                and self._encode_records(out, value):
+            return
+        if len(value) < 0x100:
+            out += BinaryCodec._TAG_B.pack(BinaryCodec.DICT8, len(value))
+        else:
+            out += BinaryCodec._TAG_I.pack(BinaryCodec.DICT32, len(value))
+        encode = self._encode
+        for key, item in value.items():
+            encode(out, key)
+            encode(out, item)
+
+    def _encode_records(self, out, value):
+        """
+        - RECORDS tag, number of entries, column of the keys, number of groups, [group of each entry,]
+          then for each group: the length of its lists, its number of entries and the columns
+        - The lists are grouped by length (the diffs of a server_sync only hold the changed fields)
+        :return: If the dict could be sent as records
+        """
+        rows = list(value.values())
+        lengths = list(map(len, rows))
+        widths = list(dict.fromkeys(lengths))
+        if len(widths) > 0xFF or max(widths) > 0xFF:
+            return False
+        out += BinaryCodec._BI.pack(BinaryCodec.RECORDS, len(rows))
+        self._encode_column(out, tuple(value))
+        out.append(len(widths))
+        if len(widths) == 1:
+            groups = [rows]
+        else:
+            index = {width: i for i, width in enumerate(widths)}
+            indexes = bytes([index[length] for length in lengths])
+            out += indexes
+            groups = [[] for _ in widths]
+            for i, row in zip(indexes, rows):
+                groups[i].append(row)
+        for width, group in zip(widths, groups):
+            out += BinaryCodec._BI.pack(width, len(group))
+            for column in zip(*group):
+                self._encode_column(out, column)
+        return True
+
+    def _encode_column(self, out, column: tuple):
+        """
+        - Encode a column of a RECORDS, the values of a single type are packed in bulk, else they are sent as a list
+        """
+        kinds = set(map(type, column))
+        kind = kinds.pop() if len(kinds) == 1 else None
+        count = len(column)
+        if kind is float:
+            out.append(BinaryCodec.COL_FLOAT)
+            out += struct.pack(f"<{count}d", *column)
+            return
+        if kind is int:
+            low, high = min(column), max(column)
+            for int_min, int_max, column_kind, fmt in BinaryCodec._INT_COLUMNS:
+                if int_min <= low and high < int_max:
+                    out.append(column_kind)
+                    out += struct.pack(f"<{count}{fmt}", *column)
+                    return
+        elif kind is str:
+            string_ids = list(map(self._ids.get, column))
+            if None not in string_ids:
+                wide = max(string_ids) > 0xFF
+                out.append(BinaryCodec.COL_STR_ID16 if wide else BinaryCodec.COL_STR_ID8)
+                out += struct.pack(f"<{count}{'H' if wide else 'B'}", *string_ids)
+                return
+            if string_ids.count(None) == count:
+                joined = "".join(column)
+                if len(joined) == 36 * count and set(map(len, column)) == {36} and joined == joined.lower() \
+                        and joined[8::36] == joined[13::36] == joined[18::36] == joined[23::36] == "-" * count \
+                        and joined.count("-") == 4 * count:
+                    try:  # Only the canonical uuids can be rebuilt as the same strings
+                        raw = bytes.fromhex(joined.replace("-", ""))
+                    except ValueError:
+                        raw = None
+                    if raw is not None and len(raw) == 16 * count:
+                        out.append(BinaryCodec.COL_UUID)
+                        out += raw
+                        return
+                joined = "\0".join(column)
+                if joined.count("\0") == count - 1:  # Else a string holds the separator
+                    data = joined.encode()
+                    out += BinaryCodec._BI.pack(BinaryCodec.COL_STR, len(data))
+                    out += data
+                    return
+        elif kind is bool:
+            out.append(BinaryCodec.COL_BOOL)
+            out += bytes(column)
+            return
+        elif kind is type(None):
+            out.append(BinaryCodec.COL_NONE)
+            return
+        elif kind is list or kind is tuple:
+            widths = set(map(len, column))
+            if len(widths) == 1:
+                width = widths.pop()
+                if width < 0x100:
+                    out += BinaryCodec._TAG_B.pack(BinaryCodec.COL_LISTS, width)
+                    for sub_column in zip(*column):
+                        self._encode_column(out, sub_column)
+                    return
+        out.append(BinaryCodec.COL_ANY)
+        self._encode_list(out, column)
+
+    # DECODING
+
+    def decode(self, packet: bytes):
+        data = bytes(packet)  # Indexing bytes is faster than a memoryview
+        if data[0] != BinaryCodec.MARKER:
+            raise ValueError("This packet wasn't made by the BinaryCodec !")
+        name, offset = self._decode(data, 1)
+        contents, offset = self._decode(data, offset)
+        return name, contents
+
+    def _decode(self, view, offset):
+        """
+        :return: The value and the offset after it
+        """
+        tag = view[offset]
+        offset += 1
+        if tag == BinaryCodec.LIST8 or tag == BinaryCodec.LIST32:
+            if tag == BinaryCodec.LIST8:
+                count = view[offset]
+                offset += 1
+            else:
+                count = BinaryCodec._I.unpack_from(view, offset)[0]
+                offset += 4
+            return self._decode_items(view, offset, count)
+        if tag == BinaryCodec.DICT8 or tag == BinaryCodec.DICT32:
+            if tag == BinaryCodec.DICT8:
+                count = view[offset]
+                offset += 1
+            else:
+                count = BinaryCodec._I.unpack_from(view, offset)[0]
+                offset += 4
+            items, offset = self._decode_items(view, offset, count * 2)
+            return dict(zip(items[::2], items[1::2])), offset
+        if tag == BinaryCodec.RECORDS:
+            return self._decode_records(view, offset)
+        if tag == BinaryCodec.STR32:
+            size = BinaryCodec._I.unpack_from(view, offset)[0]
+            offset += 4
+            return str(view[offset:offset + size], "utf-8"), offset + size
+        if tag == BinaryCodec.STR_ID16:
+            return self.strings[BinaryCodec._H.unpack_from(view, offset)[0]], offset + 2
+        if tag == BinaryCodec.INT16:
+            return BinaryCodec._h.unpack_from(view, offset)[0], offset + 2
+        if tag == BinaryCodec.INT32:
+            return BinaryCodec._i.unpack_from(view, offset)[0], offset + 4
+        if tag == BinaryCodec.INT64:
+            return BinaryCodec._q.unpack_from(view, offset)[0], offset + 8
+        if tag == BinaryCodec.BIG_INT:
+            size = BinaryCodec._I.unpack_from(view, offset)[0]
+            offset += 4
+            return int(str(view[offset:offset + size], "ascii")), offset + size
+        items, offset = self._decode_items(view, offset - 1, 1)  # The simple values are decoded there
+        return items[0], offset
+
+    def _decode_items(self, view, offset, count):
+        """
+        - Decode count values one after another
+        - The most frequent tags are decoded inline, this is the hot loop of the codec
+        :return: The list of values and the offset after them
+        """
+        items = []
+        append = items.append
+        strings = self.strings
+        unpack_double = BinaryCodec._d.unpack_from
+        for _ in range(count):
+            tag = view[offset]
+            if tag == 11:  # STR_ID8
+                append(strings[view[offset + 1]])
+                offset += 2
+            elif tag == 3:  # INT8
+                value = view[offset + 1]
+                append(value - 256 if value > 127 else value)
+                offset += 2
+            elif tag == 8:  # FLOAT
+                append(unpack_double(view, offset + 1)[0])
+                offset += 9
+            elif tag == 9:  # STR8
+                size = view[offset + 1]
+                offset += 2
+                append(str(view[offset:offset + size], "utf-8"))
+                offset += size
+            elif tag == 13:  # UUID
+                h = view[offset + 1:offset + 17].hex()
+                append(f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}")
+                offset += 17
+            elif tag == 2:  # TRUE
+                append(True)
+                offset += 1
+            elif tag == 1:  # FALSE
+                append(False)
+                offset += 1
+            elif tag == 0:  # NONE
+                append(None)
+                offset += 1
+            else:
+                value, offset = self._decode(view, offset)
+                append(value)
+        return items, offset
+
+    def _decode_records(self, view, offset):
+        """
+        :return: The dict sent by _encode_records and the offset after it
+        """
+        count = BinaryCodec._I.unpack_from(view, offset)[0]
+        if count > len(view) - offset:  # Each key takes at least a byte
+            raise ValueError("Truncated records !")
+        keys, offset = self._decode_column(view, offset + 4, count)
+        group_count = view[offset]
+        offset += 1
+        if group_count > 1:
+            indexes = view[offset:offset + count]
+            offset += count
+        groups = []
+        for _ in range(group_count):
+            width, size = BinaryCodec._BI.unpack_from(view, offset)
+            offset += 5
+            columns = []
+            for _ in range(width):
+                column, offset = self._decode_column(view, offset, size)
+                columns.append(column)
+            groups.append(list(map(list, zip(*columns))) if width else [[] for _ in range(size)])
+        if group_count == 1:
+            rows = groups[0]
+        else:
+            next_rows = [iter(group).__next__ for group in groups]
+            rows = [next_rows[i]() for i in indexes]
+        return dict(zip(keys, rows)), offset
+
+    def _decode_column(self, view, offset, count):
+        """
+        :return: The values of the column and the offset after it
+        """
+        kind = view[offset]
+        offset += 1
+        fmt = BinaryCodec._FORMATS.get(kind)
+        if fmt is not None:
+            values = struct.unpack_from(f"<{count}{fmt}", view, offset)
+            offset += struct.calcsize(f"<{count}{fmt}")
+            if kind == BinaryCodec.COL_STR_ID8 or kind == BinaryCodec.COL_STR_ID16:
+                return list(map(self.strings.__getitem__, values)), offset
+            return values, offset
+        if kind == BinaryCodec.COL_UUID:
+            digits = view[offset:offset + 16 * count].hex().encode()
+            text = bytearray(b"-" * 36 + b" ") * count  # The digits are copied column by column, in C
+            for digits_start, text_start, size in BinaryCodec._UUID_PARTS:
+                for i in range(size):
+                    text[text_start + i::37] = digits[digits_start + i::32]
+            return text.decode().split(), offset + 16 * count
+        if kind == BinaryCodec.COL_STR:
+            size = BinaryCodec._I.unpack_from(view, offset)[0]
+            offset += 4
+            return str(view[offset:offset + size], "utf-8").split("\0"), offset + size
+        if kind == BinaryCodec.COL_BOOL:
+            return list(map(bool, view[offset:offset + count])), offset + count
+        if kind == BinaryCodec.COL_NONE:
+            return [None] * count, offset
+        if kind == BinaryCodec.COL_LISTS:
+            width = view[offset]
+            offset += 1
+            columns = []
+            for _ in range(width):
+                column, offset = self._decode_column(view, offset, count)
+                columns.append(column)
+            return (list(map(list, zip(*columns))) if width else [[] for _ in range(count)]), offset
+        if kind == BinaryCodec.COL_ANY:
+            return self._decode(view, offset)
+        raise ValueError(f"Unknown column kind: {kind} !")
+
+class CompressedCodec(PacketCodec):
+    """
+    - Wrap a codec, the packets bigger than the threshold are compressed with raw deflate
+    - The compressor is primed with a preset dictionary of the strings found into every packet (events and types
+      names...), then only copied for each packet: a copy is much cheaper than a new primed compressor, and as each
+      packet is compressed alone the same bytes can be broadcast or sent by UDP
+    - Negotiated after the codec with the 'compression_select' packet
+    """
+    NAME = "zlib"
+    MARKER = 0x02
+    WORDS = ["server_sync", "ReverbObject", "contents", "name", "rpc_batch", "rpc_results", "sync_ack"]  # Dictionary
+
+    def __init__(self, codec: PacketCodec, dictionary: bytes = None, threshold=512, level=6, max_size=None):
+        """
+        :param codec: The wrapped codec
+        :param dictionary: The preset dictionary, built from WORDS if None
+        :param threshold: Smaller packets are not compressed
+        :param level: The zlib level
+        :param max_size: The packets that inflate to more bytes are rejected (like a frame bigger than the
+                         max_frame_size of the receiver), None for no limit
+        """
+        self.codec = codec
+        self.dictionary = CompressedCodec.build_dictionary() if dictionary is None else dictionary
+        self.threshold = threshold
+        self.max_size = max_size
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=self.dictionary)
+        self._decompressor = zlib.decompressobj(-15, zdict=self.dictionary)
+        self.compressed = 0  # Number of packets compressed
+        self.saved = 0  # Bytes saved by the compression
+
+    @staticmethod
+    def add_words(*words):
+        """
+        - Add strings to the dictionary of the next CompressedCodec built
+        :param words: The strings often sent
+        """
+        for word in words:
+            if word not in CompressedCodec.WORDS:
+                CompressedCodec.WORDS.append(word)
+
+    @staticmethod
+    def build_dictionary():
+        """
+        - The most frequent strings have to be at the end of the dictionary, they are the nearest of the data
+        :return: The dictionary made of WORDS, as they look like into the JSON and the binary packets
+        """
+        parts = []
+        for word in reversed(CompressedCodec.WORDS):
+            data = word.encode()
+            parts.append(b'"' + data + b'", ')
+            if len(data) < 0x100:
+                parts.append(bytes((BinaryCodec.STR8, len(data))) + data)
+        return b"".join(parts)[-32768:]
+
+    def negotiation_args(self):
+        return [self.dictionary.decode("latin-1"), self.threshold]
+
+    def accepts(self, marker: int):
+        return marker == CompressedCodec.MARKER or self.codec.accepts(marker)
+
+    def encode(self, name: str, contents) -> bytes:
+        payload = self.codec.encode(name, contents)
+        if len(payload) < self.threshold:
+            return payload
+        compressor = self._compressor.copy()
+        compressed = compressor.compress(payload) + compressor.flush()
+        if len(compressed) + 1 >= len(payload):  # Not compressible (already compact, random...)
+            return payload
+        self.compressed += 1
+        self.saved += len(payload) - len(compressed) - 1
+        return bytes((CompressedCodec.MARKER,)) + compressed
+
+    def decode(self, packet: bytes):
+        if packet[0] != CompressedCodec.MARKER:
+            return self.codec.decode(packet)
+        decompressor = self._decompressor.copy()
+        try:  # Never inflate more than max_size, a small packet can inflate to gigabytes
+            payload = decompressor.decompress(bytes(packet[1:]), self.max_size or 0)
+        except zlib.error as e:
+            raise ValueError(f"Invalid compressed packet: {e}")
+        if decompressor.unconsumed_tail or not decompressor.eof:  # Bigger than max_size, or truncated
+            raise ValueError(f"The compressed packet inflates to more than {self.max_size} bytes or is truncated")
+        return self.codec.decode(payload)
+
+
+CODECS = {JsonCodec.NAME: JsonCodec, BinaryCodec.NAME: BinaryCodec}  # All the codecs that can be negotiated
+COMPRESSIONS = {CompressedCodec.NAME: CompressedCodec}  # All the compressions that can be negotiated
@@ -0,0 +1,117 @@
+try:
+    import numpy as np
+except ImportError:  # Optional, only needed by ReverbManager.enable_columns
+    np = None
+
+
+class ColumnStore:
+    def __init__(self, dims=2, capacity=1024, dtype="float64"):
+        """
+        - On 'Server' side, the positions of the ReverbObject into one contiguous array, a dense row per object
+        - The pos of an object is a view of its row, so a crowd can be moved with one vectorized operation on
+          positions[:count] (see rows)
+        - The changed positions are found by comparing the array with its copy made at the last server_sync, so
+          assigning or modifying a pos in place costs no Python bookkeeping
+        - Removing an object moves the last row into its row: don't keep a pos view or a row index across ticks
+        :param dims: The length of the positions
+        :param capacity: The initial number of rows, doubled when full
+        :param dtype: The type of the numbers
+        """
+        if np is None:
+            raise ImportError("NumPy is needed by the ColumnStore: pip install numpy")
+        self.dims = dims
+        self.count = 0
+        self.positions = np.zeros((capacity, dims), dtype)
+        self.objects: list = []  # row -> ReverbObject
+        self.cell_size = None  # The cell size of the SpatialGrid, if the interest management is enabled
+        self._synced = np.zeros((capacity, dims), dtype)  # positions at the last collect
+        self._cells = np.zeros((capacity, 2), np.int64)  # Cells of the grid at the last collect
+
+    def accepts(self, pos):
+        """
+        :return: If the position fits into a row
+        """
+        return isinstance(pos, (list, tuple, np.ndarray)) and len(pos) == self.dims
+
+    def add(self, ro, pos):
+        """
+        :param ro: The ReverbObject, its _slot is set to its row
+        :param pos: Its position
+        """
+        row = self.count
+        if row == len(self.positions):
+            self._grow()
+        self.positions[row] = pos
+        self._synced[row] = self.positions[row]
+        if self.cell_size is not None:
+            self._cells[row] = np.floor(self.positions[row, :2] / self.cell_size)
+        self.objects.append(ro)
+        self.count += 1
+        ro._slot = row
+
+    def remove(self, ro):
+        """
+        - Free the row of a ReverbObject, its pos becomes a list again
+        :param ro: The ReverbObject
+        """
+        row = ro._slot
+        ro._pos = self.positions[row].tolist()
+        ro._slot = None
+        last = self.count - 1
+        if row != last:  # Keep the rows dense
+            for array in (self.positions, self._synced, self._cells):
+                array[row] = array[last]
+            moved = self.objects[row] = self.objects[last]
+            moved._slot = row
+        self.objects.pop()
+        self.count -= 1
+
+    def rows(self):
+        """
+        :return: The view of the positions of all the objects, ordered like objects
+        """
+        return self.positions[:self.count]
+
+    def set_cell_size(self, cell_size):
+        """
+        :param cell_size: The cell size of the SpatialGrid, None if there is no grid
+        """
+        self.cell_size = cell_size
+        if cell_size is not None:
+            self._cells[:self.count] = np.floor(self.positions[:self.count, :2] / cell_size)
+
+    def collect(self):
+        """
+        - Find the positions changed since the last call, with vectorized operations
+        :return: The changed ReverbObject, their positions as lists, and the list of (ReverbObject, cell) of the ones
+                 that changed of cell of the grid
+        """
+        count = self.count
+        positions = self.positions[:count]
+        changed = np.flatnonzero((positions != self._synced[:count]).any(axis=1))
+        if not len(changed):
+            return [], [], []
+        values = positions[changed]
+        self._synced[changed] = values
+        objects = self.objects
+        changed_objects = [objects[row] for row in changed.tolist()]
+        moved = []
+        if self.cell_size is not None:
+            cells = np.floor(values[:, :2] / self.cell_size).astype(np.int64)
+            crossed = (cells != self._cells[changed]).any(axis=1)
+            if crossed.any():
+                rows = changed[crossed]
+                self._cells[rows] = cells[crossed]
+                moved = [(objects[row], tuple(cell)) for row, cell in zip(rows.tolist(), cells[crossed].tolist())]
+        return changed_objects, values.tolist(), moved
+
+    def _grow(self):
+        capacity = len(self.positions) * 2
+        for name in ("positions", "_synced", "_cells"):
+            old = getattr(self, name)
+            new = np.zeros((capacity, old.shape[1]), old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def __len__(self):
+        return self.count
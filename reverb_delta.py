@@ -0,0 +1,233 @@
+import threading
+import zlib
+
+
+class SnapshotRing:
+    def __init__(self, size=32):
+        """
+        - The last snapshots sent to (or received from) a peer, by sequence number
+        - A snapshot is a dict uid -> packed ReverbObject, the packed lists are shared between the snapshots
+          while the object doesn't change, so an unchanged object is found by identity
+        :param size: Max snapshots kept, the oldest are forgotten first
+        """
+        self.size = size
+        self.acked = None  # The last sequence number acked by the peer, its snapshot is the baseline
+        self._snapshots: dict[int, dict] = {}
+        self._lock = threading.Lock()  # The acks come from the listening threads
+
+    def add(self, seq, snapshot):
+        """
+        :param seq: The sequence number of the snapshot
+        :param snapshot: Dict uid -> packed ReverbObject
+        """
+        with self._lock:
+            snapshots = self._snapshots
+            snapshots[seq] = snapshot
+            while len(snapshots) > self.size:
+                del snapshots[next(iter(snapshots))]
+
+    def get(self, seq):
+        """
+        :return: The snapshot or None if it is unknown or forgotten
+        """
+        if seq is None:
+            return None
+        return self._snapshots.get(seq)
+
+    def baseline(self):
+        """
+        :return: The last acked sequence number and its snapshot, (None, None) if there is none
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(self.acked) if self.acked is not None else None
+            return (self.acked, snapshot) if snapshot is not None else (None, None)
+
+    def ack(self, seq):
+        """
+        - The peer has the snapshot seq, the older ones will never be a baseline again
+        :param seq: The sequence number, None if the peer lost its baseline
+        """
+        with self._lock:
+            if seq is None:
+                self.acked = None
+                return
+            if self.acked is not None and seq <= self.acked:
+                return
+            self.acked = seq
+            self._drop_before(seq)
+
+    def drop_before(self, seq):
+        """
+        Forget the snapshots older than seq
+        """
+        with self._lock:
+            self._drop_before(seq)
+
+    def _drop_before(self, seq):
+        snapshots = self._snapshots
+        while snapshots:
+            oldest = next(iter(snapshots))
+            if oldest >= seq:
+                break
+            del snapshots[oldest]
+
+    def __len__(self):
+        return len(self._snapshots)
+
+
+class EncodedSnapshot:
+    def __init__(self, chunks=16):
+        """
+        - A whole snapshot, cut by uid hash into chunks that are kept encoded
+        - Updating it only encodes again the chunks whose ReverbObject changed
+        :param chunks: Number of chunks
+        """
+        self.chunks = chunks
+        self.snapshot: dict = {}  # The snapshot the chunks are made of
+        self._buckets: list[dict] = [{} for _ in range(chunks)]
+        self._encoded: dict[object, list] = {}  # codec -> encoded chunk or None by chunk
+        self._lock = threading.Lock()
+
+    def update(self, snapshot: dict):
+        """
+        :param snapshot: Dict uid -> packed ReverbObject, the packed lists are compared by identity
+        """
+        with self._lock:
+            old = self.snapshot
+            if snapshot is old:
+                return
+            buckets = self._buckets
+            dirty = set()
+            added = 0
+            for uid, pack in snapshot.items():
+                previous = old.get(uid)
+                if previous is not pack:
+                    bucket = zlib.crc32(uid.encode()) % self.chunks
+                    buckets[bucket][uid] = pack
+                    dirty.add(bucket)
+                    if previous is None:
+                        added += 1
+            if len(old) > len(snapshot) - added:  # Some ReverbObject were removed
+                for uid in old:
+                    if uid not in snapshot:
+                        bucket = zlib.crc32(uid.encode()) % self.chunks
+                        del buckets[bucket][uid]
+                        dirty.add(bucket)
+            for encoded in self._encoded.values():
+                for bucket in dirty:
+                    encoded[bucket] = None
+            self.snapshot = snapshot
+
+    def frames(self, codec, encode):
+        """
+        :param codec: The codec of the client
+        :param encode: Function(codec, dict uid -> packed ReverbObject) that encodes a chunk
+        :return: The encoded non-empty chunks
+        """
+        with self._lock:
+            encoded = self._encoded.get(codec)
+            if encoded is None:
+                if len(self._encoded) >= 4:  # Old codecs (the BinaryCodec is replaced when its table grows)
+                    self._encoded.clear()
+                encoded = self._encoded[codec] = [None] * self.chunks
+            frames = []
+            for bucket, ros in enumerate(self._buckets):
+                if ros:
+                    if encoded[bucket] is None:
+                        encoded[bucket] = encode(codec, ros)
+                    frames.append(encoded[bucket])
+            return frames
+
+
+def estimate_size(value):
+    """
+    - Cheap upper estimate of the encoded size of a value, without encoding it
+    :return: A number of bytes
+    """
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, (list, tuple)):
+        return 2 + sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return 2 + sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    return 9  # A number, a bool or None
+
+
+def diff_pack(new: list, old: list):
+    """
+    - Field-level diff of a packed ReverbObject [type, pos, dir, *reverb_args]
+    :return: [mask, *changed values], the bit i of the mask is set if the value i changed,
+             or the new pack if the number of values changed
+    """
+    if len(new) != len(old) or new[0] != old[0]:
+        return new
+    mask = 0
+    diff = [0]
+    for i in range(1, len(new)):
+        value = new[i]
+        if value != old[i]:
+            mask |= 1 << i
+            diff.append(value)
+    diff[0] = mask
+    return diff
+
+
+def apply_pack(old: list, diff: list):
+    """
+    :param old: The packed ReverbObject of the baseline
+    :param diff: A diff made by diff_pack
+    :return: The new packed ReverbObject
+    """
+    if not isinstance(diff[0], int) or isinstance(diff[0], bool):  # A whole pack, it starts with the type name
+        return diff
+    new = list(old)
+    mask = diff[0]
+    values = iter(diff[1:])
+    for i in range(1, len(new)):
+        if mask & (1 << i):
+            new[i] = next(values)
+    return new
+
+
+def diff_snapshot(snapshot: dict, baseline: dict = None):
+    """
+    :param snapshot: The snapshot to send
+    :param baseline: The snapshot acked by the peer, None to send everything
+    :return: Dict uid -> whole pack or diff_pack of the changed objects, and the list of the removed uids
+    """
+    if baseline is None:
+        return dict(snapshot), []
+    ros = {}
+    added = 0
+    for uid, pack in snapshot.items():
+        old = baseline.get(uid)
+        if old is pack:  # Not packed again since the baseline
+            continue
+        if old is None:
+            ros[uid] = pack
+            added += 1
+        elif old != pack:
+            ros[uid] = diff_pack(pack, old)
+    if len(baseline) > len(snapshot) - added:  # Some uids of the baseline are not into the snapshot
+        removed = [uid for uid in baseline if uid not in snapshot]
+    else:
+        removed = []
+    return ros, removed
+
+
+def apply_snapshot(baseline: dict, ros: dict, removed: list):
+    """
+    :param baseline: The snapshot the diff was made against, None if it is a whole snapshot
+    :param ros: Dict uid -> whole pack or diff_pack
+    :param removed: The removed uids
+    :return: The new snapshot
+    """
+    if baseline is None:
+        return dict(ros)
+    snapshot = dict(baseline)
+    for uid in removed:
+        snapshot.pop(uid, None)
+    for uid, diff in ros.items():
+        old = snapshot.get(uid)
+        snapshot[uid] = diff if old is None else apply_pack(old, diff)
+    return snapshot
@@ -20,4 +20,31 @@ class ReverbObjectNotFoundError(Exception):
 
 class ReverbTypeNotFoundError(Exception):
     def __init__(self, t):
-        super().__init__(f"The type={t} is not found into the registry!")
\ No newline at end of file
+        super().__init__(f"The type={t} is not found into the registry!")
+class ReverbFieldTypeError(Exception):
+    def __init__(self, field, value):
+        super().__init__(f"The ReverbField '{field.name}' must be a '{field.type.__name__}', not: {value!r}")
+
+class ReverbRPCNotAllowedError(Exception):
+    def __init__(self, cls, method):
+        super().__init__(f"The method {method!r} of '{cls.__name__}' is not a server_method!")
+
+class ReverbRPCError(Exception):
+    def __init__(self, msg):
+        super().__init__(f"The server_method failed on the server: {msg}")
+
+class ReverbRPCMalformedError(Exception):
+    def __init__(self, call):
+        super().__init__(f"The call {call!r} is not a [uid, method id, request id or None, args]!")
+
+class ReverbRPCTimeoutError(TimeoutError):
+    def __init__(self, request_id):
+        super().__init__(f"No result from the server for the call {request_id=}")
+
+class ReverbFrameTooLargeError(Exception):
+    def __init__(self, size, max_size):
+        super().__init__(f"The frame of {size} bytes is bigger than the max frame size: {max_size} bytes!")
+
+class ReverbSessionLogError(Exception):
+    def __init__(self, path, reason):
+        super().__init__(f"The file {path!r} is not a valid session log: {reason}!")
@@ -0,0 +1,130 @@
+import math
+
+
+class SpatialGrid:
+    def __init__(self, cell_size=100.0):
+        """
+        - Uniform grid over the positions of the ReverbObject
+        - Only the objects that change of cell touch the grid, so moving objects cost O(1)
+        :param cell_size: The size of a cell, about the radius of the areas of interest is a good choice
+        """
+        self.cell_size = cell_size
+        self.cells: dict[tuple[int, int], set[str]] = {}
+        self._cell_of: dict[str, tuple[int, int]] = {}
+
+    def cell(self, pos):
+        """
+        :param pos: A position (x, y, ...)
+        :return: The coordinates of the cell of the position
+        """
+        return math.floor(pos[0] / self.cell_size), math.floor(pos[1] / self.cell_size)
+
+    def update(self, uid: str, pos):
+        """
+        - Add or move an object into the grid
+        :param uid: The uid of the object
+        :param pos: Its new position
+        """
+        self.move(uid, self.cell(pos))
+
+    def move(self, uid: str, cell: tuple[int, int]):
+        """
+        - Like update, with the cell already computed (see ColumnStore.collect)
+        :param uid: The uid of the object
+        :param cell: The coordinates of its new cell
+        """
+        old_cell = self._cell_of.get(uid)
+        if old_cell == cell:
+            return
+        if old_cell is not None:
+            self._discard(uid, old_cell)
+        self._cell_of[uid] = cell
+        self.cells.setdefault(cell, set()).add(uid)
+
+    def remove(self, uid: str):
+        """
+        - Remove an object from the grid
+        :param uid: The uid of the object
+        """
+        cell = self._cell_of.pop(uid, None)
+        if cell is not None:
+            self._discard(uid, cell)
+
+    def _discard(self, uid, cell):
+        uids = self.cells[cell]
+        uids.discard(uid)
+        if not uids:
+            del self.cells[cell]
+
+    def query(self, center, radius):
+        """
+        :param center: The center of the area
+        :param radius: The radius of the area
+        :return: Set of the uids of the objects into the cells touched by the area
+        """
+        min_x, min_y = self.cell((center[0] - radius, center[1] - radius))
+        max_x, max_y = self.cell((center[0] + radius, center[1] + radius))
+        found = set()
+        cells = self.cells
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(cells):  # Huge area, walk the non-empty cells instead
+            for (x, y), uids in cells.items():
+                if min_x <= x <= max_x and min_y <= y <= max_y:
+                    found |= uids
+            return found
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                uids = cells.get((x, y))
+                if uids:
+                    found |= uids
+        return found
+
+    def select(self, snapshot: dict, center, radius):
+        """
+        - Like query, from the positions of a snapshot instead of the grid: it can be called by another thread while
+          the grid is updated, and costs O(snapshot)
+        :param snapshot: Dict uid -> packed ReverbObject, the pos is its second value
+        :param center: The center of the area
+        :param radius: The radius of the area
+        :return: Dict uid -> packed ReverbObject of the objects into the cells touched by the area
+        """
+        min_x, min_y = self.cell((center[0] - radius, center[1] - radius))
+        max_x, max_y = self.cell((center[0] + radius, center[1] + radius))
+        cell = self.cell
+        selected = {}
+        for uid, pack in snapshot.items():
+            x, y = cell(pack[1])
+            if min_x <= x <= max_x and min_y <= y <= max_y:
+                selected[uid] = pack
+        return selected
+
+    def __contains__(self, uid):
+        return uid in self._cell_of
+
+    def __len__(self):
+        return len(self._cell_of)
+
+
+class AreaOfInterest:
+    def __init__(self, radius, center=(0, 0), focus=None):
+        """
+        - The part of the world a client receives
+        :param radius: The radius of the area
+        :param center: A fixed center
+        :param focus: A ReverbObject followed by the area (like the player of the client), replaces the center,
+                      or its uid when the ReverbObject are into worker processes
+        """
+        self.radius = radius
+        self.center = center
+        self.focus = focus
+
+    def get_center(self, world=None):
+        """
+        :param world: Dict uid -> packed ReverbObject, to find a focus given by uid
+        :return: The current center of the area
+        """
+        if isinstance(self.focus, str):
+            pack = world.get(self.focus) if world is not None else None
+            return pack[1] if pack is not None else self.center
+        if self.focus is not None:
+            return self.focus.pos
+        return self.center
@@ -0,0 +1,116 @@
+import time
+from collections import deque
+
+
+class SnapshotBuffer:
+    def __init__(self, size=32):
+        """
+        - The last states (pos and dir) received for a ReverbObject, timestamped with the server time of their snapshot
+        :param size: Max states kept
+        """
+        self._states = deque(maxlen=size)  # (server time, pos, dir)
+
+    def add(self, server_time, pos, dir, previous_time=None):
+        """
+        :param server_time: The server time of the snapshot
+        :param pos: The position
+        :param dir: The direction
+        :param previous_time: The server time of the previous snapshot, if the object wasn't into it, it didn't move
+                              until then
+        """
+        states = self._states
+        if states:
+            last = states[-1]
+            if server_time <= last[0]:  # Late
+                return
+            if previous_time is not None and last[0] < previous_time < server_time:
+                states.append((previous_time, last[1], last[2]))
+        states.append((server_time, pos, dir))
+
+    def sample(self, render_time, max_extrapolation, latest_time=None):
+        """
+        :param render_time: The server time to render
+        :param max_extrapolation: Max time in seconds the movement is continued after the last state
+        :param latest_time: The server time of the last snapshot received, if it is after the last state the object
+                            is not moving anymore
+        :return: The pos and the dir at render_time, None if there is no state
+        """
+        states = self._states
+        if not states:
+            return None
+        while len(states) > 2 and states[1][0] <= render_time:  # Keep one state before render_time
+            states.popleft()
+        first = states[0]
+        if render_time <= first[0] or len(states) == 1:
+            return first[1], first[2]
+        second = states[1]
+        if render_time <= second[0]:  # Interpolation
+            return lerp(first[1], second[1], (render_time - first[0]) / (second[0] - first[0])), first[2]
+        if latest_time is not None and second[0] < latest_time:  # Stopped
+            return second[1], second[2]
+        extra = min(render_time - second[0], max_extrapolation)  # Extrapolation, the packets are late
+        return lerp(first[1], second[1], 1 + extra / (second[0] - first[0])), second[2]
+
+    def __len__(self):
+        return len(self._states)
+
+
+def lerp(a, b, t):
+    """
+    :return: The value between a and b at t (0 -> a, 1 -> b, more -> after b), b if they are not numbers
+    """
+    try:
+        if isinstance(a, (list, tuple)):
+            return type(b)(x + (y - x) * t for x, y in zip(a, b))
+        return a + (b - a) * t
+    except TypeError:
+        return b
+
+
+class Interpolation:
+    def __init__(self, delay=0.1, max_extrapolation=0.25, size=32, adaptive=False):
+        """
+        - Render the ReverbObject in the past, between two snapshots, instead of jumping at each snapshot
+        - The server time is estimated from the snapshots, the fastest snapshot sets it
+        :param delay: How far in the past the ReverbObject are rendered in seconds, about 2 sync periods plus the jitter
+        :param max_extrapolation: Max time in seconds a movement is continued when the snapshots are late
+        :param size: Max states kept per ReverbObject
+        :param adaptive: Add the jitter measured by the heartbeats of the server to delay (see on_rtt)
+        """
+        self.base_delay = delay
+        self.delay = delay
+        self.adaptive = adaptive
+        self.max_extrapolation = max_extrapolation
+        self.size = size
+        self.latest_time = None  # Server time of the last snapshot
+        self.previous_time = None  # Server time of the snapshot before
+        self._offset = None  # Server time - local time
+
+    def on_snapshot(self, server_time):
+        """
+        - Called when a snapshot is received
+        :param server_time: Its server time
+        """
+        offset = server_time - time.monotonic()
+        if self._offset is None or offset > self._offset:
+            self._offset = offset
+        else:  # Slowly follow a slower network or a drifting clock
+            self._offset += (offset - self._offset) * 0.05
+        self.previous_time, self.latest_time = self.latest_time, server_time
+
+    def on_rtt(self, rtt, rtt_var):
+        """
+        - Called when the server measured the round trip time again
+        :param rtt: The smoothed round trip time in seconds
+        :param rtt_var: Its variation in seconds
+        """
+        if self.adaptive:  # The snapshots come late by up to about twice the variation
+            self.delay = self.base_delay + 2 * rtt_var
+
+    def render_time(self):
+        """
+        :return: The server time to render now
+        """
+        if self._offset is None:
+            return None
+        return time.monotonic() + self._offset - self.delay
@@ -0,0 +1,50 @@
+import logging
+import sys
+
+from colorama import Fore, Back, Style
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+
+class ReverbFormatter(logging.Formatter):
+    TAGS = {  # logger name -> tag, background of the tag
+        "reverb.client": ("CLIENT", Back.BLUE),
+        "reverb.server": ("SERVER", Back.GREEN),
+        "reverb.manager": ("REVERB_MANAGER", Back.YELLOW),
+    }
+
+    def format(self, record):
+        """
+        - The colored tag of the side, then the level if it is not INFO, then the message
+        """
+        tag, back = ReverbFormatter.TAGS.get(record.name, (record.name.upper(), Back.WHITE))
+        level = "" if record.levelno == INFO else f"{record.levelname}: "
+        text = f"{back + Fore.RED}[{Fore.RESET}{tag}{Fore.RED}]{Style.RESET_ALL} {level}{record.getMessage()}"
+        if record.exc_info:
+            text += "\n" + self.formatException(record.exc_info)
+        return text
+
+
+reverb_logger = logging.getLogger("reverb")
+client_logger = reverb_logger.getChild("client")
+server_logger = reverb_logger.getChild("server")
+manager_logger = reverb_logger.getChild("manager")
+
+if not reverb_logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(ReverbFormatter())
+    reverb_logger.addHandler(_handler)
+    reverb_logger.setLevel(INFO)
+    reverb_logger.propagate = False
+
+
+def set_log_level(level, side: str = None):
+    """
+    - The messages under the level are neither formatted nor printed
+    :param level: DEBUG, INFO, WARNING, ERROR or a logging level
+    :param side: 'client', 'server' or 'manager' to only change this side, all of them if None
+    """
+    (reverb_logger if side is None else reverb_logger.getChild(side)).setLevel(level)
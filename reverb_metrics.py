@@ -0,0 +1,241 @@
+import bisect
+import threading
+import time
+
+from reverb_log import *
+
+
+class Histogram:
+    BOUNDS = tuple(1e-6 * 2 ** i for i in range(25))  # Upper bounds of the buckets in seconds, 1 us to 16 s
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        """
+        - Distribution of durations into fixed power of two buckets, observing is O(log buckets) and never allocates
+        """
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.buckets = [0] * (len(Histogram.BOUNDS) + 1)
+
+    def observe(self, value):
+        """
+        :param value: A duration in seconds
+        """
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.buckets[bisect.bisect_left(Histogram.BOUNDS, value)] += 1
+
+    def percentile(self, p):
+        """
+        :param p: Between 0 and 1
+        :return: The upper bound of the bucket of the percentile, in seconds
+        """
+        if not self.count:
+            return 0.0
+        rank = p * self.count
+        seen = 0
+        for i, size in enumerate(self.buckets):
+            seen += size
+            if seen >= rank:
+                return min(Histogram.BOUNDS[i], self.max) if i < len(Histogram.BOUNDS) else self.max
+        return self.max
+
+    def report(self):
+        """
+        :return: Dict of the stats, the durations are in milliseconds
+        """
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count * 1000,
+            "min_ms": self.min * 1000,
+            "p50_ms": self.percentile(0.5) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class Metrics:
+    """
+    - This class is static !
+    - Counters, histograms and gauges of the networking and sync layers, read with snapshot (pull) or dumped
+      periodically with start_dump
+    - Each metric has labels (an event name, a client address...), None when it has none
+    - Set ENABLED to False to make every call return at once
+    """
+    ENABLED = True
+    _COUNTERS: dict[str, dict] = {}  # name -> label -> value
+    _HISTOGRAMS: dict[str, dict] = {}  # name -> label -> Histogram
+    _GAUGES: dict[str, object] = {}  # name -> value, or function called by snapshot
+    _LOCK = threading.Lock()
+    _DUMP_STOP: threading.Event = None
+
+    @staticmethod
+    def count(name, label=None, value=1):
+        """
+        :param name: The name of the counter
+        :param label: The label, like an event name
+        :param value: Added to the counter
+        """
+        if not Metrics.ENABLED:
+            return
+        with Metrics._LOCK:
+            counters = Metrics._COUNTERS.get(name)
+            if counters is None:
+                counters = Metrics._COUNTERS[name] = {}
+            counters[label] = counters.get(label, 0) + value
+
+    @staticmethod
+    def count_packet(direction: str, packet_name, size, addr=None):
+        """
+        - Count a packet by event name and by client, with one lock
+        :param direction: 'in' or 'out'
+        :param packet_name: The name of the packet/event
+        :param size: Its size in bytes
+        :param addr: The address of the client, None on 'Client' side
+        """
+        if not Metrics.ENABLED:
+            return
+        counters = Metrics._COUNTERS
+        with Metrics._LOCK:
+            for name, label, value in ((f"packets_{direction}", packet_name, 1), (f"bytes_{direction}", packet_name, size),
+                                       (f"client_packets_{direction}", addr, 1), (f"client_bytes_{direction}", addr, size)):
+                if label is None and name.startswith("client_"):
+                    continue
+                labels = counters.get(name)
+                if labels is None:
+                    labels = counters[name] = {}
+                labels[label] = labels.get(label, 0) + value
+
+    @staticmethod
+    def observe(name, seconds, label=None):
+        """
+        :param name: The name of the histogram
+        :param seconds: The duration
+        :param label: The label, like an event name
+        """
+        if not Metrics.ENABLED:
+            return
+        with Metrics._LOCK:
+            histograms = Metrics._HISTOGRAMS.get(name)
+            if histograms is None:
+                histograms = Metrics._HISTOGRAMS[name] = {}
+            histogram = histograms.get(label)
+            if histogram is None:
+                histogram = histograms[label] = Histogram()
+            histogram.observe(seconds)
+
+    @staticmethod
+    def clock():
+        """
+        :return: The start of a duration to observe, None if the metrics are disabled
+        """
+        return time.perf_counter() if Metrics.ENABLED else None
+
+    @staticmethod
+    def observe_since(name, start, label=None):
+        """
+        :param start: Returned by clock, nothing is observed if it is None
+        """
+        if start is not None:
+            Metrics.observe(name, time.perf_counter() - start, label)
+
+    @staticmethod
+    def set_gauge(name, value):
+        """
+        :param name: The name of the gauge
+        :param value: Its value, or a function without args returning it, called only by snapshot
+        """
+        Metrics._GAUGES[name] = value
+
+    @staticmethod
+    def remove_gauge(name):
+        Metrics._GAUGES.pop(name, None)
+
+    @staticmethod
+    def forget(label):
+        """
+        - Remove a label from all the metrics, like the address of a disconnected client
+        """
+        with Metrics._LOCK:
+            for metrics in (*Metrics._COUNTERS.values(), *Metrics._HISTOGRAMS.values()):
+                metrics.pop(label, None)
+
+    @staticmethod
+    def reset():
+        """
+        Clear the counters and the histograms, the gauges are kept
+        """
+        with Metrics._LOCK:
+            Metrics._COUNTERS = {}
+            Metrics._HISTOGRAMS = {}
+
+    @staticmethod
+    def snapshot():
+        """
+        :return: Dict {"counters": {name: {label: value}}, "histograms": {name: {label: stats}},
+                 "gauges": {name: value}}, the durations are in milliseconds
+        """
+        with Metrics._LOCK:
+            counters = {name: dict(labels) for name, labels in Metrics._COUNTERS.items()}
+            histograms = {name: {label: histogram.report() for label, histogram in labels.items()}
+                          for name, labels in Metrics._HISTOGRAMS.items()}
+        gauges = {}
+        for name, value in list(Metrics._GAUGES.items()):
+            if callable(value):
+                try:
+                    value = value()
+                except Exception as e:  # Like a server stopped meanwhile
+                    value = repr(e)
+            gauges[name] = value
+        return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+    @staticmethod
+    def format(snapshot: dict = None):
+        """
+        :param snapshot: Made by snapshot, a new one if None
+        :return: The snapshot as readable lines
+        """
+        snapshot = Metrics.snapshot() if snapshot is None else snapshot
+        lines = [f"{name} = {value}" for name, value in sorted(snapshot["gauges"].items())]
+        for name, labels in sorted(snapshot["counters"].items()):
+            lines.append(f"{name}: " + ", ".join(f"{label}={value}" for label, value in labels.items()))
+        for name, labels in sorted(snapshot["histograms"].items()):
+            for label, stats in labels.items():
+                stats = " ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                                 for key, value in stats.items())
+                lines.append(f"{name}[{label}]: {stats}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def start_dump(interval=10.0, output=None):
+        """
+        - Dump the metrics every interval seconds from a daemon thread
+        :param interval: Seconds between two dumps
+        :param output: Function called with each snapshot, they are logged at INFO level if None
+        """
+        Metrics.stop_dump()
+        stop = Metrics._DUMP_STOP = threading.Event()
+
+        def dump():
+            while not stop.wait(interval):
+                snapshot = Metrics.snapshot()
+                if output is not None:
+                    output(snapshot)
+                elif reverb_logger.isEnabledFor(INFO):
+                    reverb_logger.info("Metrics:\n%s", Metrics.format(snapshot))
+
+        threading.Thread(target=dump, daemon=True).start()
+
+    @staticmethod
+    def stop_dump():
+        if Metrics._DUMP_STOP is not None:
+            Metrics._DUMP_STOP.set()
+            Metrics._DUMP_STOP = None
@@ -0,0 +1,322 @@
+import mmap
+import queue
+import selectors
+import socket
+import struct
+import threading
+import time
+
+from reverb_errors import *
+from reverb_metrics import *
+
+
+class RecordKind:
+    OPEN = 0  # A client connected, the data is its address
+    CLOSE = 1  # The client disconnected
+    IN = 2  # A frame received from the client
+    OUT = 3  # A frame queued for the client
+    DATAGRAM = 4  # A packet sent on the UDP channel of the client
+
+
+class SessionLog:
+    MAGIC = b"RVRB\x01"  # Magic and version of the format
+    HEADER = struct.Struct("!d")  # Wall clock time of the start of the recording
+    RECORD = struct.Struct("!dBII")  # Seconds since the start, RecordKind, connection id, size of the data
+
+    def __init__(self, path):
+        """
+        - Read a log written by a SessionRecorder through a memory map, nothing is copied
+        - The records are (time, kind, connection id, data), data is a memoryview of the payload of a frame (without
+          its length prefix), valid until close
+        :param path: The path of the log
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            self._file.close()
+            raise ReverbSessionLogError(path, "empty file")
+        if self._map[:len(SessionLog.MAGIC)] != SessionLog.MAGIC:
+            self.close()
+            raise ReverbSessionLogError(path, "not a session log")
+        self.started, = SessionLog.HEADER.unpack_from(self._map, len(SessionLog.MAGIC))
+        self._start = len(SessionLog.MAGIC) + SessionLog.HEADER.size
+
+    def __iter__(self):
+        data = memoryview(self._map)
+        size = len(self._map)
+        offset = self._start
+        record = SessionLog.RECORD
+        while offset + record.size <= size:
+            t, kind, connection, length = record.unpack_from(self._map, offset)
+            offset += record.size
+            if offset + length > size:  # Truncated by a crash while writing, the rest is lost
+                break
+            yield t, kind, connection, data[offset:offset + length]
+            offset += length
+
+    def connections(self):
+        """
+        :return: Dict connection id -> address of the client (as 'host:port')
+        """
+        return {connection: bytes(data).decode() for _, kind, connection, data in self if kind == RecordKind.OPEN}
+
+    def duration(self):
+        """
+        :return: Seconds between the start of the recording and the last record
+        """
+        last = 0.0
+        for t, *_ in self:
+            last = t
+        return last
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SessionRecorder:
+    def __init__(self, path, max_pending=65536, flush_interval=1.0):
+        """
+        - On 'Server' side, append the frames received and sent by the server to a binary log, see Server.start_recording
+        - record only queues a reference to the frame, a daemon thread writes them, so the network threads never
+          wait for the disk
+        - Each connection gets an id, a reconnection from the same address gets a new one
+        :param path: The path of the log, overwritten
+        :param max_pending: Records waiting for the writer from which the new ones are dropped (and counted)
+        :param flush_interval: Max seconds the written records stay into the file buffer
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.dropped = 0  # Records lost because the writer was late
+        self.recorded = 0  # Records written
+        self._queue = queue.Queue(max_pending)
+        self._file = open(path, "wb")
+        self._start = time.monotonic()
+        self._file.write(SessionLog.MAGIC + SessionLog.HEADER.pack(time.time()))
+        self._thread = threading.Thread(target=self._write_records, daemon=True)
+        self._thread.start()
+
+    def record(self, kind, addr, data=b"", skip=0):
+        """
+        - Can be called from any thread, never block
+        :param kind: The RecordKind
+        :param addr: The address of the client
+        :param data: The frame, it must not be modified after
+        :param skip: Bytes at the start of data that are not recorded, like the length prefix of a frame
+        """
+        try:
+            self._queue.put_nowait((time.monotonic(), kind, addr, data, skip))
+        except queue.Full:
+            self.dropped += 1
+            Metrics.count("records_dropped", kind)
+
+    def stop(self, timeout=5.0):
+        """
+        Write the waiting records and close the log
+        :param timeout: Max time to wait for the writer
+        """
+        self._queue.put((None, None, None, None, None))  # Blocking, the writer is the one that empties the queue
+        self._thread.join(timeout)
+
+    def _write_records(self):
+        """Thread that writes the records into the log"""
+        ids = {}  # addr -> connection id
+        next_id = 0
+        pack = SessionLog.RECORD.pack
+        write = self._file.write
+        start = self._start
+        flushed = time.monotonic()
+        try:
+            while True:
+                try:
+                    t, kind, addr, data, skip = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    t = None
+                    kind = -1
+                if kind is None:  # Stopped
+                    break
+                if kind != -1:
+                    connection = ids.get(addr)
+                    if connection is None:  # Including the clients connected before the start of the recording
+                        connection = ids[addr] = next_id
+                        next_id += 1
+                        if kind != RecordKind.OPEN:
+                            name = self.address_name(addr).encode()
+                            write(pack(t - start, RecordKind.OPEN, connection, len(name)))
+                            write(name)
+                    if kind == RecordKind.OPEN:
+                        data = self.address_name(addr).encode()
+                    elif kind == RecordKind.CLOSE:
+                        del ids[addr]
+                    if skip:
+                        data = memoryview(data)[skip:]
+                    write(pack(t - start, kind, connection, len(data)))
+                    write(data)
+                    self.recorded += 1
+                now = time.monotonic()
+                if now - flushed >= self.flush_interval:
+                    self._file.flush()
+                    flushed = now
+        finally:
+            self._file.close()
+
+    @staticmethod
+    def address_name(addr):
+        """
+        :return: The address as 'host:port'
+        """
+        return ":".join(map(str, addr)) if isinstance(addr, tuple) else str(addr)
+
+
+class SessionReplay:
+    def __init__(self, log, speed=1.0):
+        """
+        - Play a log of a SessionRecorder again, with the recorded timing
+        - to_server sends the frames received by the recorded server to a local one, one socket per recorded
+          connection, like real clients
+        - to_clients gives the frames sent by the recorded server to simulated clients, like a real server
+        :param log: A SessionLog or its path
+        :param speed: Time multiplier, 2.0 replays twice faster, None replays as fast as possible
+        """
+        self.log = log if isinstance(log, SessionLog) else SessionLog(log)
+        self.speed = speed
+
+    def _schedule(self, kinds):
+        """
+        - Wait for the time of each record
+        :param kinds: The RecordKind to yield
+        :return: Generator of (lag in seconds, kind, connection id, data)
+        """
+        start = time.monotonic()
+        speed = self.speed
+        for t, kind, connection, data in self.log:
+            if kind not in kinds:
+                continue
+            lag = 0.0
+            if speed:
+                due = start + t / speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    lag = -delay
+            yield lag, kind, connection, data
+
+    def to_server(self, host="127.0.0.1", port=8080, linger=1.0):
+        """
+        - Replay the inbound traffic of the log against a server, its answers are read and dropped
+        - The frames are sent as they were recorded: the server needs the codecs, the registered types and the
+          ReverbObject uids of the recorded one (like the same saved world) for the packets to mean the same
+        :param host: The host of the server
+        :param port: The port of the server
+        :param linger: Seconds to keep reading the answers of the server at the end
+        :return: Dict of the stats: connections, frames, bytes, seconds, max_lag_ms
+        """
+        sockets: dict[int, socket.socket] = {}
+        selector = selectors.DefaultSelector()
+        lock = threading.Lock()  # Protect the selector
+        done = threading.Event()
+
+        def drain():
+            while not done.is_set():
+                with lock:  # Never wait under the lock, the sender registers the new connections
+                    events = selector.select(0) if selector.get_map() else ()
+                if not events:
+                    time.sleep(0.005)
+                for key, _ in events:
+                    try:
+                        if key.fileobj.recv(65536):
+                            continue
+                    except OSError:
+                        pass
+                    with lock:  # Closed by the server
+                        selector.unregister(key.fileobj)
+
+        def forget(sock):
+            with lock:
+                try:
+                    selector.unregister(sock)
+                except KeyError:  # Already closed by the server
+                    pass
+            sock.close()
+
+        reader = threading.Thread(target=drain, daemon=True)
+        reader.start()
+        header = struct.Struct("!I")
+        frames = sent = 0
+        max_lag = 0.0
+        start = time.monotonic()
+        try:
+            for lag, kind, connection, data in self._schedule((RecordKind.OPEN, RecordKind.CLOSE, RecordKind.IN)):
+                max_lag = max(max_lag, lag)
+                if kind == RecordKind.OPEN:
+                    sock = sockets[connection] = socket.create_connection((host, port))
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    with lock:
+                        selector.register(sock, selectors.EVENT_READ)
+                    continue
+                sock = sockets.get(connection)
+                if sock is None:  # Closed by the server meanwhile
+                    continue
+                if kind == RecordKind.CLOSE:
+                    forget(sockets.pop(connection))
+                    continue
+                try:
+                    sock.sendall(header.pack(len(data)) + data)
+                except OSError:
+                    forget(sockets.pop(connection))
+                    continue
+                frames += 1
+                sent += len(data) + header.size
+            elapsed = time.monotonic() - start
+            time.sleep(linger)
+        finally:
+            done.set()
+            reader.join()
+            for sock in sockets.values():
+                sock.close()
+            selector.close()
+        return {"connections": len(self.log.connections()), "frames": frames, "bytes": sent, "seconds": elapsed,
+                "max_lag_ms": max_lag * 1000}
+
+    def to_clients(self, factory=None):
+        """
+        - Replay the outbound traffic of the log into simulated clients, their events are triggered like if the
+          frames came from a server
+        :param factory: Function (connection id, address) -> object with the _handle_frame of a Client, a Client that is
+                        not connected if None
+        :return: Dict of the stats: connections, frames, bytes, seconds, max_lag_ms
+        """
+        if factory is None:
+            from reverb_base import Client
+            factory = lambda connection, addr: Client()
+        clients = {}
+        frames = received = 0
+        max_lag = 0.0
+        start = time.monotonic()
+        for lag, kind, connection, data in self._schedule((RecordKind.OPEN, RecordKind.CLOSE, RecordKind.OUT,
+                                                           RecordKind.DATAGRAM)):
+            max_lag = max(max_lag, lag)
+            if kind == RecordKind.OPEN:
+                clients[connection] = factory(connection, bytes(data).decode())
+                continue
+            if kind == RecordKind.CLOSE:
+                clients.pop(connection, None)
+                continue
+            client = clients.get(connection)
+            if client is None:
+                continue
+            frames += 1
+            received += len(data)
+            if not client._handle_frame(bytes(data)):  # server_stop
+                del clients[connection]
+        return {"connections": len(self.log.connections()), "frames": frames, "bytes": received,
+                "seconds": time.monotonic() - start, "max_lag_ms": max_lag * 1000}
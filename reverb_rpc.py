@@ -0,0 +1,154 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from reverb_errors import *
+from reverb_log import *
+
+
+def server_method(func):
+    """
+    - Decorator of the ReverbObject methods that the clients can call with compute_server
+    - The other methods can't be called by a client
+    """
+    func.reverb_server_method = True
+    return func
+
+
+def build_rpc_table(cls):
+    """
+    - The methods are numbered by name, so the client and the server give them the same ids
+    :param cls: A ReverbObject class
+    :return: Dict method name -> id and tuple of the functions by id
+    """
+    names = sorted(name for name in dir(cls) if getattr(getattr(cls, name, None), "reverb_server_method", False))
+    return {name: i for i, name in enumerate(names)}, tuple(getattr(cls, name) for name in names)
+
+
+class RpcBatcher:
+    def __init__(self, send, flush_interval=1 / 60, timeout=5.0):
+        """
+        - On 'Client' side, gather the compute_server calls and send them in one packet
+        - The calls that want a result get a Future, resolved by the 'rpc_results' packet of the server
+        - A daemon thread sends the batches and fails the futures whose timeout is over, even with no flush_interval
+        :param send: Function that sends a list of calls to the server
+        :param flush_interval: The calls are sent this time after the first one in seconds, None to only send them
+                               with flush (once per frame)
+        :param timeout: Default time to wait for a result in seconds
+        """
+        self.send = send
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self._calls = []  # [uid, method id, request id or None, args]
+        self._pending: dict[int, tuple[Future, float]] = {}  # request id -> future, deadline
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread = None
+
+    def call(self, uid, method_id, args, result=False, timeout=None):
+        """
+        :param uid: The uid of the ReverbObject
+        :param method_id: The id of the method into the rpc table of its class
+        :param args: The args of the method
+        :param result: If a Future of the result is wanted
+        :param timeout: Time to wait for the result in seconds, the default timeout if None
+        :return: The Future if result else None
+        """
+        future = None
+        with self._lock:
+            request_id = None
+            if result:
+                request_id = self._next_id
+                self._next_id += 1
+                future = Future()
+                self._pending[request_id] = (future, time.monotonic() + (self.timeout if timeout is None else timeout))
+            self._calls.append([uid, method_id, request_id, list(args)])
+        if self.flush_interval is not None or result:  # The thread sends the batch or waits for the new deadline
+            self._start()
+            self._wakeup.set()
+        return future
+
+    def flush(self):
+        """
+        - Send the waiting calls in one packet
+        - If the sending fails, the futures of the calls fail with the error, that is raised
+        """
+        with self._lock:
+            calls, self._calls = self._calls, []
+        if not calls:
+            return
+        try:
+            self.send(calls)
+        except Exception as e:
+            with self._lock:
+                entries = [self._pending.pop(call[2], None) for call in calls if call[2] is not None]
+            for entry in entries:
+                if entry is not None and not entry[0].cancelled():
+                    entry[0].set_exception(e)
+            raise
+
+    def resolve(self, results):
+        """
+        :param results: List of [request id, ok, result or error message]
+        """
+        for request_id, ok, value in results:
+            with self._lock:
+                entry = self._pending.pop(request_id, None)
+            if entry is None or entry[0].cancelled():  # Timed out
+                continue
+            if ok:
+                entry[0].set_result(value)
+            else:
+                entry[0].set_exception(ReverbRPCError(value))
+
+    def expire(self):
+        """
+        Fail the futures of the calls waiting for too long
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [request_id for request_id, (_, deadline) in self._pending.items() if deadline <= now]
+            futures = [self._pending.pop(request_id)[0] for request_id in expired]
+        for request_id, future in zip(expired, futures):
+            if not future.cancelled():
+                future.set_exception(ReverbRPCTimeoutError(request_id))
+
+    def cancel_all(self):
+        """
+        Fail all the waiting futures, when the connection is lost
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._calls = []
+        for future, _ in pending.values():
+            if not future.cancelled():
+                future.set_exception(ConnectionError("The connection to the server was lost"))
+
+    def pending_count(self):
+        """
+        :return: The number of calls waiting for their result
+        """
+        return len(self._pending)
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                deadlines = [deadline for _, deadline in self._pending.values()]
+            timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            if self._wakeup.wait(timeout):
+                self._wakeup.clear()
+                if self.flush_interval is not None:
+                    time.sleep(self.flush_interval)  # Let the other calls of the frame join the batch
+                    try:
+                        self.flush()
+                    except Exception:  # Already given to the futures, the next batches may succeed
+                        reverb_logger.exception("The compute_server calls couldn't be sent:")
+            self.expire()
@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import deque
+
+from reverb_log import *
+
+
+class TickStats:
+    def __init__(self, budget, window=256):
+        """
+        - Durations of the last ticks of a loop
+        :param budget: The time a tick is allowed to take (its period) in seconds
+        :param window: The number of ticks kept to compute the stats
+        """
+        self.budget = budget
+        self.ticks = 0
+        self.overruns = 0  # Ticks longer than the budget
+        self.skipped = 0  # Ticks skipped because the loop was too late to catch up
+        self._durations = deque(maxlen=window)
+
+    def add(self, duration):
+        """
+        :param duration: The duration of a tick in seconds
+        """
+        self.ticks += 1
+        self._durations.append(duration)
+        if duration > self.budget:
+            self.overruns += 1
+
+    def report(self):
+        """
+        :return: Dict of the stats, the durations are in milliseconds
+        """
+        durations = sorted(self._durations)
+        if not durations:
+            return {"ticks": 0, "overruns": 0, "skipped": self.skipped, "budget_ms": self.budget * 1000}
+        return {
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "budget_ms": self.budget * 1000,
+            "avg_ms": sum(durations) / len(durations) * 1000,
+            "p99_ms": durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1000,
+            "max_ms": durations[-1] * 1000,
+            "load": sum(durations) / len(durations) / self.budget,  # Part of the budget used
+        }
+
+
+class TickScheduler:
+    def __init__(self, on_simulate=None, on_sync=None, sim_rate=60, sync_rate=20, max_catch_up=5):
+        """
+        - Fixed timestep loop with an independent sync rate
+        - The ticks are scheduled on a monotonic clock against absolute deadlines, so sleeping imprecision doesn't drift
+        - After a slow tick the missed simulation steps are run, max_catch_up at most, the older ones are skipped
+        :param on_simulate: Called with the fixed dt (in seconds) sim_rate times per second
+        :param on_sync: Called sync_rate times per second, never twice in a row to catch up
+        :param sim_rate: Simulation ticks per second, 0 to disable
+        :param sync_rate: Syncs per second, 0 to disable
+        :param max_catch_up: Max simulation steps run in a row when the loop is late
+        """
+        self.on_simulate = on_simulate
+        self.on_sync = on_sync
+        self.sim_dt = 1 / sim_rate if sim_rate else None
+        self.sync_dt = 1 / sync_rate if sync_rate else None
+        self.max_catch_up = max_catch_up
+        self.sim_stats = TickStats(self.sim_dt or 0)
+        self.sync_stats = TickStats(self.sync_dt or 0)
+        self.is_running = False
+        self._thread: threading.Thread = None
+
+    def start(self):
+        """
+        Start the loop into a daemon thread
+        """
+        if self.is_running:
+            return
+        self.is_running = True
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the loop, after the current tick
+        """
+        self.is_running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def run(self):
+        """
+        The loop, call start to run it into a thread
+        """
+        self.is_running = True
+        clock = time.perf_counter
+        next_sim = next_sync = clock()
+        sim_dt, sync_dt = self.sim_dt, self.sync_dt
+        while self.is_running:
+            now = clock()
+            if sim_dt is not None:
+                steps = 0
+                while now >= next_sim and steps < self.max_catch_up:
+                    self._tick(self.on_simulate, self.sim_stats, sim_dt)
+                    next_sim += sim_dt
+                    steps += 1
+                    now = clock()
+                if now >= next_sim:  # Too late, skip the steps that can't be caught up
+                    late = int((now - next_sim) / sim_dt) + 1
+                    self.sim_stats.skipped += late
+                    next_sim += late * sim_dt
+
+            if sync_dt is not None and now >= next_sync:
+                self._tick(self.on_sync, self.sync_stats)
+                next_sync += sync_dt
+                now = clock()
+                if now >= next_sync:  # Don't send a burst of syncs to catch up, the next one has the latest state
+                    late = int((now - next_sync) / sync_dt) + 1
+                    self.sync_stats.skipped += late
+                    next_sync += late * sync_dt
+
+            deadlines = [deadline for deadline, dt in ((next_sim, sim_dt), (next_sync, sync_dt)) if dt is not None]
+            if not deadlines:
+                break
+            delay = min(deadlines) - clock()
+            if delay > 0:
+                time.sleep(delay)
+
+    @staticmethod
+    def _tick(callback, stats: TickStats, *args):
+        start = time.perf_counter()
+        try:
+            if callback is not None:
+                callback(*args)
+        except Exception:
+            reverb_logger.exception("An error occurred during a tick:")
+        stats.add(time.perf_counter() - start)
+
+    def report(self):
+        """
+        :return: The stats of the simulation and of the sync ticks
+        """
+        return {"simulation": self.sim_stats.report(), "sync": self.sync_stats.report()}
@@ -0,0 +1,151 @@
+import math
+import threading
+import time
+
+from reverb_log import *
+
+
+class Timer:
+    __slots__ = ("expires", "callback", "args", "_slot")
+
+    def __init__(self, expires, callback, args):
+        """
+        - A callback scheduled into a TimerWheel, cancel it with TimerWheel.cancel
+        :param expires: The tick of the wheel when it is called
+        """
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self._slot: set = None  # The slot of the wheel holding the timer, None once called or cancelled
+
+    def is_active(self):
+        return self._slot is not None
+
+
+class TimerWheel:
+    def __init__(self, tick=0.1, bits=6, levels=4):
+        """
+        - Hierarchical timing wheel: scheduling and cancelling a timer are O(1) whatever the number of timers, so
+          every connection can have its own timers
+        - Each level has 2 ** bits slots, a slot of a level covers a whole turn of the level below: a timer is put
+          into the level of its delay, and moved down (cascaded) when the lower level turns up to its slot
+        - The delays are rounded up to the tick, the timers beyond the last level wait into an overflow slot
+        - The callbacks are called by the thread of start, or by advance
+        :param tick: The resolution of the wheel in seconds
+        :param bits: log2 of the slots per level
+        :param levels: Number of levels, 4 levels of 64 slots of 0.1s cover about 19 days
+        """
+        self.tick = tick
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self._levels = [[set() for _ in range(1 << bits)] for _ in range(levels)]
+        self._overflow = set()
+        self._now = 0  # The current tick
+        self._count = 0
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop: threading.Event = None
+
+    def schedule(self, delay, callback, *args):
+        """
+        - Can be called from any thread, and from a callback
+        :param delay: Seconds before the call, at least one tick
+        :param callback: The function
+        :param args: Its args
+        :return: The Timer
+        """
+        with self._lock:
+            timer = Timer(self._now + max(1, math.ceil(delay / self.tick)), callback, args)
+            self._place(timer)
+            self._count += 1
+        return timer
+
+    def cancel(self, timer: Timer):
+        """
+        - Nothing happens if the timer is already called or cancelled
+        """
+        with self._lock:
+            slot = timer._slot
+            if slot is not None:
+                slot.discard(timer)
+                timer._slot = None
+                self._count -= 1
+
+    def _place(self, timer: Timer):
+        """
+        - Must be called with the _lock held
+        """
+        delta = timer.expires - self._now
+        bits = self.bits
+        for level, slots in enumerate(self._levels):
+            if delta < 1 << (bits * (level + 1)):
+                slot = slots[(timer.expires >> (bits * level)) & self.mask]
+                break
+        else:
+            slot = self._overflow
+        slot.add(timer)
+        timer._slot = slot
+
+    def advance(self, now=None):
+        """
+        - Call the timers expired until now
+        :param now: The time.monotonic() to advance to, the current one if None
+        """
+        target = int(((time.monotonic() if now is None else now) - self._start) / self.tick)
+        while True:
+            with self._lock:
+                if self._now >= target:
+                    return
+                self._now += 1
+                tick = self._now
+                mask = self.mask
+                level = 0
+                while (tick >> (self.bits * level)) & mask == 0:  # The level turned up, cascade the next one
+                    level += 1
+                    if level == len(self._levels):
+                        self._cascade(self._overflow)
+                        break
+                    self._cascade(self._levels[level][(tick >> (self.bits * level)) & mask])
+                slot = self._levels[0][tick & mask]
+                expired = list(slot)
+                slot.clear()
+                for timer in expired:
+                    timer._slot = None
+                self._count -= len(expired)
+            for timer in expired:  # Without the lock, a callback can schedule again
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    reverb_logger.exception("An error occurred in the timer %s:", timer.callback)
+
+    def _cascade(self, slot: set):
+        """
+        - Move the timers of a slot of an upper level into the lower levels, must be called with the _lock held
+        """
+        timers = list(slot)
+        slot.clear()
+        for timer in timers:
+            self._place(timer)
+
+    def start(self):
+        """
+        - Advance the wheel into a daemon thread
+        :return: self
+        """
+        self.stop()
+        stop = self._stop = threading.Event()
+
+        def run():
+            while not stop.wait(self.tick):
+                self.advance()
+
+        threading.Thread(target=run, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def __len__(self):
+        return self._count
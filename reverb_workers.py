@@ -0,0 +1,223 @@
+import multiprocessing
+import zlib
+
+from reverb import *
+
+
+class WorkerPool:
+    def __init__(self, count=None, setup=None, context=None):
+        """
+        - On 'Server' side, run the ReverbObject into worker processes instead of the server process
+        - Each worker owns the ReverbObject whose uid hash falls into its partition: it runs their on_tick, their
+          server_method and packs them, in parallel with the other workers
+        - The server process keeps the sockets, routes the calls and merges the packed partitions into the server_sync
+        - The ReverbObject are created with spawn, the server process has no ReverbObject instance
+        - Start it before the server, the workers are forked from the server process by default
+        :param count: Number of worker processes, the number of cores if None
+        :param setup: Function called at the start of each worker, like an import of the ReverbObject classes when
+                      the processes are not forked
+        :param context: The multiprocessing context or start method name, the default one if None
+        """
+        self.count = count or os.cpu_count() or 1
+        self.setup = setup
+        self.context = multiprocessing.get_context(context) if context is None or isinstance(context, str) else context
+        self._processes = []
+        self._pipes = []
+        self._locks = []  # One request at a time per worker
+        self._world: dict[str, list] = {}
+
+    def start(self):
+        """
+        - Start the workers, the next ReverbObject must be created with spawn
+        :return: self
+        """
+        for index in range(self.count):
+            parent, child = self.context.Pipe()
+            process = self.context.Process(target=_worker_main, args=(child, self.setup), daemon=True)
+            process.start()
+            child.close()
+            self._processes.append(process)
+            self._pipes.append(parent)
+            self._locks.append(threading.Lock())
+        ReverbManager.WORKERS = self
+        return self
+
+    def stop(self):
+        """
+        Stop the workers, their ReverbObject are lost
+        """
+        if ReverbManager.WORKERS is self:
+            ReverbManager.WORKERS = None
+        for pipe, lock in zip(self._pipes, self._locks):
+            with lock:
+                try:
+                    pipe.send(("stop",))
+                except OSError:
+                    pass
+        for process in self._processes:
+            process.join(1)
+        self._processes, self._pipes, self._locks = [], [], []
+
+    def partition(self, uid: str):
+        """
+        :return: The index of the worker that owns the uid
+        """
+        return zlib.crc32(uid.encode()) % self.count
+
+    def spawn(self, cls, *args):
+        """
+        - Create a ReverbObject into its worker, it is sent at the next server_sync
+        :param cls: The ReverbObject class
+        :param args: Args of its constructor
+        :return: Its uid
+        """
+        return self.spawn_many(cls, [args])[0]
+
+    def spawn_many(self, cls, args_list):
+        """
+        - Create many ReverbObject with one request per worker
+        :param cls: The ReverbObject class
+        :param args_list: List of the args of each constructor
+        :return: Their uids
+        """
+        uids = [str(uuid.uuid4()) for _ in args_list]
+        requests = {}
+        for uid, args in zip(uids, args_list):
+            requests.setdefault(self.partition(uid), []).append((uid, args))
+        self._request({index: ("spawn", cls.__name__, part) for index, part in requests.items()})
+        return uids
+
+    def despawn(self, *uids: str):
+        """
+        - Remove ReverbObject from their workers and, at the next server_sync, from the clients
+        :param uids: The uids
+        """
+        requests = {}
+        for uid in uids:
+            requests.setdefault(self.partition(uid), []).append(uid)
+        self._request({index: ("despawn", part) for index, part in requests.items()})
+
+    def call(self, calls):
+        """
+        - Run server_method calls into the workers of their ReverbObject
+        :param calls: List of [uid, method id, request id or None, args]
+        :return: List of [request id, ok, result or error message] of the calls with a request id
+        """
+        requests = {}
+        for call in calls:
+            requests.setdefault(self.partition(call[0]), []).append(call)
+        results = []
+        for part_results in self._request({index: ("call", part) for index, part in requests.items()}).values():
+            results.extend(part_results)
+        return results
+
+    def tick(self, dt):
+        """
+        - Run on_tick of all the ReverbObject, each worker simulates its partition in parallel
+        :param dt: The duration of the tick in seconds
+        """
+        self._request({index: ("tick", dt) for index in range(self.count)})
+
+    def collect(self):
+        """
+        - Get the ReverbObject packed by the workers since the last call
+        :return: The merged dict uid -> packed ReverbObject (the same dict if nothing changed), the positions of the
+                 changed ReverbObject and the removed uids
+        """
+        changes = {}
+        removed = []
+        for part_changes, part_removed in self._request({index: ("pack",) for index in range(self.count)}).values():
+            changes.update(part_changes)
+            removed.extend(part_removed)
+        if changes or removed:
+            world = self._world = dict(self._world)
+            world.update(changes)
+            for uid in removed:
+                world.pop(uid, None)
+        return self._world, {uid: pack[1] for uid, pack in changes.items()}, removed
+
+    def _request(self, requests: dict[int, tuple]):
+        """
+        - Send the requests to their workers then wait for all the answers, so the workers run in parallel
+        - The locks are taken by index order, the requests of many threads can't deadlock
+        :param requests: Dict worker index -> request
+        :return: Dict worker index -> answer
+        """
+        indexes = sorted(requests)
+        locks = [self._locks[index] for index in indexes]
+        for lock in locks:
+            lock.acquire()
+        try:
+            for index in indexes:
+                self._pipes[index].send(requests[index])
+            answers = {}
+            for index in indexes:
+                ok, answer = self._pipes[index].recv()
+                if not ok:
+                    raise RuntimeError(f"The worker {index} failed:\n{answer}")
+                answers[index] = answer
+            return answers
+        finally:
+            for lock in locks:
+                lock.release()
+
+
+def _worker_main(pipe, setup):
+    """
+    - The loop of a worker process, its ReverbManager holds its partition
+    """
+    ReverbManager.REVERB_SIDE = ReverbSide.SERVER
+    ReverbManager.WORKERS = None
+    ReverbManager.REVERB_CONNECTION = None
+    ReverbManager.REVERB_OBJECTS.clear()
+    ReverbManager.TYPE_INDEX.clear()
+    ReverbManager.DIRTY_OBJECTS.clear()
+    ReverbManager._SNAPSHOT = None
+    ReverbManager.INTEREST = None
+    ReverbManager.COLUMNS = None
+    ReverbManager.TICKER = None
+    if setup is not None:
+        setup()
+    reported = {}  # The objects_snapshot of the last pack, to find the removed ReverbObject
+
+    while True:
+        try:
+            request = pipe.recv()
+        except EOFError:
+            break
+        action = request[0]
+        if action == "stop":
+            break
+        try:
+            answer = None
+            if action == "spawn":
+                cls = ReverbManager.get_cls_by_type_name(request[1])
+                for uid, args in request[2]:
+                    with ReverbManager._LOCK:  # The uid chosen by the main process
+                        factory = ReverbManager.UID_FACTORY
+                        ReverbManager.UID_FACTORY = ReverbManager.preassigned_uid(uid)
+                        try:
+                            cls(*args)
+                        finally:
+                            ReverbManager.UID_FACTORY = factory
+            elif action == "despawn":
+                ReverbManager.despawn(*(uid for uid in request[1] if uid in ReverbManager.REVERB_OBJECTS))
+            elif action == "call":
+                answer = ReverbManager.run_server_methods(request[1])
+            elif action == "tick":
+                ReverbManager.simulate(request[1])
+            elif action == "pack":
+                dirty = ReverbManager._take_dirty()
+                objects = ReverbManager.objects_snapshot()
+                changes = {}
+                for ro in dirty:
+                    if objects.get(ro.uid) is ro:
+                        changes[ro.uid] = ro.pack()
+                removed = []
+                if objects is not reported:
+                    removed = [uid for uid in reported if uid not in objects]
+                    reported = objects
+                answer = (changes, removed)
+            pipe.send((True, answer))
+        except Exception:
+            pipe.send((False, traceback.format_exc()))
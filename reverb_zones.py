@@ -0,0 +1,454 @@
+import itertools
+import math
+from multiprocessing.connection import AuthenticationError, Client as LinkClient, Listener
+
+from reverb import *
+
+
+class Zone:
+    def __init__(self, zone_id, rect, host="127.0.0.1", port=8080, link_port=9080):
+        """
+        - A part of the world owned by one server process
+        :param zone_id: The id of the zone
+        :param rect: (min x, min y, max x, max y), the max are excluded, use math.inf for the open sides
+        :param host: The host of the server of the zone, for the clients and the other servers
+        :param port: The port of the server for the clients
+        :param link_port: The port of the link between the servers
+        """
+        self.zone_id = zone_id
+        self.rect = rect
+        self.host = host
+        self.port = port
+        self.link_port = link_port
+
+    def contains(self, pos):
+        min_x, min_y, max_x, max_y = self.rect
+        return min_x <= pos[0] < max_x and min_y <= pos[1] < max_y
+
+    def distance(self, pos):
+        """
+        :return: The distance between the position and the zone, 0 if it is into the zone
+        """
+        min_x, min_y, max_x, max_y = self.rect
+        dx = max(min_x - pos[0], 0.0, pos[0] - max_x)
+        dy = max(min_y - pos[1], 0.0, pos[1] - max_y)
+        return math.hypot(dx, dy)
+
+    def __repr__(self):
+        return f"Zone({self.zone_id!r}, {self.rect}, {self.host}:{self.port})"
+
+
+class ZoneMap:
+    def __init__(self, zones, margin=50.0):
+        """
+        - The split of the world between the server processes, the same on every server
+        - The ReverbObject closer than margin to a neighbor zone are mirrored into it
+        :param zones: The Zone, they must not overlap
+        :param margin: The width of the mirrored band along the borders, about the radius of the areas of interest
+        """
+        self.zones = {zone.zone_id: zone for zone in zones}
+        self.margin = margin
+
+    @staticmethod
+    def strips(count, width, origin=0.0, host="127.0.0.1", port=8080, link_port=9080, margin=50.0):
+        """
+        - Split the world into count vertical strips of width, the first and the last ones are open
+        - The zone i uses the ports port + i and link_port + i
+        :return: The ZoneMap
+        """
+        zones = []
+        for i in range(count):
+            min_x = origin + i * width if i else -math.inf
+            max_x = origin + (i + 1) * width if i < count - 1 else math.inf
+            zones.append(Zone(i, (min_x, -math.inf, max_x, math.inf), host, port + i, link_port + i))
+        return ZoneMap(zones, margin)
+
+    def zone_of(self, pos):
+        """
+        :return: The Zone that contains the position, None if there is none
+        """
+        for zone in self.zones.values():
+            if zone.contains(pos):
+                return zone
+        return None
+
+    def neighbors(self, zone: Zone):
+        """
+        :return: The other Zone that can receive mirrors from zone
+        """
+        min_x, min_y, max_x, max_y = zone.rect
+        margin = self.margin
+        return [other for other in self.zones.values() if other is not zone and
+                other.rect[0] <= max_x + margin and min_x - margin <= other.rect[2] and
+                other.rect[1] <= max_y + margin and min_y - margin <= other.rect[3]]
+
+
+class ZoneNode:
+    def __init__(self, zone_map: ZoneMap, zone_id, authkey: bytes, mirror_rate=20):
+        """
+        - On 'Server' side, the part of a zone-sharded world owned by this server process
+        - Each server simulates and syncs the ReverbObject into its zone, like a normal server
+        - A ReverbObject that leaves the zone is handed off (uid, type, packed state) to the server of its new zone,
+          only its synced state moves: keep the rest of the state of your ReverbObject into the reverb_args
+        - The ReverbObject near a border are mirrored read-only into the neighbor zones, so their clients see across
+          the border: the mirrors are not simulated, the compute_server calls to them are run by their owner
+        - A client bound to a ReverbObject (bind_client, like its player) is redirected to the server of the new zone
+          of the object, with the handler of 'zone_redirect'
+        - The servers are linked by authenticated multiprocessing connections, each server dials all the others
+        - Not compatible with a WorkerPool
+        :param zone_map: The ZoneMap, the same on all the servers
+        :param zone_id: The id of the zone of this server
+        :param authkey: The secret shared by the servers of the world
+        :param mirror_rate: Updates of the mirrors per second
+        """
+        self.map = zone_map
+        self.zone: Zone = zone_map.zones[zone_id]
+        self.authkey = authkey
+        self.mirror_period = 1 / mirror_rate
+        self.neighbors = zone_map.neighbors(self.zone)
+        self.mirrors: dict[str, object] = {}  # uid -> id of the zone that owns the mirrored ReverbObject
+        self.bindings: dict[str, object] = {}  # uid of a ReverbObject -> addr of the client bound to it
+        self.is_online = False
+        self._listener: Listener = None
+        self._links: dict[object, object] = {}  # zone id -> connection to send to the server of the zone
+        self._link_locks: dict[object, threading.Lock] = {}
+        self._inbox = deque()  # (zone id, message) received, applied by update on the tick thread
+        self._sent: dict[object, dict] = {}  # zone id -> uid -> pack of the mirrors the zone has
+        self._next_mirror = 0.0
+        self._tickets = itertools.count()
+        self._calls: dict[int, object] = {}  # ticket -> addr of the client of forwarded calls
+        min_x, min_y, max_x, max_y = self.zone.rect
+        margin = zone_map.margin
+        self._inner = (min_x + margin, min_y + margin, max_x - margin, max_y - margin)  # Not mirrored into
+
+    @staticmethod
+    def print_zone(msg, *args, level=INFO):
+        """
+        - Log a message with the ReverbManager style
+        :param msg: The message, formatted with args (%-style) only if the level is enabled
+        :param level: The logging level
+        """
+        manager_logger.log(level, "[zone] " + msg, *args)
+
+    def start(self):
+        """
+        - Listen to the other servers and dial them, the ReverbObject are then handed off and mirrored at each tick
+          of ReverbManager.simulate
+        :return: self
+        """
+        self._listener = Listener(("", self.zone.link_port), authkey=self.authkey)
+        self.is_online = True
+        ReverbManager.ZONE = self
+        threading.Thread(target=self._accept_links, daemon=True).start()
+        threading.Thread(target=self._dial_links, daemon=True).start()
+        ZoneNode.print_zone("Zone %s online, link on port %s", self.zone.zone_id, self.zone.link_port)
+        return self
+
+    def stop(self):
+        """
+        Close the links, the mirrors stay until the ReverbManager is cleared
+        """
+        self.is_online = False
+        if ReverbManager.ZONE is self:
+            ReverbManager.ZONE = None
+        if self._listener is not None:
+            self._listener.close()
+        for link in list(self._links.values()):
+            link.close()
+        self._links.clear()
+
+    def bind_client(self, clt: socket.socket, ro, radius=None):
+        """
+        - The client follows the ReverbObject (like its player): it is redirected when the object changes of zone
+        :param clt: The client socket
+        :param ro: The ReverbObject or its uid
+        :param radius: The radius of the area of interest of the client around the object, None to keep the current
+                       one (only with ReverbManager.enable_interest)
+        """
+        uid = ro if isinstance(ro, str) else ro.uid
+        self.bindings[uid] = clt.getpeername()
+        if radius is not None and ReverbManager.INTEREST is not None:
+            ReverbManager.set_client_interest(clt, radius, focus=uid)
+
+    def route_calls(self, clt: socket.socket, calls):
+        """
+        - Forward the server_method calls to the mirrors to the servers that own them
+        :param clt: The client socket
+        :param calls: List of [uid, method id, request id or None, args]
+        :return: The calls to run on this server
+        """
+        mirrors = self.mirrors
+        if not mirrors:
+            return calls
+        local = []
+        forwarded = {}
+        for call in calls:
+            owner = mirrors.get(call[0])
+            if owner is None:
+                local.append(call)
+            else:
+                forwarded.setdefault(owner, []).append(call)
+        addr = clt.getpeername()
+        for owner, part in forwarded.items():
+            ticket = next(self._tickets)
+            self._calls[ticket] = addr
+            if not self._send(owner, ("call", ticket, part)):
+                del self._calls[ticket]
+                errors = [[call[2], False, f"The zone {owner} is unreachable"] for call in part if call[2] is not None]
+                if errors:
+                    ReverbManager.REVERB_CONNECTION.send_to(clt, "rpc_results", errors)
+        return local
+
+    def update(self, dt):
+        """
+        - Called by ReverbManager.simulate at each tick
+        - Apply the messages of the other servers, hand off the ReverbObject out of the zone, update the mirrors
+        :param dt: The duration of the tick in seconds
+        """
+        inbox = self._inbox
+        while inbox:
+            zone_id, message = inbox.popleft()
+            self._apply(zone_id, message)
+        self._hand_off()
+        now = time.monotonic()
+        if now >= self._next_mirror:
+            self._next_mirror = now + self.mirror_period
+            self._update_mirrors()
+            clients = ReverbManager.REVERB_CONNECTION.clients
+            for uid in [uid for uid, addr in self.bindings.items() if addr not in clients]:  # Disconnected
+                del self.bindings[uid]
+
+    def _hand_off(self):
+        """
+        - Give the ReverbObject out of the zone to the server of their new zone, they stay here as mirrors
+        """
+        zone = self.zone
+        mirrors = self.mirrors
+        for uid, ro in ReverbManager.objects_snapshot().items():
+            if uid in mirrors:
+                continue
+            pos = ro.pos
+            if zone.contains(pos):
+                continue
+            target = self.map.zone_of(pos)
+            if target is None or not self._send(target.zone_id, ("handoff", uid, ro.pack())):
+                continue  # Still simulated here until the zone is reachable
+            mirrors[uid] = target.zone_id  # The new owner updates it, or removes it when it is far from the border
+            self._sent.get(target.zone_id, {}).pop(uid, None)
+            Metrics.count("zone_handoffs", target.zone_id)
+            addr = self.bindings.pop(uid, None)
+            if addr is not None:
+                self._redirect(addr, uid, target)
+
+    def _redirect(self, addr, uid, target: Zone):
+        connection = ReverbManager.REVERB_CONNECTION
+        clt = connection.clients.get(addr)
+        if clt is None:
+            return
+        area = ReverbManager.CLIENT_INTERESTS.get(addr)
+        connection.send_to(clt, "zone_redirect", target.host, target.port, uid, area.radius if area is not None else None)
+        ZoneNode.print_zone("The client %s follows %s to the zone %s", addr, uid, target.zone_id, level=DEBUG)
+
+    def _update_mirrors(self):
+        """
+        - Send to each neighbor the changes of the owned ReverbObject near its border
+        """
+        min_x, min_y, max_x, max_y = self._inner
+        margin = self.map.margin
+        mirrors = self.mirrors
+        wanted = {zone_id: {} for zone_id in self._sent}  # Including a far zone that got a hand-off
+        wanted.update((zone.zone_id, {}) for zone in self.neighbors)
+        for uid, ro in ReverbManager.objects_snapshot().items():
+            pos = ro.pos
+            if (min_x <= pos[0] < max_x and min_y <= pos[1] < max_y) or uid in mirrors:
+                continue
+            for zone in self.neighbors:
+                if zone.distance(pos) <= margin:
+                    wanted[zone.zone_id][uid] = ro.pack()
+        for zone_id, packs in wanted.items():
+            if zone_id not in self._links:
+                continue
+            sent = self._sent.get(zone_id, {})
+            changes = {uid: pack for uid, pack in packs.items() if sent.get(uid) is not pack}
+            removed = [uid for uid in sent if uid not in packs]
+            if (changes or removed) and not self._send(zone_id, ("mirror", changes, removed)):
+                continue
+            self._sent[zone_id] = packs
+
+    def _apply(self, zone_id, message):
+        """
+        - Apply a message of the server of the zone zone_id, on the tick thread
+        """
+        action = message[0]
+        mirrors = self.mirrors
+        if action == "handoff":
+            _, uid, pack = message
+            if mirrors.pop(uid, None) is None and uid in ReverbManager.REVERB_OBJECTS:
+                ZoneNode.print_zone("The ReverbObject %s is already owned by the zone %s", uid, self.zone.zone_id,
+                                    level=WARNING)
+                return
+            self._set_state(uid, pack)
+            self._sent.setdefault(zone_id, {})[uid] = None  # The old owner keeps a mirror, updated or removed
+        elif action == "mirror":
+            _, changes, removed = message
+            for uid, pack in changes.items():
+                owner = mirrors.get(uid)
+                if owner is None and uid in ReverbManager.REVERB_OBJECTS:
+                    continue  # Owned here, the message crossed a hand-off
+                mirrors[uid] = zone_id
+                self._set_state(uid, pack)
+            for uid in removed:
+                if mirrors.get(uid) == zone_id:
+                    self._remove_mirror(uid)
+        elif action == "call":
+            _, ticket, calls = message
+            self._send(zone_id, ("results", ticket, ReverbManager.run_server_methods(calls)))
+        elif action == "results":
+            _, ticket, results = message
+            addr = self._calls.pop(ticket, None)
+            connection = ReverbManager.REVERB_CONNECTION
+            clt = connection.clients.get(addr)
+            if clt is not None and results:
+                connection.send_to(clt, "rpc_results", results)
+        elif action == "lost":  # The mirrors of the zone can't be updated anymore
+            for uid in [uid for uid, owner in mirrors.items() if owner == zone_id]:
+                self._remove_mirror(uid)
+
+    def _remove_mirror(self, uid):
+        del self.mirrors[uid]
+        try:
+            ReverbManager.remove_reverb_object(uid)
+        except ReverbObjectNotFoundError:
+            pass
+
+    @staticmethod
+    def _set_state(uid, pack):
+        """
+        - Create the ReverbObject with its uid, or give it the packed state
+        """
+        pos = list(pack[1])
+        ro = ReverbManager.REVERB_OBJECTS.get(uid)
+        if ro is None:
+            cls = ReverbManager.get_cls_by_type_name(pack[0])
+            with ReverbManager._LOCK:  # The uid is the one of the other server, like into the worker processes
+                factory = ReverbManager.UID_FACTORY
+                ReverbManager.UID_FACTORY = ReverbManager.preassigned_uid(uid)
+                try:
+                    ro = cls(pos, *pack[2:])
+                    if ro.uid is None:  # Its class doesn't add it on init
+                        ReverbManager.add_new_reverb_object(ro)
+                finally:
+                    ReverbManager.UID_FACTORY = factory
+            return
+        ro.pos = pos
+        if ro.dir != pack[2]:
+            ro.dir = pack[2]
+        if tuple(ro.reverb_args) != tuple(pack[3:]):
+            ro.reverb_args = tuple(pack[3:])
+
+    def _send(self, zone_id, message):
+        """
+        :return: False if the zone is not reachable
+        """
+        link = self._links.get(zone_id)
+        if link is None:
+            return False
+        try:
+            with self._link_locks[zone_id]:
+                link.send(message)
+        except (OSError, EOFError):
+            self._links.pop(zone_id, None)
+            link.close()
+            return False
+        Metrics.count("zone_messages_out", message[0])
+        return True
+
+    def _accept_links(self):
+        """Thread that accepts the links of the other servers"""
+        while self.is_online:
+            try:
+                link = self._listener.accept()
+            except AuthenticationError:
+                ZoneNode.print_zone("A link with a wrong authkey has been refused !", level=WARNING)
+                continue
+            except OSError:  # Closed
+                break
+            threading.Thread(target=self._receive_link, args=(link,), daemon=True).start()
+
+    def _receive_link(self, link):
+        """Thread that queues the messages of another server for update"""
+        zone_id = None
+        try:
+            hello = link.recv()
+            if hello[0] != "hello" or hello[1] not in self.map.zones:
+                return
+            zone_id = hello[1]
+            while self.is_online:
+                self._inbox.append((zone_id, link.recv()))
+        except (OSError, EOFError):
+            pass
+        finally:
+            link.close()
+            if zone_id is not None:
+                self._inbox.append((zone_id, ("lost",)))
+
+    def _dial_links(self):
+        """Thread that connects to the other servers, again when a link is lost"""
+        while self.is_online:
+            for zone in self.map.zones.values():
+                if zone is self.zone or zone.zone_id in self._links:
+                    continue
+                try:
+                    link = LinkClient((zone.host, zone.link_port), authkey=self.authkey)
+                    link.send(("hello", self.zone.zone_id))
+                except (OSError, EOFError, AuthenticationError):
+                    continue  # Not started yet
+                self._link_locks.setdefault(zone.zone_id, threading.Lock())
+                self._sent[zone.zone_id] = {}  # Its mirrors are sent again
+                self._links[zone.zone_id] = link
+                ZoneNode.print_zone("Linked to the zone %s", zone.zone_id)
+            time.sleep(0.5)
+
+
+@server_event_registry.on_event("zone_bind", mode=DispatchMode.ORDERED)
+def on_zone_bind(clt: socket.socket, uid: str, radius=None, *args):
+    """
+    - Called on the 'Server' side
+    - A redirected client arrived with its ReverbObject
+    :param clt: The client socket
+    :param uid: The uid of its ReverbObject
+    :param radius: The radius of its area of interest, None if it had none
+    """
+    if ReverbManager.ZONE is not None:
+        ReverbManager.ZONE.bind_client(clt, uid, radius)
+
+
+@client_event_registry.on_event("zone_redirect", mode=DispatchMode.ORDERED)
+def on_zone_redirect(clt: socket.socket, host: str, port: int, uid: str, radius=None, *args):
+    """
+    - Called on the 'Client' side
+    - The ReverbObject of the client moved to another zone: connect to its server, the ReverbObject already known
+      are kept and synced by the join snapshot of the new server
+    :param clt: The client socket
+    :param host: The host of the server of the new zone
+    :param port: Its port
+    :param uid: The uid of the ReverbObject followed by the client
+    :param radius: The radius of the area of interest of the client
+    """
+    old = ReverbManager.REVERB_CONNECTION
+    threading.Thread(target=_switch_server, args=(old, host, port, uid, radius), daemon=True).start()
+
+
+def _switch_server(old, host, port, uid, radius):
+    """
+    - Out of the dispatch thread of the old connection, which is closed
+    """
+    new = type(old)(host, port, old.buffer_size, old.codecs, old.udp_enabled, old.compressions, old.idle_timeout)
+    old.disconnect()
+    ReverbManager._RECEIVED = SnapshotRing(ReverbManager.SNAPSHOT_HISTORY)  # The seqs of the new server are others
+    ReverbManager._RECEIVED_SEQ = None
+    ReverbManager._JOINING = None
+    ReverbManager.REVERB_CONNECTION = new
+    new.connect()
+    new.send("zone_bind", uid, radius)
+    Client.print_client("Redirected to the zone server %s:%s", host, port)